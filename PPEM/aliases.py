@@ -0,0 +1,291 @@
+import numpy as np
+import pandas as pd
+from PPEM.light_curves import light_curve_collection, band_name, ARRAYS
+from PPEM.period_estimation import prepare_bands
+from PPEM.fold_quality import (alias_factors, fold_statistics, time_spans, phase_drift,
+                               classify_periods, score_names)
+
+SIDEREAL_DAY = 0.99726957
+
+RELATIONS = ['top', 'harmonic', 'sidereal', 'window', 'independent']
+
+
+def candidate_array(periods_df, method, fids=(1, 2)):
+    """
+    Returns the candidate periods of a method kept by the estimation
+    with shape (n_objects, n_bands, n_candidates), the best one first,
+    and whether they come from a multi band estimation, in which case
+    every band has the same candidates. See 'method_columns'
+
+    Parameters
+    ---------
+    periods_df: pandas DataFrame
+        Estimations with the '<method>_T<rank>_<band>' columns, or the
+        '<method>_T<rank>' columns on multi band
+
+    method: string
+        Method whose candidates are returned
+
+    fids: int python tuple
+        Band identifiers, in order
+    """
+    names = [band_name(band_fid) for band_fid in fids]
+    multiband = f'{method}_T' in periods_df
+
+    def column(rank, name):
+        label = '' if rank == 1 else str(rank)
+        return f'{method}_T{label}' if multiband else f'{method}_T{label}_{name}'
+
+    n_cands = 1
+    while column(n_cands + 1, names[0]) in periods_df:
+        n_cands += 1
+    ranks = range(1, n_cands + 1)
+    if multiband:
+        candidates = periods_df[[column(rank, None) for rank in ranks]].to_numpy(dtype=float)
+        return np.repeat(candidates[:, None, :], len(fids), axis=1), True
+    candidates = np.stack([periods_df[[column(rank, name) for rank in ranks]].to_numpy(dtype=float)
+                           for name in names], axis=1)
+    return candidates, False
+
+
+def alias_relations(candidates, time_span, max_harmonic=3, n_sidereal=2, max_drift=1.0):
+    """
+    Relates every candidate period with the best one of its periodogram,
+    for all the objects and bands at once. Returns the codes of
+    'RELATIONS' and the factor of the relation, both with the shape of
+    the candidates:
+
+        top: the best candidate itself, factor 1
+        harmonic: the period is factor times the best one, with the
+            factors of 'fold_quality.alias_factors'
+        sidereal: the frequency is factor cycles per sidereal day
+            apart from the best one, the aliases of nightly sampling
+        window: the frequency is factor cycles per sidereal day, a peak
+            of the sampling itself. It overrides the other relations
+        independent: none of the above
+
+    Two frequencies are related when their folds drift less than
+    max_drift cycles apart along the time span, see
+    'fold_quality.phase_drift'
+
+    Parameters
+    ---------
+    candidates: float numpy array
+        Candidate periods with the best one first on the last axis,
+        see 'candidate_array'
+
+    time_span: float numpy array
+        Time span of the detections, broadcastable to the candidates
+
+    max_harmonic: positive integer
+        Largest numerator and denominator of the harmonic factors
+
+    n_sidereal: positive integer
+        Largest number of cycles per sidereal day of the sidereal and
+        window relations
+
+    max_drift: float
+        Maximum drift in cycles of related frequencies
+    """
+    candidates = np.asarray(candidates, dtype=float)
+    best = candidates[..., :1]
+    codes = np.full(candidates.shape, RELATIONS.index('independent'), dtype=np.int8)
+    factors = np.full(candidates.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frequencies = 1 / candidates
+        separation = np.abs(frequencies - 1 / best)
+        for cycles in range(n_sidereal, 0, -1):
+            sidereal = time_span * np.abs(separation - cycles / SIDEREAL_DAY) <= max_drift
+            codes[sidereal] = RELATIONS.index('sidereal')
+            factors[sidereal] = cycles
+        for factor in alias_factors(max_harmonic)[::-1]:
+            harmonic = phase_drift(candidates, best, time_span, factor) <= max_drift
+            codes[harmonic] = RELATIONS.index('harmonic')
+            factors[harmonic] = factor
+        codes[..., 0] = RELATIONS.index('top')
+        factors[..., 0] = 1.0
+        for cycles in range(n_sidereal, 0, -1):
+            window = time_span * np.abs(frequencies - cycles / SIDEREAL_DAY) <= max_drift
+            codes[window] = RELATIONS.index('window')
+            factors[window] = cycles
+    return codes, factors
+
+
+def sample_collection(collection, n_samples=None):
+    """
+    Returns a collection with the detections of each band of every
+    object sampled as 'period_estimation.prepare_bands' does, the same
+    detections an estimation with n_samples used. Without n_samples the
+    collection is returned as is
+
+    Parameters
+    ---------
+    collection: light_curve_collection
+        Detections of the objects
+
+    n_samples: positive integer
+        Number of samples per band used by the estimation
+    """
+    if n_samples is None or len(collection) == 0:
+        return collection
+    bands = [prepare_bands(collection[oid], n_samples, collection.fids)
+             for oid in collection.oids]
+    sizes = np.array([[len(mjd) for mjd, _, _ in obj] for obj in bands], dtype=np.int64)
+    n_bands = len(collection.fids)
+    starts = np.concatenate([[0], np.cumsum(sizes.ravel())])
+    offsets = starts[np.arange(len(bands))[:, None] * n_bands + np.arange(n_bands + 1)]
+    arrays = [np.concatenate([band[i] for obj in bands for band in obj]) for i in range(3)]
+    fid = np.repeat(np.tile(collection.fids, len(bands)), sizes.ravel())
+    return light_curve_collection(collection.oids, offsets,
+                                  *[array.astype(ARRAYS[name]) for array, name
+                                    in zip(arrays, ['mjd', 'mag', 'err'])],
+                                  fid.astype(ARRAYS['fid']), collection.fids)
+
+
+def rank_candidates(objs, periods_df, methods, max_harmonic=3, n_sidereal=2, max_drift=1.0,
+                    min_cycles=2.0, margin=0.9, n_bins=10, half=False, n_samples=None):
+    """
+    Ranks the candidate periods kept by an estimation with 'n_candidates'
+    again, without computing any other periodogram. All the candidates
+    of every object, band and method are folded in one vectorized pass,
+    see 'fold_quality.fold_statistics', and ordered by the dispersion
+    of their folds (theta). The best peak of the periodogram keeps its
+    place unless another candidate folds clearly better, its theta is
+    multiplied by margin. Candidates at a sampling window frequency or
+    covering less than min_cycles cycles along the time span, like a
+    82.7 d period on a few weeks of detections, are ranked last. The
+    relation of each candidate with the best peak is given by
+    'alias_relations'.
+
+    Returns a long DataFrame with one row per object, method, band and
+    candidate with the columns oid, method, band, peak (rank in the
+    periodogram), rank (new rank), period, theta, cycles, relation,
+    factor and valid, sorted by the new rank. Multi band estimations
+    are ranked once over all the bands, with band 'all'. If the
+    estimations have the catalog 'period', each candidate is also
+    scored against it in 'score', see 'fold_quality.classify_periods'.
+    The rank 1 candidates replace the estimated periods with
+    'best_candidates'
+
+    Parameters
+    ---------
+    objs: pandas DataFrame or light_curve_collection
+        Detections of the objects
+
+    periods_df: pandas DataFrame
+        Estimations indexed by oid with the candidate columns, as
+        returned by 'multi_method_estimation' with n_candidates
+
+    methods: string python list
+        Methods whose candidates are ranked
+
+    max_harmonic, n_sidereal, max_drift:
+        Alias relations, see 'alias_relations'
+
+    min_cycles: float
+        Minimum number of cycles of a valid candidate along the time
+        span of the detections
+
+    margin: float
+        Factor of the theta of the best peak of the periodogram
+
+    n_bins: positive integer
+        Number of phase bins of the dispersion
+
+    half: boolean
+        Condition to score half of the catalog period apart, as done
+        for eclipsing binaries
+
+    n_samples: positive integer
+        Number of samples per band of the estimation. The candidates are
+        folded with the same sampled detections, see 'sample_collection',
+        so that detections the estimation never saw do not rank them
+    """
+    if not isinstance(objs, light_curve_collection):
+        objs = light_curve_collection.from_dataframe(objs)
+    collection = sample_collection(objs[[oid for oid in periods_df.index if oid in objs]],
+                                   n_samples)
+    periods_df = periods_df.loc[collection.oids]
+    oids = np.asarray(collection.oids, dtype=object)
+    time_span = time_spans(collection)[:, None, None]
+    n_points = np.diff(collection.offsets, axis=1)
+    names = score_names(half) + ["Null"]
+
+    frames = []
+    for method in methods:
+        candidates, multiband = candidate_array(periods_df, method, collection.fids)
+        theta = fold_statistics(collection, candidates, n_bins)['theta']
+        bands = [band_name(band_fid) for band_fid in collection.fids]
+        method_points = n_points
+        if multiband:
+            weights = np.maximum(n_points - 1, 0)[:, :, None] * np.isfinite(theta)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                theta = (np.nansum(theta * weights, axis=1, keepdims=True)
+                         / weights.sum(axis=1, keepdims=True))
+            candidates = candidates[:, :1]
+            bands = ['all']
+            method_points = n_points.sum(axis=1, keepdims=True)
+        n_objs, n_bands, n_cands = candidates.shape
+
+        relations, factors = alias_relations(candidates, time_span, max_harmonic, n_sidereal,
+                                             max_drift)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cycles = time_span / candidates
+        valid = (np.isfinite(candidates) & (relations != RELATIONS.index('window'))
+                 & (cycles >= min_cycles))
+        key = np.where(valid & np.isfinite(theta), theta, np.inf)
+        key[..., 0] *= margin
+        order = np.argsort(key, axis=-1, kind='stable')
+        ranks = np.empty(order.shape, dtype=np.int64)
+        np.put_along_axis(ranks, order, np.arange(1, n_cands + 1), axis=-1)
+
+        columns = {
+            'oid': np.repeat(oids, n_bands * n_cands),
+            'method': method,
+            'band': np.tile(np.repeat(bands, n_cands), n_objs),
+            'peak': np.tile(np.arange(1, n_cands + 1), n_objs * n_bands),
+            'rank': ranks.ravel(),
+            'period': candidates.ravel(),
+            'theta': theta.ravel(),
+            'cycles': np.broadcast_to(cycles, candidates.shape).ravel(),
+            'relation': pd.Categorical.from_codes(relations.ravel(), RELATIONS),
+            'factor': factors.ravel(),
+            'valid': valid.ravel()}
+        if 'period' in periods_df:
+            codes = classify_periods(candidates,
+                                     periods_df.period.to_numpy(dtype=float)[:, None, None],
+                                     time_span, method_points[:, :, None], max_drift,
+                                     max_harmonic, half)
+            columns['score'] = pd.Categorical.from_codes(codes.ravel(), names)
+        frame = pd.DataFrame(columns)
+        frames.append(frame[np.isfinite(frame.period.to_numpy())])
+
+    ranked = pd.concat(frames, ignore_index=True)
+    ranked['method'] = pd.Categorical(ranked.method, categories=list(methods))
+    return ranked.sort_values(['method', 'oid', 'band', 'rank'], kind='stable',
+                              ignore_index=True)
+
+
+def best_candidates(periods_df, ranked):
+    """
+    Returns a copy of the estimations with the period of each method
+    and band replaced by its rank 1 candidate, so the ranked periods
+    can be scored like the original ones, see
+    'periodic_stars.fold_scores'
+
+    Parameters
+    ---------
+    periods_df: pandas DataFrame
+        Estimations indexed by oid
+
+    ranked: pandas DataFrame
+        Ranked candidates of the estimations, see 'rank_candidates'
+    """
+    best = ranked[ranked['rank'] == 1]
+    band = best.band.astype(str)
+    columns = best.method.astype(str) + '_T' + np.where(band == 'all', '', '_' + band)
+    table = best.assign(column=columns.to_numpy()).pivot(index='oid', columns='column',
+                                                         values='period')
+    periods_df = periods_df.copy()
+    periods_df.update(table)
+    return periods_df
@@ -0,0 +1,427 @@
+import time
+import numpy as np
+from PPEM.frequency_grid import DEFAULT_GRID
+from PPEM.profiling import stage_timer
+
+BATCH_METHODS = ['MHAOV', 'PDM1', 'LKSL']
+
+
+def pad_light_curves(curves):
+    """
+    Stacks light curves of different lengths in padded arrays of
+    shape (n_curves, max_length) and a mask of the valid samples
+
+    Parameters
+    ---------
+    curves: tuple python list
+        List of (mjd, mag, err) numpy arrays, one per light curve
+    """
+    n_max = max([len(curve[0]) for curve in curves] + [1])
+    mjd = np.zeros((len(curves), n_max))
+    mag = np.zeros((len(curves), n_max))
+    err = np.ones((len(curves), n_max))
+    mask = np.zeros((len(curves), n_max), dtype=bool)
+    for idx, (curve_mjd, curve_mag, curve_err) in enumerate(curves):
+        n = len(curve_mjd)
+        mjd[idx, :n] = curve_mjd
+        mag[idx, :n] = curve_mag
+        err[idx, :n] = curve_err
+        mask[idx, :n] = True
+    return mjd, mag, err, mask
+
+
+def _phase(mjd, freqs):
+    """
+    Phase in [0, 1) of every sample for every trial frequency, with
+    shape (n_curves, n_freqs, max_length)
+    """
+    arg = mjd[:, None, :] * freqs[:, :, None]
+    return arg - np.floor(arg)
+
+
+def _variance_terms(mag, w):
+    """
+    Numerator and denominator of the unbiased weighted variance of each
+    light curve, the normalization of PDM and LKSL in P4J, with shape
+    (n_curves, 1)
+    """
+    V1 = w.sum(-1)
+    V2 = (w**2).sum(-1)
+    mean = (w * mag).sum(-1) / V1
+    return (w * (mag - mean[:, None])**2).sum(-1)[:, None], (V1 - V2 / V1)[:, None]
+
+
+def _weighted_sum(x, w):
+    """
+    Sum over the samples of x (n_curves, n_freqs, max_length) weighted
+    by w (n_curves, max_length), accumulated in float64
+    """
+    return np.einsum('bfn,bn->bf', x, w.astype(x.dtype)).astype(np.float64)
+
+
+def _mhaov_statistic(mjd, mag, w, mask, freqs, n_harmonics=1):
+    """
+    Sums of the multiharmonic AoV statistic, the F ratio of the weighted
+    least squares fit of a constant plus n_harmonics harmonics: degrees
+    of freedom ratio, explained and total weighted variance, see
+    '_mhaov_combine'. The phase is reduced in float64 and the harmonics
+    are evaluated in float32. The one harmonic case is solved in closed
+    form
+    """
+    N = mask.sum(-1)
+    S = w.sum(-1)
+    y = mag - ((w * mag).sum(-1) / S)[:, None]
+    wy = w * y
+    wvar = (wy * y).sum(-1)
+    arg = (2 * np.pi * _phase(mjd, freqs)).astype(np.float32)
+    basis = []
+    for k in range(1, n_harmonics + 1):
+        basis += [np.cos(k * arg), np.sin(k * arg)]
+    if n_harmonics == 1:
+        c, s = basis
+        C = _weighted_sum(c, w)
+        Sn = _weighted_sum(s, w)
+        YC = _weighted_sum(c, wy)
+        YS = _weighted_sum(s, wy)
+        CC = _weighted_sum(c * c, w)
+        CS = _weighted_sum(c * s, w)
+        S = S[:, None]
+        SS = S - CC - Sn**2 / S
+        CC = CC - C**2 / S
+        CS = CS - C * Sn / S
+        aov = (SS * YC**2 - 2 * CS * YC * YS + CC * YS**2) / (CC * SS - CS**2)
+    else:
+        basis = [np.ones_like(arg)] + basis
+        p = len(basis)
+        A = np.empty(arg.shape[:2] + (p, p))
+        b = np.empty(arg.shape[:2] + (p,))
+        for i in range(p):
+            b[..., i] = _weighted_sum(basis[i], wy)
+            for j in range(i, p):
+                A[..., i, j] = A[..., j, i] = _weighted_sum(basis[i] * basis[j], w)
+        A += 1e-9 * np.trace(A, axis1=-2, axis2=-1)[..., None, None] * np.eye(p)
+        aov = (b * np.linalg.solve(A, b[..., None])[..., 0]).sum(-1)
+    d1 = 2.0 * n_harmonics
+    d2 = (N - 2 * n_harmonics - 1)[:, None]
+    return d2 / d1, aov, wvar[:, None]
+
+
+def _mhaov_combine(dof, aov, wvar):
+    """
+    Multiharmonic AoV statistic from its sums. Larger is better
+    """
+    return dof * aov / np.maximum(wvar - aov, 1e-9)
+
+
+def _pdm_statistic(mjd, mag, w, mask, freqs, n_bins=8):
+    """
+    Sums of the weighted Phase Dispersion Minimization statistic: the
+    dispersion inside the bins, its degrees of freedom and the variance
+    terms of the curve, see '_pdm_combine'. Bins with less than three
+    samples are ignored. The moments of each bin are computed as batched
+    float32 matrix products over the magnitudes centered on their
+    weighted mean
+    """
+    phase_bin = (_phase(mjd, freqs) * n_bins).astype(np.int8)
+    y = mag - ((w * mag).sum(-1) / w.sum(-1))[:, None]
+    moments = np.stack([w, w * y, w * y**2, w**2, mask], axis=-1).astype(np.float32)
+    num = np.zeros(phase_bin.shape[:2])
+    den = np.zeros(phase_bin.shape[:2])
+    for j in range(n_bins):
+        bin_moments = ((phase_bin == j).astype(np.float32) @ moments).astype(np.float64)
+        V1, S1, S2, V2, count = np.moveaxis(bin_moments, -1, 0)
+        used = count > 2
+        V1 = np.where(used, V1, 1.0)
+        num += np.where(used, S2 - S1**2 / V1, 0.0)
+        den += np.where(used, V1 - V2 / V1, 0.0)
+    return (num, den) + _variance_terms(mag, w)
+
+
+def _pdm_combine(num, den, var_num, var_den):
+    """
+    Phase Dispersion Minimization statistic from its sums, negated so
+    larger is better
+    """
+    return -(num / np.where(den > 0, den, np.nan)) / (var_num / var_den)
+
+
+def _lksl_statistic(mjd, mag, w, mask, freqs):
+    """
+    Sums of the weighted Lafler-Kinman string length: the weighted
+    squared differences, their weights and the variance terms of the
+    curve, see '_lksl_combine'. Padded samples are sorted after the
+    valid ones
+    """
+    phase = np.where(mask[:, None, :], _phase(mjd, freqs), np.inf)
+    order = np.argsort(phase, axis=-1)
+    order += (mjd.shape[1] * np.arange(mjd.shape[0]))[:, None, None]
+    mag_sorted = np.take(mag, order)
+    err2_sorted = np.take(np.where(mask, 1 / np.where(mask, w, 1.0), 0.0), order)
+    n_valid = mask.sum(-1)
+    pair_valid = np.arange(mjd.shape[1] - 1) < (n_valid - 1)[:, None, None]
+    err2_err2 = np.where(pair_valid, err2_sorted[..., 1:] + err2_sorted[..., :-1], np.inf)
+    SL = ((mag_sorted[..., 1:] - mag_sorted[..., :-1])**2 / err2_err2).sum(-1)
+    err2_acum = (1 / err2_err2).sum(-1)
+    last = (n_valid - 1)[:, None]
+    err2_err2 = err2_sorted[..., 0] + np.take_along_axis(err2_sorted[..., :], last[..., None], -1)[..., 0]
+    SL += (mag_sorted[..., 0] - np.take_along_axis(mag_sorted, last[..., None], -1)[..., 0])**2 / err2_err2
+    err2_acum += 1 / err2_err2
+    return (SL, err2_acum) + _variance_terms(mag, w)
+
+
+def _lksl_combine(SL, err2_acum, var_num, var_den):
+    """
+    Lafler-Kinman string length from its sums, negated so larger is
+    better
+    """
+    return -0.5 * (SL / err2_acum) / (var_num / var_den)
+
+
+_STATISTICS = {'MHAOV': (_mhaov_statistic, _mhaov_combine),
+               'PDM1': (_pdm_statistic, _pdm_combine),
+               'LKSL': (_lksl_statistic, _lksl_combine)}
+
+
+def band_groups(n_bands):
+    """
+    Returns the object of each curve of a batch where the curves of
+    every object are consecutive, from the number of curves (bands)
+    of each object, as used by the multi band periodograms
+    """
+    return np.repeat(np.arange(len(n_bands)), n_bands)
+
+
+def batch_periodogram(method, mjd, mag, err, mask, freqs, max_elements=2**22, groups=None):
+    """
+    Evaluates the periodogram of a batch of padded light curves over
+    the trial frequencies in a vectorized way. The frequencies are
+    processed in chunks so the temporary arrays hold at most
+    max_elements values. Returns an array of shape (n_curves, n_freqs),
+    or (n_objects, n_freqs) with groups
+
+    Parameters
+    ---------
+    method: {'MHAOV', 'PDM1', 'LKSL'}
+        Statistic of the periodogram, larger values are better
+
+        MHAOV: Multiharmonic AoV with one harmonic
+        PDM1: Phase Dispersion Minimization with 8 bins (negated)
+        LKSL: Lafler Kinman string length (negated)
+
+        They approximate the statistics of P4J rather than reproduce
+        them: P4J casts the time instants to float32 and folds them in
+        float32, which at MJD ~ 58000 is a resolution of ~4e-3 d, while
+        the phases are computed here in float64. MHAOV is barely
+        affected, but the bins of PDM1 and the order of LKSL change
+        with the phase errors, so their periodograms correlate 0.85 to
+        0.97 with the P4J ones on the bundled ZTF samples and their
+        best peak can differ
+
+    mjd, mag, err, mask: numpy arrays
+        Padded light curves, see 'pad_light_curves'
+
+    freqs: float numpy array
+        Trial frequencies shared by all the curves, with shape
+        (n_freqs,), or specific for each curve, (n_curves, n_freqs),
+        or for each object with groups, (n_objects, n_freqs)
+
+    max_elements: positive integer
+        Maximum size of the temporary arrays
+
+    groups: integer numpy array
+        Object of each curve, with the curves of every object
+        consecutive, see 'band_groups'. The curves of an object are the
+        bands of a multi band periodogram, whose statistic pools the
+        sums of every band, as 'P4J.MultiBandPeriodogram' does for MHAOV
+    """
+    if method not in _STATISTICS:
+        raise ValueError(f"Method {method} is not available in the batch engine, use one of {BATCH_METHODS}")
+    statistic, combine = _STATISTICS[method]
+    freqs = np.atleast_2d(freqs)
+    if groups is not None:
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        if freqs.shape[0] > 1:
+            freqs = freqs[groups]
+    w = np.where(mask, 1 / err**2, 0.0)
+    chunk = max(1, max_elements // (mjd.shape[0] * mjd.shape[1]))
+    per = np.empty((mjd.shape[0] if groups is None else len(starts), freqs.shape[1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, freqs.shape[1], chunk):
+            sums = statistic(mjd, mag, w, mask, freqs[:, start:start + chunk])
+            if groups is not None:
+                sums = [np.add.reduceat(values, starts, axis=0) for values in sums]
+            per[:, start:start + chunk] = combine(*sums)
+    return np.nan_to_num(per, nan=-np.inf)
+
+
+def _local_optima(per, n_local_optima):
+    """
+    Indices of the best n_local_optima local maxima of each
+    periodogram, shape (n_curves, n_local_optima)
+    """
+    is_optimum = np.zeros(per.shape, dtype=bool)
+    is_optimum[:, 1:-1] = (per[:, 1:-1] > per[:, :-2]) & (per[:, 1:-1] > per[:, 2:])
+    values = np.where(is_optimum, per, -np.inf)
+    k = min(n_local_optima, per.shape[1])
+    return np.argsort(values, axis=1)[:, ::-1][:, :k]
+
+
+def refine_periods(method, per, freqs, grid, mjd, mag, err, mask, max_elements=2**22, timer=None,
+                   groups=None, n_candidates=None):
+    """
+    Refines the best local optima of coarse periodograms over a fine
+    grid spanning the local step of the coarse grid, as P4J does, and
+    returns the best period of each one, NaN if the periodogram has no
+    finite value. With n_candidates, the periods of the best refined
+    local optima are also returned, see 'batch_get_period'
+
+    Parameters
+    ---------
+    method: {'MHAOV', 'PDM1', 'LKSL'}
+        Statistic of the periodogram, see 'batch_periodogram'
+
+    per: float numpy array
+        Coarse periodograms, shape (n_periods, n_freqs)
+
+    freqs: float numpy array
+        Coarse trial frequencies, shape (n_freqs,)
+
+    grid: frequency_grid object
+        Fine tuning of the periodogram
+
+    mjd, mag, err, mask: numpy arrays
+        Padded light curves, see 'pad_light_curves'
+
+    max_elements: positive integer
+        Maximum size of the temporary arrays
+
+    timer: stage_timer object
+        If given, the 'finetune' and 'best' stages are timed on it
+
+    groups: integer numpy array
+        Object of each curve for multi band periodograms, see
+        'batch_periodogram'
+
+    n_candidates: positive integer
+        Number of candidate periods of each periodogram
+    """
+    if timer is None:
+        timer = stage_timer()
+    n_periods = per.shape[0]
+    with timer.stage('finetune'):
+        optima = _local_optima(per, grid.n_local_optima)
+        step = np.gradient(freqs)[optima]
+        n_fine = int(np.ceil(2 * grid.fresolution / grid.finetune_resolution)) + 1
+        offsets = np.linspace(-1, 1, n_fine)
+        fine_freqs = (freqs[optima][:, :, None] + step[:, :, None] * offsets).reshape(n_periods, -1)
+        fine_per = batch_periodogram(method, mjd, mag, err, mask, fine_freqs, max_elements, groups)
+
+    with timer.stage('best'):
+        best_fine = fine_freqs[np.arange(n_periods), np.argmax(fine_per, axis=1)]
+        best_coarse = freqs[np.argmax(per, axis=1)]
+        use_fine = fine_per.max(axis=1) >= per.max(axis=1)
+        fbest = np.where(use_fine, best_fine, best_coarse)
+        periods = np.where(np.isfinite(np.maximum(fine_per.max(axis=1), per.max(axis=1))),
+                           1 / fbest, np.nan)
+        if n_candidates is None:
+            return periods
+        return periods, _candidate_periods(periods, per, fine_per, fine_freqs, optima, freqs,
+                                           n_candidates)
+
+
+def _candidate_periods(periods, per, fine_per, fine_freqs, optima, freqs, n_candidates):
+    """
+    Periods of the refined local optima of each periodogram ordered by
+    their value, shape (n_periods, n_candidates). The first one is the
+    best period and missing optima are NaN
+    """
+    n_periods, n_optima = optima.shape
+    rows = np.arange(n_periods)[:, None]
+    fine_per = fine_per.reshape(n_periods, n_optima, -1)
+    fine_idx = np.argmax(fine_per, axis=2)
+    fine_value = np.take_along_axis(fine_per, fine_idx[:, :, None], axis=2)[:, :, 0]
+    fine_freq = np.take_along_axis(fine_freqs.reshape(n_periods, n_optima, -1),
+                                   fine_idx[:, :, None], axis=2)[:, :, 0]
+    coarse_value = per[rows, optima]
+    n_freqs = per.shape[1]
+    is_optimum = ((optima > 0) & (optima < n_freqs - 1)
+                  & (coarse_value > per[rows, np.maximum(optima - 1, 0)])
+                  & (coarse_value > per[rows, np.minimum(optima + 1, n_freqs - 1)]))
+    value = np.where(is_optimum, np.maximum(fine_value, coarse_value), -np.inf)
+    freq = np.where(fine_value >= coarse_value, fine_freq, freqs[optima])
+    order = np.argsort(-value, axis=1, kind='stable')
+    candidates = np.where(np.isfinite(np.take_along_axis(value, order, axis=1)),
+                          1 / np.take_along_axis(freq, order, axis=1), np.nan)
+    candidates = np.concatenate([candidates, np.full((n_periods, n_candidates), np.nan)], axis=1)
+    same = np.isclose(candidates[:, 0], periods, rtol=1e-12, atol=0)
+    rest = np.where(same[:, None], candidates[:, 1:n_candidates], candidates[:, :n_candidates - 1])
+    return np.concatenate([periods[:, None], rest], axis=1)
+
+
+def batch_get_period(method, curves, grid=None, max_elements=2**22, timer=None, groups=None,
+                     n_candidates=None):
+    """
+    Computes the period of a batch of light curves with the vectorized
+    engine. The coarse grid is evaluated for all the curves at once and
+    then the best local optima of each curve are refined, as P4J does.
+    Returns a list of (period, elapsed time) with the same contract as
+    'get_period', where the time is the batch time divided by the
+    number of periods. With groups, one multi band period is computed
+    per object
+
+    Parameters
+    ---------
+    method: {'MHAOV', 'PDM1', 'LKSL'}
+        Statistic of the periodogram, see 'batch_periodogram'
+
+    curves: tuple python list
+        List of (mjd, mag, err) numpy arrays, one per light curve
+
+    grid: frequency_grid object
+        Trial frequencies and fine tuning of the periodogram. By
+        default 'DEFAULT_GRID' is used. The fine grid around each
+        optimum spans the local step of the coarse grid. The grid is
+        swept exhaustively, the adaptive search isn't available, see
+        'frequency_grid.exhaustive'
+
+    max_elements: positive integer
+        Maximum size of the temporary arrays
+
+    timer: stage_timer object
+        If given, the 'pad', 'sweep', 'finetune' and 'best' stages of
+        the whole batch are timed on it
+
+    groups: integer numpy array
+        Object of each curve for multi band periodograms, see
+        'batch_periodogram'
+
+    n_candidates: positive integer
+        If given, each estimation also has the periods of the best
+        n_candidates refined local optima of the periodogram, best
+        first and NaN padded, as 'get_period' does
+    """
+    if grid is None:
+        grid = DEFAULT_GRID
+    if grid.search != 'exhaustive':
+        raise ValueError(f"The numpy backend has no {grid.search} search, use the P4J backend or "
+                         "'grid.exhaustive()'")
+    if timer is None:
+        timer = stage_timer()
+    if len(curves) == 0:
+        return []
+    start = time.perf_counter()
+    with timer.stage('pad'):
+        mjd, mag, err, mask = pad_light_curves(curves)
+    with timer.stage('sweep'):
+        freqs = grid.frequencies
+        per = batch_periodogram(method, mjd, mag, err, mask, freqs, max_elements, groups)
+    n_periods = per.shape[0]
+    periods = refine_periods(method, per, freqs, grid, mjd, mag, err, mask, max_elements, timer,
+                             groups, n_candidates)
+    if n_candidates is not None:
+        periods, candidates = periods
+        p_time = (time.perf_counter() - start) / n_periods
+        return [(period, p_time, list(period_candidates))
+                for period, period_candidates in zip(periods, candidates)]
+    p_time = (time.perf_counter() - start) / n_periods
+    return [(period, p_time) for period in periods]
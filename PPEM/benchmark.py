@@ -0,0 +1,392 @@
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import tqdm
+import P4J
+from PPEM.frequency_grid import DEFAULT_GRID, ADAPTIVE_GRID
+from PPEM.period_estimation import (get_period, prepare_bands, object_multi_estimation,
+                                    _run_estimation, _batch_estimation, MULTIBAND_METHODS,
+                                    ESTIMATION_ERRORS)
+from PPEM.batch_periodogram import BATCH_METHODS
+
+CLASSES = ['RRL', 'Ceph', 'LPV', 'DSCT', 'EB']
+
+METHODS = ['PDM1', 'LKSL', 'AOV', 'MHAOV', 'QMICS', 'QMIEU']
+
+CONFIG_COLUMNS = ['class', 'method', 'n_samples', 'multiband', 'workers', 'backend']
+
+
+def load_class_sample(obj_class, data_path='csv_data'):
+    """
+    Loads the detections of the bundled sample of a class and its
+    tags (oid, classALeRCE, catalog period and source)
+
+    Parameters
+    ---------
+    obj_class: {'RRL', 'Ceph', 'LPV', 'DSCT', 'EB'}
+        Periodic variable star type to be loaded
+
+    data_path: string
+        Path of the 'csv_data' directory
+    """
+    objs_df = pd.read_csv(os.path.join(data_path, 'objs_samples', f'{obj_class}_objs.csv'),
+                          index_col='oid')
+    tags = pd.read_csv(os.path.join(data_path, 'period_estimations', 'single_band', obj_class,
+                                    f'{obj_class}_periods_10.csv'),
+                       index_col='oid', usecols=['oid', 'classALeRCE', 'period', 'source'])
+    return objs_df, tags.loc[objs_df.index.unique()]
+
+
+def period_hit(periods, catalog_periods, tolerance=0.01):
+    """
+    Returns a boolean array marking the estimated periods within a
+    relative tolerance of the catalog periods
+
+    Parameters
+    ---------
+    periods: float numpy array
+        Estimated periods
+
+    catalog_periods: float numpy array
+        Catalog periods
+
+    tolerance: float
+        Maximum relative difference to be considered a hit
+    """
+    periods = np.asarray(periods, dtype=float)
+    catalog_periods = np.asarray(catalog_periods, dtype=float)
+    return np.abs(periods - catalog_periods) <= tolerance * catalog_periods
+
+
+def compare_search_modes(objs_df, tags, methods, n_samples=None, grids=None, tolerance=0.01):
+    """
+    Estimates the periods of the objects with several frequency grids,
+    usually the exhaustive and the adaptive search, and compares their
+    hit rate against the catalog period, their agreement with the
+    first grid, their wall time and the trial frequencies evaluated.
+    The estimations are run serially so the times are comparable
+
+    Parameters
+    ---------
+    objs_df: pandas DataFrame
+        DataFrame containing the detection data of multiple
+        objects
+
+    tags: pandas DataFrame
+        DataFrame containing the tags of the objects, with the
+        catalog 'period'
+
+    methods: string python list
+        Methods used to perform the fit, see 'get_period'
+
+    n_samples: positive integer
+        Number of samples to be used for the period estimation
+
+    grids: dictionary
+        {name: frequency_grid} to be compared. The first one is the
+        reference for the agreement. By default the exhaustive
+        'DEFAULT_GRID' and the adaptive 'ADAPTIVE_GRID'
+
+    tolerance: float
+        Maximum relative difference to be considered a hit
+    """
+    if grids is None:
+        grids = {'exhaustive': DEFAULT_GRID, 'adaptive': ADAPTIVE_GRID}
+    rows = []
+    objs_oid = objs_df.index.unique()
+    for oid in tqdm.tqdm(objs_oid):
+        bands = prepare_bands(objs_df.loc[oid], n_samples)
+        for method in methods:
+            for band, band_data in zip(['g', 'r'], bands):
+                for name, grid in grids.items():
+                    try:
+                        period, p_time, n_trials = get_period(
+                            method, *band_data, grid=grid, return_trials=True)
+                    except ESTIMATION_ERRORS:
+                        period, p_time, n_trials = np.nan, np.nan, np.nan
+                    rows.append([oid, method, band, name, period, p_time, n_trials])
+    results = pd.DataFrame(rows, columns=['oid', 'method', 'band', 'search',
+                                          'period', 'time', 'trials'])
+    results['hit'] = period_hit(results.period, tags.period.reindex(results.oid).values, tolerance)
+    reference = results[results.search == list(grids)[0]].set_index(['oid', 'method', 'band']).period
+    results['agreement'] = period_hit(
+        results.period, reference.reindex(pd.MultiIndex.from_frame(results[['oid', 'method', 'band']])).values,
+        tolerance)
+    summary = results.groupby(['method', 'search']).agg(
+        hit_rate=('hit', 'mean'),
+        agreement=('agreement', 'mean'),
+        time=('time', 'mean'),
+        trials=('trials', 'mean'))
+    return results, summary
+
+
+def benchmark_search_modes(methods, n_samples=None, classes=CLASSES, n_objs=None,
+                           grids=None, tolerance=0.01, data_path='csv_data'):
+    """
+    Runs 'compare_search_modes' over the bundled samples of each class
+    and returns the summaries indexed by class, method and search. The
+    summary of the default grids and other adaptive settings on 20
+    objects per class is recorded in
+    'csv_data/benchmarks/search_modes_20.csv'
+
+    Parameters
+    ---------
+    methods: string python list
+        Methods used to perform the fit, see 'get_period'
+
+    n_samples: positive integer
+        Number of samples to be used for the period estimation
+
+    classes: string python list
+        Classes of 'csv_data/objs_samples' to be benchmarked
+
+    n_objs: positive integer
+        If given, only the first n_objs objects of each class are used
+
+    grids, tolerance:
+        See 'compare_search_modes'
+
+    data_path: string
+        Path of the 'csv_data' directory
+    """
+    summaries = []
+    for obj_class in classes:
+        objs_df, tags = load_class_sample(obj_class, data_path)
+        if n_objs is not None:
+            objs_df = objs_df.loc[objs_df.index.unique()[:n_objs]]
+        _, summary = compare_search_modes(objs_df, tags, methods, n_samples, grids, tolerance)
+        summaries.append(summary)
+    return pd.concat(summaries, keys=classes, names=['class'])
+
+
+def _timed_estimation(obj, methods, n_samples=None, multiband=False, grid=None, sink=None):
+    """
+    Runs 'object_multi_estimation' and prepends the wall time it took,
+    so the latency of each object is measured inside the workers
+    """
+    start = time.perf_counter()
+    query = object_multi_estimation(obj, methods, n_samples, multiband, grid=grid, sink=sink)
+    return [time.perf_counter() - start] + query
+
+
+def _peak_rss():
+    """
+    Peak resident set size in MB of this process and of its already
+    finished children, e.g. the workers of a closed pool
+    """
+    scale = 2**20 if sys.platform == 'darwin' else 2**10
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return usage / scale
+
+
+def _supported(method, multiband, backend, grid=None):
+    """
+    Condition of a method being available with a band mode, backend
+    and grid
+    """
+    if backend == 'numpy':
+        return method in BATCH_METHODS and (grid is None or grid.search == 'exhaustive')
+    return not multiband or method in MULTIBAND_METHODS
+
+
+def _run_config(objs_df, method, n_samples, multiband, workers, backend, grid):
+    """
+    Estimates the periods of the objects with one configuration and
+    returns its throughput, latency percentiles and peak memory. With
+    the numpy backend the latency of an object is its share of the
+    time of its batch
+    """
+    n_objs = len(objs_df.index.unique())
+    n_times = 1 if multiband else 2
+    start = time.perf_counter()
+    if backend == 'numpy':
+        rows = _run_estimation(objs_df, _batch_estimation, ([method], n_samples, grid, multiband),
+                               n_jobs=workers, batch=True)
+        latency = np.array([sum(row[3:3 + n_times]) for row in rows])
+    else:
+        rows = _run_estimation(objs_df, _timed_estimation, ([method], n_samples, multiband, grid),
+                               n_jobs=workers)
+        latency = np.array([row[1] for row in rows])
+    wall = time.perf_counter() - start
+    periods = np.array([row[-n_times:] for row in rows], dtype=float)
+    return {'n_objs': n_objs,
+            'wall': wall,
+            'throughput': n_objs / wall,
+            'p50': float(np.percentile(latency, 50)),
+            'p95': float(np.percentile(latency, 95)),
+            'failed': int(np.isnan(periods).sum()),
+            'peak_rss': _peak_rss()}
+
+
+def benchmark_throughput(methods=METHODS, n_samples_list=(10, 20, 30, 40, 50, 60),
+                         multiband_modes=(False, True), workers_list=(1,), backends=('P4J',),
+                         classes=CLASSES, n_objs=20, grid=None, isolate=True,
+                         data_path='csv_data'):
+    """
+    Measures the throughput of the estimators over the bundled samples
+    of each class, sweeping the method, the number of samples, the band
+    mode, the number of workers and the backend. Configurations a
+    backend doesn't support are skipped. Returns a DataFrame with one row per
+    configuration with the objects per second, the p50 and p95 latency
+    of each object [s], the estimations that failed (NaN periods of any
+    band) and the peak RSS [MB]
+
+    Parameters
+    ---------
+    methods: string python list
+        Methods used to perform the fit, see 'get_period'
+
+    n_samples_list: positive integer python list
+        Number of samples of each band to be used
+
+    multiband_modes: boolean python list
+        Band modes to be measured, single band (False) and
+        multi band (True)
+
+    workers_list: positive integer python list
+        Number of worker processes to be measured
+
+    backends: string python list
+        Engines to be measured, see 'multi_method_estimation'
+
+    classes: string python list
+        Classes of 'csv_data/objs_samples' to be measured
+
+    n_objs: positive integer
+        Number of objects of each class to be used. With None all
+        the objects are used
+
+    grid: frequency_grid object
+        Trial frequencies of the periodograms. By default
+        'DEFAULT_GRID' is used
+
+    isolate: boolean
+        Condition to run each configuration in a fresh process, so
+        the peak RSS isn't inherited from the previous configurations
+
+    data_path: string
+        Path of the 'csv_data' directory
+    """
+    rows = []
+    configs = [(obj_class, method, n_samples, multiband, workers, backend)
+               for obj_class in classes
+               for method in methods
+               for n_samples in n_samples_list
+               for multiband in multiband_modes
+               for workers in workers_list
+               for backend in backends
+               if _supported(method, multiband, backend, grid)]
+    samples = {}
+    for obj_class in classes:
+        objs_df, _ = load_class_sample(obj_class, data_path)
+        if n_objs is not None:
+            objs_df = objs_df.loc[objs_df.index.unique()[:n_objs]]
+        samples[obj_class] = objs_df
+    for config in tqdm.tqdm(configs):
+        args = (samples[config[0]],) + config[1:] + (grid,)
+        if isolate:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                measure = pool.submit(_run_config, *args).result()
+        else:
+            measure = _run_config(*args)
+        rows.append(dict(zip(CONFIG_COLUMNS, config), **measure))
+    return pd.DataFrame(rows)
+
+
+def environment():
+    """
+    Returns the versions and hardware the benchmarks were run with
+    """
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'P4J': P4J.__version__}
+
+
+def save_benchmark(results, path, grid=None, **metadata):
+    """
+    Saves the results of 'benchmark_throughput' to a JSON file with
+    the environment, the grid and the date of the run
+
+    Parameters
+    ---------
+    results: pandas DataFrame
+        Results of 'benchmark_throughput'
+
+    path: string
+        JSON file to be written
+
+    grid: frequency_grid object
+        Grid used by the benchmark. By default 'DEFAULT_GRID'
+
+    metadata:
+        Any other information of the run, e.g. the git commit
+    """
+    run = {'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'environment': environment(),
+           'grid': (grid if grid is not None else DEFAULT_GRID).settings(),
+           'metadata': metadata,
+           'results': results.to_dict(orient='records')}
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2, default=str)
+
+
+def load_benchmark(path):
+    """
+    Loads a run saved with 'save_benchmark'. Returns the results
+    DataFrame and a dictionary with the rest of the run information
+    """
+    with open(path) as f:
+        run = json.load(f)
+    results = pd.DataFrame(run.pop('results'))
+    if 'backend' not in results:
+        results['backend'] = 'P4J'
+    return results, run
+
+
+def compare_benchmarks(baseline, candidate, tolerance=0.1):
+    """
+    Compares two benchmark runs configuration by configuration. Returns
+    a DataFrame with the ratio candidate/baseline of the throughput, the
+    latency percentiles and the peak RSS, and a 'regression' column
+    marking the configurations where the throughput dropped or the p95
+    latency or the memory grew more than the tolerance
+
+    Parameters
+    ---------
+    baseline: pandas DataFrame or string
+        Results of the reference run, or its JSON file
+
+    candidate: pandas DataFrame or string
+        Results of the new run, or its JSON file
+
+    tolerance: float
+        Relative change allowed before flagging a regression
+    """
+    if isinstance(baseline, str):
+        baseline, _ = load_benchmark(baseline)
+    if isinstance(candidate, str):
+        candidate, _ = load_benchmark(candidate)
+    metrics = ['throughput', 'p50', 'p95', 'peak_rss']
+    comparison = baseline.set_index(CONFIG_COLUMNS)[metrics].join(
+        candidate.set_index(CONFIG_COLUMNS)[metrics],
+        how='inner', lsuffix='_baseline', rsuffix='_candidate')
+    for metric in metrics:
+        comparison[f'{metric}_ratio'] = (comparison[f'{metric}_candidate'] /
+                                         comparison[f'{metric}_baseline'])
+    comparison['regression'] = ((comparison.throughput_ratio < 1 - tolerance) |
+                                (comparison.p95_ratio > 1 + tolerance) |
+                                (comparison.peak_rss_ratio > 1 + tolerance))
+    return comparison
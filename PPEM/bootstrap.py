@@ -0,0 +1,308 @@
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from PPEM.batch_periodogram import BATCH_METHODS, batch_get_period, band_groups
+from PPEM.period_estimation import get_period, MULTIBAND_METHODS, ESTIMATION_ERRORS
+from PPEM.light_curves import light_curve_collection, band_name
+from PPEM.folding import detection_segments
+from PPEM.fold_quality import classify_periods, score_names, time_spans
+from PPEM.scoring import summarize_scores, _score_dtype
+
+INTERVAL_INDEX = ['class', 'method', 'band', 'n_samples']
+
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(x):
+    """
+    splitmix64 finalizer, maps uint64 counters to well spread uint64
+    keys in a vectorized way
+    """
+    with np.errstate(over='ignore'):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def oid_keys(oids):
+    """
+    Stable 64 bit key of each oid, the same in every process and run
+    """
+    return np.array([int.from_bytes(hashlib.blake2b(str(oid).encode(), digest_size=8).digest(),
+                                    'little') for oid in oids], dtype=np.uint64)
+
+
+def subsample_ranks(collection, seed):
+    """
+    Draws a random order of the detections of every object and band of
+    a light_curve_collection in one vectorized pass. Returns the rank of
+    each detection inside its band, aligned with the arrays of the
+    collection. The subsample of n detections of a band is made of the
+    detections with rank < n, so the subsamples of every size are nested
+    and come from a single draw. The order of a band only depends on its
+    oid, the seed and the position of its detections, not on the other
+    objects of the collection, so the same (object, size, seed) always
+    gives the same subsample
+
+    Parameters
+    ---------
+    collection: light_curve_collection
+        Detections of the objects
+
+    seed: non negative integer
+        Seed of the draw
+    """
+    segments = detection_segments(collection)
+    n_bands = len(collection.fids)
+    local = np.arange(len(segments)) - collection.offsets[segments // n_bands, 0]
+    with np.errstate(over='ignore'):
+        counter = (oid_keys(collection.oids)[segments // n_bands]
+                   + _mix(np.array([seed], dtype=np.uint64))
+                   + GOLDEN * (local.astype(np.uint64) + np.uint64(1)))
+    order = np.lexsort((_mix(counter), segments))
+    starts = collection.offsets[:, :-1].ravel() - collection.offsets[0, 0]
+    ranks = np.empty(len(segments), dtype=np.int64)
+    ranks[order] = np.arange(len(segments)) - starts[segments[order]]
+    return ranks
+
+
+def _band_curves(collection, segments, mask):
+    """
+    Splits the detections selected by a mask into the curves of their
+    segments. Returns the segments and their (mjd, mag, err, fid) arrays
+    """
+    selected = np.flatnonzero(mask)
+    if len(selected) == 0:
+        return np.array([], dtype=np.int64), []
+    selected_segments = segments[selected]
+    bounds = np.flatnonzero(np.diff(selected_segments)) + 1
+    curves = [(collection.mjd[idx], collection.mag[idx], collection.err[idx], collection.fid[idx])
+              for idx in np.split(selected, bounds)]
+    return selected_segments[np.r_[0, bounds]], curves
+
+
+def _units(collection, segments, mask, multiband):
+    """
+    Groups the curves selected by a mask into units of estimation, one
+    per band or, on multi band, one per object with its bands. Returns
+    the unit ids (segments or object positions) and the units
+    """
+    unit_segments, curves = _band_curves(collection, segments, mask)
+    if not multiband or not curves:
+        return unit_segments, [[curve] for curve in curves]
+    objects = unit_segments // len(collection.fids)
+    starts = np.r_[0, np.flatnonzero(np.diff(objects)) + 1, len(objects)]
+    return objects[starts[:-1]], [curves[start:end] for start, end in zip(starts[:-1], starts[1:])]
+
+
+def _unit_periods(units, methods, multiband=False, grid=None, backend='numpy'):
+    """
+    Estimates the periods of a list of units with every method. It's
+    the unit of work sent to the process pool by 'subsample_sweep'.
+    Returns an array of shape (n_units, n_methods)
+    """
+    periods = np.full((len(units), len(methods)), np.nan)
+    if backend == 'numpy':
+        curves = [curve[:3] for unit in units for curve in unit]
+        groups = band_groups([len(unit) for unit in units]) if multiband else None
+        for method_idx, method in enumerate(methods):
+            estimations = batch_get_period(method, curves, grid, groups=groups)
+            periods[:, method_idx] = [period for period, _ in estimations]
+        return periods
+    for unit_idx, unit in enumerate(units):
+        mjd, mag, err, fid = (np.concatenate(arrays) for arrays in zip(*unit))
+        for method_idx, method in enumerate(methods):
+            try:
+                periods[unit_idx, method_idx] = get_period(
+                    method, mjd, mag, err, fids=fid if multiband else None, grid=grid)[0]
+            except ESTIMATION_ERRORS:
+                pass
+    return periods
+
+
+def subsample_sweep(objs, tags, methods, n_samples_list, n_draws=20, seeds=None, multiband=False,
+                    backend='numpy', grid=None, n_jobs=1, chunksize=64, fids=(1, 2),
+                    obj_class=None, half=False, max_drift=1.0, max_harmonic=3):
+    """
+    Estimates the periods of many random subsamples of every object for
+    several number of samples and scores them against the catalog
+    period, to study the hit rate against the number of samples with
+    its variability. For every seed the detections of all the objects
+    are ranked in one vectorized draw, see 'subsample_ranks', and the
+    subsample of each size is taken from the same ranking. Requests
+    giving the same detections are computed once: repeated sizes or
+    seeds, and bands with no more detections than the number of samples,
+    which are used complete whatever the seed and size. The unique
+    subsamples are estimated in batches, optionally in parallel
+
+    Returns a long format table with one row per number of samples,
+    seed, object, band and method and the columns class, n_samples,
+    seed, oid, method, band, n_points, period and score, as
+    'scoring.scores_table'. Multi band estimations have the band 'all'.
+    The number of requested and computed estimations and the elapsed
+    time are stored in the 'attrs' of the result
+
+    Parameters
+    ---------
+    objs: pandas DataFrame or light_curve_collection
+        Detections of the objects
+
+    tags: pandas DataFrame
+        Tags of the objects indexed by oid with the catalog 'period'.
+        Only its objects are used
+
+    methods: string python list
+        Methods used to perform the fit
+
+    n_samples_list: positive integer python list
+        Number of samples of each band to be drawn
+
+    n_draws: positive integer
+        Number of subsamples of each object and size, with the seeds
+        0, 1, ..., n_draws - 1
+
+    seeds: non negative integer python list
+        Seeds of the subsamples, instead of n_draws
+
+    multiband: boolean
+        Condition to choose if the period estimation will consider
+        the bands seperatly (single band) or all together (multi band)
+
+    backend: {'numpy', 'P4J'}
+        Engine used to compute the periodograms. 'numpy' evaluates each
+        chunk of subsamples at once, see 'batch_periodogram'
+
+    grid: frequency_grid object
+        Trial frequencies of the periodograms, see 'get_period'
+
+    n_jobs: positive integer
+        Number of worker processes estimating the chunks
+
+    chunksize: positive integer
+        Number of units (bands, or objects on multi band) of each chunk
+
+    fids: int python tuple
+        Band identifiers to be used, in order
+
+    obj_class: string
+        Class of the objects
+
+    half, max_drift, max_harmonic:
+        Scoring of the periods, see 'fold_quality.classify_periods'
+    """
+    available = BATCH_METHODS if backend == 'numpy' else (MULTIBAND_METHODS if multiband else None)
+    if backend not in ('numpy', 'P4J'):
+        raise ValueError(f"Unknown backend {backend}")
+    if available is not None and any(method not in available for method in methods):
+        raise ValueError(f"The {backend} backend {'multi band ' if multiband else ''}"
+                         f"methods are {available}")
+    sizes = np.unique(np.asarray(n_samples_list, dtype=np.int64))
+    if len(sizes) == 0 or sizes[0] < 1:
+        raise ValueError("The number of samples must be positive integers")
+    start_time = time.perf_counter()
+    seeds = list(dict.fromkeys(range(n_draws) if seeds is None else seeds))
+    if not isinstance(objs, light_curve_collection):
+        objs = light_curve_collection.from_dataframe(objs, fids)
+    collection = objs[[oid for oid in tags.index if oid in objs]]
+    catalog_periods = tags.period.loc[collection.oids].to_numpy(dtype=float)
+    segments = detection_segments(collection)
+    counts = np.diff(collection.offsets, axis=1)
+    unit_counts = counts.max(axis=1) if multiband else counts.ravel()
+    n_units = len(unit_counts)
+    periods = np.full((len(sizes), len(seeds), n_units, len(methods)), np.nan)
+
+    jobs = []
+    full = (unit_counts > 0) & (unit_counts <= sizes[-1])
+    detection_units = segments // len(collection.fids) if multiband else segments
+    ids, units = _units(collection, segments, full[detection_units], multiband)
+    jobs.append((None, None, ids, units))
+    for seed_idx, seed in enumerate(seeds):
+        ranks = subsample_ranks(collection, seed)
+        for size_idx, size in enumerate(sizes):
+            mask = (ranks < size) & (unit_counts[detection_units] > size)
+            ids, units = _units(collection, segments, mask, multiband)
+            jobs.append((size_idx, seed_idx, ids, units))
+
+    tasks = [(job_idx, start) for job_idx, (_, _, _, units) in enumerate(jobs)
+             for start in range(0, len(units), chunksize)]
+    args = [(jobs[job_idx][3][start:start + chunksize], list(methods), multiband, grid, backend)
+            for job_idx, start in tasks]
+    if n_jobs == 1:
+        results = [_unit_periods(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(_unit_periods, *zip(*args)))
+    n_computed = 0
+    for (job_idx, start), values in zip(tasks, results):
+        size_idx, seed_idx, ids, _ = jobs[job_idx]
+        ids = ids[start:start + chunksize]
+        n_computed += len(ids)
+        if size_idx is None:
+            saturated = unit_counts[ids][None, :] <= sizes[:, None]
+            for idx in range(len(sizes)):
+                periods[idx, :, ids[saturated[idx]]] = values[saturated[idx]][:, None]
+        else:
+            periods[size_idx, seed_idx, ids] = values
+
+    n_objs, n_bands = counts.shape
+    if multiband:
+        band_names = ['all']
+        n_points = np.minimum(counts[None], sizes[:, None, None]).sum(-1, keepdims=True)
+    else:
+        band_names = [band_name(band_fid) for band_fid in collection.fids]
+        n_points = np.minimum(counts[None], sizes[:, None, None])
+    periods = periods.reshape(len(sizes), len(seeds), n_objs, len(band_names), len(methods))
+    codes = classify_periods(periods, catalog_periods[:, None, None],
+                             time_spans(collection)[:, None, None], n_points[:, None, :, :, None],
+                             max_drift, max_harmonic, half)
+    names = score_names(half) + ["Null"]
+    dtype = _score_dtype(names)
+    categories = dtype.categories.get_indexer(names)
+
+    draws = pd.MultiIndex.from_product([sizes, seeds, collection.oids, band_names, methods],
+                                       names=['n_samples', 'seed', 'oid', 'band', 'method'])
+    draws = draws.to_frame(index=False)
+    draws.insert(0, 'class', obj_class)
+    draws['n_points'] = np.broadcast_to(n_points[:, None, :, :, None], periods.shape).ravel()
+    draws['period'] = periods.ravel()
+    draws['score'] = pd.Categorical.from_codes(categories[codes.ravel()], dtype=dtype)
+    draws = draws[['class', 'n_samples', 'seed', 'oid', 'method', 'band', 'n_points', 'period',
+                   'score']]
+    draws.attrs = {'n_requested': int(periods.size // len(methods)), 'n_computed': n_computed,
+                   'time': time.perf_counter() - start_time}
+    return draws
+
+
+def hitrate_intervals(draws, score="Ok", level=0.95):
+    """
+    Summarizes the subsample sweep of 'subsample_sweep' as a hit rate
+    with a confidence interval for each class, method, band and number
+    of samples. The hit rate of every draw is computed over the objects
+    as 'scoring.summarize_scores' does, and the mean, the standard
+    deviation and the percentile interval are taken over the draws. The
+    index and the mean column follow the cube of 'score_plot', so it can
+    be plotted with 'plot_hitrate'
+
+    Parameters
+    ---------
+    draws: pandas DataFrame
+        Scores of the subsamples, as returned by 'subsample_sweep'
+
+    score: string
+        Name of the score to be considered as the hit-rate, its rate is
+        0 if no draw got it
+
+    level: float
+        Confidence level of the interval
+    """
+    by = [column for column in INTERVAL_INDEX if column in draws]
+    rates = summarize_scores(draws, by + ['seed']).reindex(columns=[score], fill_value=0)[score]
+    groups = rates.groupby(level=by, sort=False, dropna=False)
+    alpha = (1 - level) / 2
+    return pd.DataFrame({score: groups.mean(),
+                         f'{score}_std': groups.std(),
+                         f'{score}_low': groups.quantile(alpha),
+                         f'{score}_high': groups.quantile(1 - alpha),
+                         'n_draws': groups.size()}).sort_index()
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+
+class period_cache:
+
+    def __init__(self, path, max_size=100 * 2**20):
+        """
+        On disk memoization of the period estimations. Each result is
+        stored in its own small file named after a hash of the input
+        arrays and all the settings of the estimator, so the same light
+        curve estimated with the same method and grid is computed once,
+        even between sessions or by different processes
+
+        Parameters
+        ---------
+        path: string
+            Directory where the results are stored. It's created if
+            it doesn't exist
+
+        max_size: positive integer
+            Maximum size in bytes of the stored results. When it's
+            exceeded the least recently used results are removed
+
+        hits: positive integer
+            Number of results found in the cache by this instance
+
+        misses: positive integer
+            Number of results not found in the cache by this instance
+        """
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+        self._size = sum(entry_size for _, _, entry_size in self._entries())
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['hits'] = state['misses'] = 0
+        return state
+
+
+    @staticmethod
+    def key(method, arrays, **settings):
+        """
+        Computes the key of an estimation from the content of its
+        input arrays and the settings of the estimator
+
+        Parameters
+        ---------
+        method: string
+            Method used to perform the fit
+
+        arrays: numpy array python list
+            Input arrays of the estimation (mjd, mag, err and fids).
+            None values are allowed. They are hashed with their own
+            dtype, which is part of the key: P4J folds float32 copies
+            but computes the location and scale of the magnitudes from
+            the arrays as given, so float64 detections that only differ
+            below float32 precision, or the float32 detections of a
+            light_curve_collection, can give other results
+
+        settings:
+            Every other parameter that changes the result of the
+            estimation, e.g. the frequency grid
+        """
+        digest = hashlib.sha256(method.encode())
+        for array in arrays:
+            if array is None:
+                digest.update(b'None')
+                continue
+            array = np.ascontiguousarray(array)
+            digest.update(f'{array.dtype.str}{array.shape}'.encode())
+            digest.update(array.tobytes())
+        digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key + '.json')
+
+
+    def get(self, key, fields=()):
+        """
+        Returns the stored result of a key or None if it's not in the
+        cache or it lacks any of the fields. Found results are marked as
+        recently used
+
+        Parameters
+        ---------
+        key: string
+            Key computed with 'period_cache.key'
+
+        fields: string python list
+            Entries the stored result must have to be used, e.g. the
+            'candidates' of results stored before they were kept
+        """
+        file = self._file(key)
+        try:
+            with open(file) as f:
+                value = json.load(f)
+            os.utime(file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if any(field not in value for field in fields):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+
+    def set(self, key, value):
+        """
+        Stores the result of a key, replacing the previous one. The file
+        is written to a temporary name and then renamed, so concurrent
+        writers never leave partial results
+
+        Parameters
+        ---------
+        key: string
+            Key computed with 'period_cache.key'
+
+        value: json serializable object
+            Result to be stored
+        """
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        try:
+            old_size = os.path.getsize(file)
+        except FileNotFoundError:
+            old_size = 0
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(file), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp_file, file)
+        self._size += os.path.getsize(file) - old_size
+        if self._size > self.max_size:
+            self.evict()
+
+
+    def evict(self):
+        """
+        Removes the least recently used results until the cache uses
+        less than 90% of max_size
+        """
+        entries = sorted(self._entries())
+        size = sum(entry_size for _, _, entry_size in entries)
+        for _, file, entry_size in entries:
+            if size <= 0.9 * self.max_size:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        self._size = size
+
+
+    def _entries(self):
+        """
+        Generator returning (last use, file, size) of every stored result
+        """
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                file = os.path.join(root, name)
+                try:
+                    stat = os.stat(file)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, file, stat.st_size
+
+
+    def stats(self):
+        """
+        Returns the number of hits, misses and stored results and
+        the size of the cache in bytes
+        """
+        entries = list(self._entries())
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(entries),
+                'size': sum(entry_size for _, _, entry_size in entries)}
+
+
+    def clear(self):
+        """
+        Removes all the stored results
+        """
+        for _, file, _ in list(self._entries()):
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+        self._size = 0
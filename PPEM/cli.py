@@ -0,0 +1,362 @@
+import os
+import re
+import sys
+import json
+import glob
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from PPEM.bootstrap import oid_keys
+from PPEM.database import dataframe_database, pooled_postgreSQL_database
+from PPEM.frequency_grid import frequency_grid
+from PPEM.fold_quality import score_names
+from PPEM.periodic_stars import periodic_stars
+from PPEM.scoring import scores_table
+from PPEM.score_plot import aggregate_cube, save_cube, plot_hitrate, plot_time
+from PPEM.storage import save_periods, load_periods, save_scores, load_scores, FORMATS
+from PPEM.sweep import _load_objects
+
+SHARD_DIR = 'shard-{:03d}-of-{:03d}'
+
+SHARD_PATTERN = re.compile(r'^shard-(\d+)-of-(\d+)$')
+
+RESULT_PATTERN = re.compile(r'^(?P<class>.+)_(?P<n_samples>\d+|all)_(?P<mode>sb|mb)$')
+
+DEFAULTS = {'output': 'results',
+            'format': 'parquet',
+            'n_objs': None,
+            'n_min': 0,
+            'max_sigma': 1.0,
+            'n_samples': [None],
+            'multiband': [False],
+            'multiband_methods': ['MHAOV'],
+            'backend': 'P4J',
+            'grid': None,
+            'score': True,
+            'half_classes': ['EB']}
+
+
+def load_config(path):
+    """
+    Reads the configuration of a run from a JSON file, filling the
+    missing entries with 'DEFAULTS'. The entries are
+
+        classes: {class: {'objects': file, 'tags': file}}, the
+            detections (csv, Parquet, Feather or light_curve_collection
+            directory, not needed with a database) and the tags with the
+            catalog 'period' and 'source' (csv, Parquet or Feather)
+        methods: methods of the single band estimations
+        multiband_methods: methods of the multi band estimations
+        n_samples: number of samples of each estimation, null uses all
+            the detections
+        multiband: band modes to be run, false and/or true
+        database: credentials of the ALeRCE database. If given, the
+            detections are queried instead of read from the files
+        n_objs, n_min, max_sigma: object selection, see
+            'periodic_stars.get_objects'
+        backend, grid: estimation, see 'periodic_stars.compute_periods'.
+            The grid is a dictionary with the settings of a
+            'frequency_grid' or 'class'
+        score: condition to score the folded curves automatically
+        half_classes: classes scored with the half score
+        output, format: directory and columnar format of the results
+
+    Parameters
+    ---------
+    path: string
+        Configuration file
+    """
+    with open(path) as f:
+        config = dict(DEFAULTS, **json.load(f))
+    missing = [key for key in ['classes', 'methods'] if key not in config]
+    if missing:
+        raise ValueError(f"The configuration {path} has no {missing}")
+    if config['format'] not in FORMATS.values():
+        raise ValueError(f"Unknown format {config['format']}, use one of {list(FORMATS.values())}")
+    return config
+
+
+def parse_shard(value):
+    """
+    Parses a shard given as 'i/N', with 0 <= i < N
+    """
+    match = re.fullmatch(r'(\d+)/(\d+)', value)
+    if match is None or not int(match[1]) < int(match[2]):
+        raise argparse.ArgumentTypeError(f"Shards are given as i/N with 0 <= i < N, not {value}")
+    return int(match[1]), int(match[2])
+
+
+def shard_oids(oids, shard, n_shards):
+    """
+    Returns the oids belonging to a shard. Each oid goes to the shard
+    given by a stable hash of it, so the partition is the same on every
+    machine and run, whatever the order of the oids
+
+    Parameters
+    ---------
+    oids: string python list
+        oids to be partitioned
+
+    shard: non negative integer
+        Shard to be returned, lower than n_shards
+
+    n_shards: positive integer
+        Number of shards
+    """
+    oids = list(oids)
+    keep = oid_keys(oids) % np.uint64(n_shards) == np.uint64(shard)
+    return [oid for oid, kept in zip(oids, keep) if kept]
+
+
+TAG_COLUMNS = ['classALeRCE', 'period', 'source']
+
+
+def _read_tags(path):
+    """
+    Reads the tags of a class from a csv or columnar file, leaving out
+    the estimations it may already have
+    """
+    if os.path.splitext(path)[1] in FORMATS:
+        return load_periods(path, columns=TAG_COLUMNS)
+    return pd.read_csv(path, index_col='oid', usecols=['oid'] + TAG_COLUMNS)
+
+
+def _result_name(obj_class, n_samples, multiband):
+    return f"{obj_class}_{n_samples or 'all'}_{'mb' if multiband else 'sb'}"
+
+
+def run(config, shard=(0, 1), workers=1, classes=None):
+    """
+    Runs the object selection, period estimation and scoring of a
+    configuration for the objects of a shard. For every class, number
+    of samples and band mode the tags and estimations are written to
+    '<output>/<shard>/periods/<class>_<n_samples>_<sb|mb>' and the long
+    format scores to '<output>/<shard>/scores/...', in the columnar
+    format of the configuration. Results already written are skipped,
+    so a failed shard can be run again. Returns the written files
+
+    With N hash shards the n_objs of the configuration becomes
+    ceil(n_objs / N) per shard, selected among the oids of the shard.
+    A sharded run therefore doesn't select the same objects as an
+    unsharded one, nor exactly n_objs of them
+
+    Parameters
+    ---------
+    config: dictionary
+        Configuration of the run, see 'load_config'
+
+    shard: integer python tuple
+        (i, N), the shard run out of N
+
+    workers: positive integer
+        Number of worker processes of the estimations
+
+    classes: string python list
+        If given, only these classes of the configuration are run
+    """
+    index, n_shards = shard
+    path = os.path.join(config['output'], SHARD_DIR.format(index, n_shards))
+    extension = {value: key for key, value in FORMATS.items()}[config['format']]
+    grid = config['grid']
+    if isinstance(grid, dict):
+        grid = frequency_grid(**grid)
+    written = []
+    for obj_class, files in config['classes'].items():
+        if classes is not None and obj_class not in classes:
+            continue
+        tasks = [(n_samples, multiband) for n_samples in config['n_samples']
+                 for multiband in config['multiband']]
+        pending = [(n_samples, multiband) for n_samples, multiband in tasks
+                   if not os.path.exists(os.path.join(
+                       path, 'periods', _result_name(obj_class, n_samples, multiband) + extension))]
+        if not pending:
+            continue
+        tags = _read_tags(files['tags'])
+        tags = tags.loc[shard_oids(tags.index, index, n_shards)]
+        n_objs = config['n_objs']
+        n_objs = len(tags) if n_objs is None else int(np.ceil(n_objs / n_shards))
+        if config.get('database') is not None:
+            database = pooled_postgreSQL_database(config['database'])
+        else:
+            objs = _load_objects(files['objects'])
+            database = dataframe_database(objs if isinstance(objs, pd.DataFrame) else objs.to_dataframe())
+        stars = periodic_stars(database, obj_class, n_objs, config['n_min'])
+        print(f"{obj_class}: shard {index}/{n_shards} with {len(tags)} oids")
+        stars.get_objects(tags, max_sigma=config['max_sigma'])
+        database.close()
+
+        for n_samples, multiband in pending:
+            name = _result_name(obj_class, n_samples, multiband)
+            methods = config['multiband_methods'] if multiband else config['methods']
+            start = time.perf_counter()
+            periods_df = stars.compute_periods(methods, n_samples, multiband, n_jobs=workers,
+                                               grid=grid, backend=config['backend'])
+            print(f"{name}: {len(periods_df)} objects in {time.perf_counter() - start:.1f} s")
+            if config['score']:
+                half = obj_class in config['half_classes']
+                fold_scores = stars.fold_scores(periods_df, methods, half=half)
+                table = scores_table(fold_scores, score_names(half), obj_class, n_samples,
+                                     sources=periods_df.get('source'))
+                scores_file = os.path.join(path, 'scores', name + extension)
+                save_scores(table, scores_file, config['format'])
+                written.append(scores_file)
+            periods_file = os.path.join(path, 'periods', name + extension)
+            save_periods(periods_df, periods_file, config['format'])
+            written.append(periods_file)
+    return written
+
+
+def merge(output, into=None, allow_partial=False, plots=False, methods=None):
+    """
+    Combines the results of the shards of a run into single tables:
+    '<into>/periods/<class>_<n_samples>_<sb|mb>' with the estimations of
+    all the objects, '<into>/scores' and '<into>/multiband_scores' with
+    the long format scores for 'scoring.summarize_scores' and
+    'score_plot.score_cube', and '<into>/cube.csv' with the cube of
+    metrics of 'score_plot.aggregate_cube'. Returns the written files
+
+    Parameters
+    ---------
+    output: string
+        Output directory of the run, with one directory per shard
+
+    into: string
+        Directory of the merged tables, by default '<output>/merged'
+
+    allow_partial: boolean
+        Condition to merge even if some shards are missing
+
+    plots: boolean
+        Condition to also write the hit rate and time plots of each
+        class, see 'score_plot.plot_hitrate'
+
+    methods: string python list
+        Single band methods of the plots, by default all of them
+    """
+    into = into or os.path.join(output, 'merged')
+    shards = {}
+    for directory in sorted(glob.glob(os.path.join(output, 'shard-*'))):
+        match = SHARD_PATTERN.match(os.path.basename(directory))
+        if match:
+            shards.setdefault(int(match[2]), []).append(int(match[1]))
+    if len(shards) != 1:
+        raise ValueError(f"Expected the shards of a single run at {output}, found {shards}")
+    n_shards, found = next(iter(shards.items()))
+    missing = sorted(set(range(n_shards)) - set(found))
+    if missing and not allow_partial:
+        raise ValueError(f"Shards {missing} of {n_shards} are missing at {output}")
+
+    files = {}
+    for directory in ['periods', 'scores']:
+        for file in glob.glob(os.path.join(output, 'shard-*', directory, '*')):
+            name, extension = os.path.splitext(os.path.basename(file))
+            if extension in FORMATS and RESULT_PATTERN.match(name):
+                files.setdefault((directory, name), []).append(file)
+    extension = next((os.path.splitext(group[0])[1] for group in files.values()), '.parquet')
+
+    written = []
+    periods = {False: {}, True: {}}
+    scores = {False: [], True: []}
+    for (directory, name), group in sorted(files.items()):
+        match = RESULT_PATTERN.match(name)
+        key = (match['class'], None if match['n_samples'] == 'all' else int(match['n_samples']))
+        multiband = match['mode'] == 'mb'
+        if directory == 'periods':
+            periods_df = pd.concat([load_periods(file) for file in sorted(group)])
+            periods[multiband][key] = periods_df
+            out_file = os.path.join(into, 'periods', name + extension)
+            save_periods(periods_df, out_file)
+            written.append(out_file)
+        else:
+            scores[multiband] += [load_scores(file) for file in sorted(group)]
+
+    tables = {}
+    for multiband, name in [(False, 'scores'), (True, 'multiband_scores')]:
+        if scores[multiband]:
+            tables[multiband] = pd.concat(scores[multiband], ignore_index=True)
+            out_file = os.path.join(into, name + extension)
+            save_scores(tables[multiband], out_file)
+            written.append(out_file)
+    if tables or periods[False] or periods[True]:
+        cube = aggregate_cube(tables.get(False), tables.get(True), periods[False],
+                              periods[True] or None)
+        cube_file = os.path.join(into, 'cube.csv')
+        save_cube(cube, cube_file)
+        written.append(cube_file)
+        if plots:
+            written += _plot_cube(cube, into, methods)
+    return written
+
+
+def _plot_cube(cube, path, methods=None):
+    """
+    Writes the hit rate and time plots of every class of a cube
+    """
+    written = []
+    for obj_class in cube.index.unique('class'):
+        class_cube = cube.xs(obj_class, level='class', drop_level=False)
+        bands = class_cube.index.get_level_values('band')
+        class_methods = methods or list(class_cube[bands != 'all'].index.unique('method'))
+        multiband_methods = list(class_cube[bands == 'all'].index.unique('method'))
+        for metric, plot in [('Ok', plot_hitrate), ('time', plot_time)]:
+            if metric not in class_cube:
+                continue
+            file = os.path.join(path, f'{"hitrate" if metric == "Ok" else "time"}_{obj_class}.png')
+            if metric == 'Ok':
+                plot(class_cube, class_methods, multiband_methods=multiband_methods, file=file)
+            else:
+                plot(class_cube, class_methods, multiband_methods, file=file)
+            written.append(file)
+    return written
+
+
+def build_parser():
+    """
+    Returns the parser of the 'ppem' command
+    """
+    parser = argparse.ArgumentParser(
+        prog='ppem', description="Batch period estimation and scoring of variable stars")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser(
+        'run', help="select, estimate and score the objects of a shard")
+    run_parser.add_argument('config', help="JSON configuration file")
+    run_parser.add_argument('--shard', type=parse_shard, default=(0, 1), metavar='i/N',
+                            help="run only the oids of shard i out of N, by oid hash")
+    run_parser.add_argument('--workers', type=int, default=1,
+                            help="worker processes of the estimations, -1 uses all the cores")
+    run_parser.add_argument('--output', help="output directory, overrides the configuration")
+    run_parser.add_argument('--classes', nargs='+', help="run only these classes")
+
+    merge_parser = subparsers.add_parser(
+        'merge', help="combine the outputs of the shards of a run")
+    merge_parser.add_argument('output', help="output directory of the run")
+    merge_parser.add_argument('--into', help="directory of the merged tables")
+    merge_parser.add_argument('--allow-partial', action='store_true',
+                              help="merge even if some shards are missing")
+    merge_parser.add_argument('--plots', action='store_true',
+                              help="write the hit rate and time plots of each class")
+    merge_parser.add_argument('--methods', nargs='+', help="single band methods of the plots")
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point of the 'ppem' command
+    """
+    args = build_parser().parse_args(argv)
+    if args.command == 'run':
+        config = load_config(args.config)
+        if args.output is not None:
+            config['output'] = args.output
+        written = run(config, args.shard, args.workers, args.classes)
+    else:
+        written = merge(args.output, args.into, args.allow_partial, args.plots, args.methods)
+    for file in written:
+        print(file)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
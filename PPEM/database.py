@@ -1,54 +1,324 @@
+import itertools
+import time
 import psycopg2
 from psycopg2 import Error
+from psycopg2 import pool
 import pandas as pd
 
+DETECTION_COLUMNS = ['oid', 'candoid','mjd','fid', 'magpsf', 'sigmapsf', 'magpsf_corr', 'sigmapsf_corr_ext']
+
 class postgreSQL_database:
 
-	def __init__(self, credentials):
-	    """
-	    Class for creating the pipeline to the ALeRCE database to be used
-	    for querying the data
-	    
-	    Parameters
-	    ---------
-	    credentials: dictionary
-	    	{'user':'xxxxxxxxxx',
+    def __init__(self, credentials):
+        """
+        Class for creating the pipeline to the ALeRCE database to be used
+        for querying the data
+        
+        Parameters
+        ---------
+        credentials: dictionary
+            {'user':'xxxxxxxxxx',
               'password':'xxxxxxxx',
               'host':'xx.xxx.xx.xx',
               'port':'xxxx',
               'database':'xxx'}
             Dictionary with the credentials of the database to be used
-	    """		
-
-		self.credentials = credentials
-
-
-	def query(self, object_id):
-	    """
-	    Method for querying the data of a determined object from
-	    the database
-
-	    Parameters
-	    ---------
-
-		object_id: string
-			oid of the object to be queried
-	    """				
-	    try:
-	        connection = psycopg2.connect(**self.credentials)
-
-	        cursor = connection.cursor()
-	        cursor.execute(
-	            'select oid, candid, mjd, fid, magpsf, sigmapsf, magpsf_corr, sigmapsf_corr_ext from detection where oid = %s', (object_id,))
-	        results = cursor.fetchall()
-
-	    except (Exception, Error) as error:
-	        print("Error while connecting to PostgreSQL", error)
-	    finally:
-	        if connection:
-	            cursor.close()
-	            connection.close()
-	            print("PostgreSQL connection is closed")
-	    return pd.DataFrame(
-	        results, 
-	        columns=['oid', 'candoid','mjd','fid', 'magpsf', 'sigmapsf', 'magpsf_corr', 'sigmapsf_corr_ext']).set_index("oid")
\ No newline at end of file
+        """     
+
+        self.credentials = credentials
+
+
+    def query(self, object_id):
+        """
+        Method for querying the data of a determined object from
+        the database
+
+        Parameters
+        ---------
+
+        object_id: string
+            oid of the object to be queried
+        """             
+        try:
+            connection = psycopg2.connect(**self.credentials)
+
+            cursor = connection.cursor()
+            cursor.execute(
+                'select oid, candid, mjd, fid, magpsf, sigmapsf, magpsf_corr, sigmapsf_corr_ext from detection where oid = %s', (object_id,))
+            results = cursor.fetchall()
+
+        except (Exception, Error) as error:
+            print("Error while connecting to PostgreSQL", error)
+        finally:
+            if connection:
+                cursor.close()
+                connection.close()
+                print("PostgreSQL connection is closed")
+        return _detections_frame(results)
+
+
+class pooled_postgreSQL_database(postgreSQL_database):
+
+    def __init__(self, credentials, minconn=1, maxconn=4, batch_size=100, itersize=2000):
+        """
+        Pipeline to the ALeRCE database that keeps a pool of open
+        connections and fetches the detections of many objects on
+        each round trip
+        
+        Parameters
+        ---------
+        credentials: dictionary
+            Dictionary with the credentials of the database to be used,
+            see 'postgreSQL_database'
+
+        minconn: positive integer
+            Number of connections opened when the pool is created
+
+        maxconn: positive integer
+            Maximum number of connections kept by the pool
+
+        batch_size: positive integer
+            Number of oids fetched on each query by 'query_many'
+
+        itersize: positive integer
+            Number of rows transferred from the server on each fetch
+        """
+        super().__init__(credentials)
+        self.batch_size = batch_size
+        self.itersize = itersize
+        self.pool = pool.ThreadedConnectionPool(minconn, maxconn, **credentials)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def close(self):
+        """
+        Closes all the connections of the pool
+        """
+        self.pool.closeall()
+
+
+    def query(self, object_id):
+        """
+        Method for querying the data of a determined object from
+        the database using a connection of the pool
+
+        Parameters
+        ---------
+
+        object_id: string
+            oid of the object to be queried
+        """
+        return next(self.query_many([object_id]))[1]
+
+
+    def query_many(self, object_ids, batch_size=None, max_sigma=None, n_min=None):
+        """
+        Generator querying the detections of many objects. The oids are
+        sent in batches with a single 'oid = ANY(%s)' query each, the rows
+        are streamed from a server side cursor and the objects are yielded
+        as (oid, DataFrame) in the same order as 'object_ids'. Objects
+        without detections, or rejected by the filters, are yielded with
+        an empty DataFrame
+
+        Parameters
+        ---------
+
+        object_ids: string iterable
+            oids of the objects to be queried
+
+        batch_size: positive integer
+            Number of oids fetched on each query, by default the
+            'batch_size' of the database
+
+        max_sigma: float
+            If given, only the detections with 0 < sigmapsf_corr_ext < max_sigma
+            are returned. The filter is evaluated by the database
+
+        n_min: positive integer
+            If given, only the objects with at least n_min detections
+            on both the g and r bands (after the max_sigma filter) are
+            returned. The counts are evaluated by the database
+        """
+        batch_size = batch_size or self.batch_size
+        object_ids = iter(object_ids)
+        while True:
+            batch = list(itertools.islice(object_ids, batch_size))
+            if not batch:
+                return
+            objs = self._fetch_batch(batch, max_sigma, n_min)
+            for oid in batch:
+                yield oid, _detections_frame(objs.get(oid, []))
+
+
+    def _fetch_batch(self, batch, max_sigma=None, n_min=None):
+        """
+        Fetches the detections of a batch of oids and groups the
+        rows by oid
+
+        Parameters
+        ---------
+
+        batch: string python list
+            oids of the objects to be queried
+
+        max_sigma, n_min:
+            Filters pushed down to the database, see 'query_many'
+        """
+        noise_filter = ''
+        params = [batch]
+        if max_sigma is not None:
+            noise_filter = ' and sigmapsf_corr_ext > 0 and sigmapsf_corr_ext < %s'
+            params.append(max_sigma)
+        sql = ('select oid, candid, mjd, fid, magpsf, sigmapsf, magpsf_corr, sigmapsf_corr_ext '
+               'from detection where oid = ANY(%s)' + noise_filter)
+        if n_min is not None:
+            sql += (' and oid in (select oid from detection where oid = ANY(%s)' + noise_filter +
+                    ' group by oid having count(*) filter (where fid = 1) >= %s'
+                    ' and count(*) filter (where fid = 2) >= %s)')
+            params += params + [n_min, n_min]
+        sql += ' order by oid'
+
+        connection = self.pool.getconn()
+        try:
+            with connection.cursor(name='ppem_query_many') as cursor:
+                cursor.itersize = self.itersize
+                cursor.execute(sql, tuple(params))
+                objs = {oid: list(rows)
+                        for oid, rows in itertools.groupby(cursor, key=lambda row: row[0])}
+            connection.commit()
+        except (Exception, Error) as error:
+            connection.rollback()
+            print("Error while querying PostgreSQL", error)
+            raise
+        finally:
+            self.pool.putconn(connection)
+        return objs
+
+
+class dataframe_database:
+
+    def __init__(self, objs_df, latency=0.0):
+        """
+        Local stand-in of the ALeRCE database serving the detections
+        from a DataFrame, e.g. one of the csv files at 'csv_data/objs_samples'.
+        It has the same interface as 'pooled_postgreSQL_database' so the
+        object selection can run offline
+        
+        Parameters
+        ---------
+        objs_df: pandas DataFrame
+            DataFrame containing the detections indexed by oid
+
+        latency: float
+            Seconds slept on each round trip to emulate a remote
+            database
+        """
+        self.objs_df = objs_df
+        self.latency = latency
+        self.batch_size = 100
+
+
+    def query(self, object_id):
+        """
+        Returns the detections of a determined object
+
+        Parameters
+        ---------
+
+        object_id: string
+            oid of the object to be queried
+        """
+        return next(self.query_many([object_id]))[1]
+
+
+    def query_many(self, object_ids, batch_size=None, max_sigma=None, n_min=None):
+        """
+        Generator returning the detections of many objects as
+        (oid, DataFrame), see 'pooled_postgreSQL_database.query_many'
+
+        Parameters
+        ---------
+
+        object_ids: string iterable
+            oids of the objects to be queried
+
+        batch_size: positive integer
+            Number of oids served on each round trip
+
+        max_sigma, n_min:
+            See 'pooled_postgreSQL_database.query_many'
+        """
+        batch_size = batch_size or self.batch_size
+        object_ids = iter(object_ids)
+        while True:
+            batch = list(itertools.islice(object_ids, batch_size))
+            if not batch:
+                return
+            time.sleep(self.latency)
+            objs = self.objs_df[self.objs_df.index.isin(batch)]
+            if max_sigma is not None:
+                objs = objs[((objs['sigmapsf_corr_ext'] > 0.0) &
+                    (objs['sigmapsf_corr_ext'] < max_sigma))]
+            if n_min is not None:
+                counts = objs.groupby([objs.index, 'fid']).size().unstack(fill_value=0)
+                counts = counts.reindex(columns=[1, 2], fill_value=0)
+                passed = counts.index[(counts[1] >= n_min) & (counts[2] >= n_min)]
+                objs = objs[objs.index.isin(passed)]
+            groups = dict(list(objs.groupby(level=0, sort=False)))
+            for oid in batch:
+                yield oid, groups.get(oid, self.objs_df.iloc[:0])
+
+
+    def close(self):
+        pass
+
+
+def filter_detections(obj, n_min=None, max_sigma=None, fids=(1, 2)):
+    """
+    Applies the object selection filters to the detections of an object.
+    Returns the kept detections, or None if the object is rejected
+
+    Parameters
+    ---------
+    obj: pandas DataFrame
+        Detections of the object
+
+    n_min: positive integer
+        If given, minimum number of detections on each band of fids
+
+    max_sigma: float
+        If given, only the detections with 0 < sigmapsf_corr_ext < max_sigma
+        are kept
+
+    fids: int python tuple
+        Bands whose detections are counted
+    """
+    if max_sigma is not None:
+        obj = obj[((obj['sigmapsf_corr_ext'] > 0.0) &
+            (obj['sigmapsf_corr_ext'] < max_sigma))]
+    if n_min is not None:
+        fid = obj.fid.values
+        if any((fid == band_fid).sum() < n_min for band_fid in fids):
+            return None
+    return obj
+
+
+def _detections_frame(rows):
+    """
+    Builds the detections DataFrame indexed by oid from the
+    rows returned by the database
+
+    Parameters
+    ---------
+
+    rows: tuple python list
+        Rows with the columns of 'DETECTION_COLUMNS'
+    """
+    return pd.DataFrame(rows, columns=DETECTION_COLUMNS).set_index("oid")
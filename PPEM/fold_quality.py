@@ -0,0 +1,296 @@
+from fractions import Fraction
+import numpy as np
+import pandas as pd
+from PPEM.folding import candidate_periods, fold_collection, detection_segments
+from PPEM.light_curves import light_curve_collection, band_name
+
+SCORE_NAMES = ["Differs", "Ok", "Multiply"]
+
+HALF_SCORE_NAMES = ["Differs", "Ok", "Half", "Multiply"]
+
+
+def score_names(half=False):
+    """
+    Returns the names of the scores in the order of their codes, as
+    used by 'fold_scores_summary'. The null score is the next code
+
+    Parameters
+    ---------
+    half: boolean
+        Condition to score half of the catalog period apart from the
+        other multiples, as done for eclipsing binaries
+    """
+    return list(HALF_SCORE_NAMES if half else SCORE_NAMES)
+
+
+def alias_factors(max_harmonic=3):
+    """
+    Returns the ratios p/q, with p and q up to max_harmonic and
+    different from 1, between an alias and the true period
+    """
+    factors = {Fraction(p, q) for p in range(1, max_harmonic + 1)
+               for q in range(1, max_harmonic + 1)}
+    factors.discard(Fraction(1))
+    return np.array(sorted(float(factor) for factor in factors))
+
+
+def fold_statistics(collection, candidates, n_bins=10):
+    """
+    Computes fold quality statistics of every object and band folded
+    with every candidate period in one vectorized pass. Returns a
+    dictionary of arrays with shape (n_objects, n_bands, n_candidates)
+
+        theta: Phase Dispersion Minimization statistic, variance inside
+            the phase bins over the variance of the band. Close to 0 for
+            a clean fold and close to 1 for noise
+        string_length: Lafler-Kinman string length, sum of the squared
+            differences of consecutive magnitudes in phase over the
+            squared deviations from the mean. Close to 0 for a clean
+            fold and close to 2 for noise
+
+    Parameters
+    ---------
+    collection: light_curve_collection
+        Detections of the objects
+
+    candidates: float numpy array
+        Candidate periods with shape (n_objects, n_bands, n_candidates),
+        see 'folding.candidate_periods'. Missing candidates (NaN) have
+        NaN statistics
+
+    n_bins: positive integer
+        Number of phase bins of the dispersion
+    """
+    n_objs, n_bands, n_cands = candidates.shape
+    n_segments = n_objs * n_bands
+    segments = detection_segments(collection)
+    mag = np.asarray(collection.mag, dtype=np.float64)
+    missing = ~(np.isfinite(candidates) & (candidates > 0))
+    phases = fold_collection(collection, np.where(missing, 1.0, candidates))
+
+    count = np.bincount(segments, minlength=n_segments)
+    mean = np.bincount(segments, mag, n_segments) / np.maximum(count, 1)
+    deviation = mag - mean[segments]
+    squares = np.bincount(segments, deviation**2, n_segments)
+
+    groups = segments + n_segments * np.arange(n_cands)[:, None]
+    bins = (groups * n_bins + np.minimum((phases * n_bins).astype(np.int64), n_bins - 1)).ravel()
+    size = n_cands * n_segments * n_bins
+    bin_count = np.bincount(bins, minlength=size)
+    bin_sum = np.bincount(bins, np.tile(deviation, n_cands), size)
+    bin_squares = np.bincount(bins, np.tile(deviation**2, n_cands), size)
+    used = bin_count > 1
+    within = np.where(used, bin_squares - bin_sum**2 / np.maximum(bin_count, 1), 0.0)
+    within = within.reshape(-1, n_bins).sum(-1)
+    dof = np.where(used, bin_count - 1, 0).reshape(-1, n_bins).sum(-1)
+    variance = np.tile(squares / np.maximum(count - 1, 1), n_cands)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        theta = (within / dof) / variance
+
+    order = np.lexsort((phases.ravel(), groups.ravel()))
+    sorted_groups = groups.ravel()[order]
+    sorted_mag = np.tile(mag, n_cands)[order]
+    same = sorted_groups[1:] == sorted_groups[:-1]
+    steps = np.where(same, np.diff(sorted_mag)**2, 0.0)
+    string = np.bincount(sorted_groups[1:], steps, n_cands * n_segments)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        string_length = string / np.tile(squares, n_cands)
+
+    def shape(values):
+        return np.where(missing, np.nan, np.moveaxis(values.reshape(n_cands, n_objs, n_bands), 0, -1))
+    return {'theta': shape(theta), 'string_length': shape(string_length)}
+
+
+def time_spans(collection):
+    """
+    Returns the time span of the detections of each object [d]
+    """
+    starts = collection.offsets[:, 0]
+    mjd = np.asarray(collection.mjd)
+    return np.maximum.reduceat(mjd, starts) - np.minimum.reduceat(mjd, starts)
+
+
+def phase_drift(periods, catalog_periods, time_span, factor=1.0):
+    """
+    Number of cycles the fold with a period drifts from the fold with
+    factor times the catalog period along the time span. Folds drifting
+    less than a fraction of a cycle look the same, which sets a tolerance
+    that scales with the period and the baseline of each object
+
+    Parameters
+    ---------
+    periods: float numpy array
+        Estimated periods
+
+    catalog_periods: float numpy array
+        Catalog periods, broadcastable to periods
+
+    time_span: float numpy array
+        Time span of the detections, broadcastable to periods
+
+    factor: float
+        Alias factor of the catalog period
+    """
+    return time_span * np.abs(1 / periods - 1 / (factor * catalog_periods))
+
+
+def classify_periods(periods, catalog_periods, time_span, n_points=None, max_drift=1.0,
+                     max_harmonic=3, half=False, min_points=5):
+    """
+    Classifies estimated periods against the catalog period with the
+    codes of the manual inspection: 0 differs, 1 ok, 2 multiply and 3
+    null. With half, 2 is half of the catalog period, 3 multiply and 4
+    null. A period is ok or an alias when its fold drifts less than
+    max_drift cycles from the fold with the catalog period or the alias
+    along the time span, see 'phase_drift'. Missing periods and bands
+    with less than min_points detections are null
+
+    Parameters
+    ---------
+    periods: float numpy array
+        Estimated periods
+
+    catalog_periods, time_span: float numpy array
+        Catalog periods and time spans, broadcastable to periods
+
+    n_points: integer numpy array
+        Number of detections of each band, broadcastable to periods
+
+    max_drift: float
+        Maximum drift in cycles of an equivalent fold
+
+    max_harmonic: positive integer
+        Largest numerator and denominator of the alias factors, see
+        'alias_factors'
+
+    half: boolean
+        Condition to score half of the catalog period apart
+
+    min_points: positive integer
+        Minimum number of detections to score a band
+    """
+    periods = np.asarray(periods, dtype=float)
+    names = score_names(half)
+    codes = np.zeros(np.broadcast(periods, catalog_periods, time_span).shape, dtype=np.int8)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aliases = np.zeros(codes.shape, dtype=bool)
+        for factor in alias_factors(max_harmonic):
+            if half and factor == 0.5:
+                continue
+            aliases |= phase_drift(periods, catalog_periods, time_span, factor) <= max_drift
+        codes[aliases] = names.index("Multiply")
+        if half:
+            codes[phase_drift(periods, catalog_periods, time_span, 0.5) <= max_drift] = names.index("Half")
+        codes[phase_drift(periods, catalog_periods, time_span) <= max_drift] = names.index("Ok")
+    null = ~np.isfinite(periods) | ~np.isfinite(catalog_periods)
+    if n_points is not None:
+        null = null | (np.asarray(n_points) < min_points)
+    codes[null] = len(names)
+    return codes
+
+
+def classify_catalog(theta, theta_alias, max_theta=0.7, margin=0.8):
+    """
+    Scores the catalog period of each object from the dispersion of its
+    fold with the codes of 'summary_source': 1 right when the best band
+    folds cleanly, 2 multiply when it doesn't but the fold with twice or
+    half the period is clean and clearly better, and 0 wrong otherwise
+
+    Parameters
+    ---------
+    theta: float numpy array
+        PDM statistic of each band folded with the catalog period,
+        shape (n_objects, n_bands)
+
+    theta_alias: float numpy array
+        PDM statistic with twice and half the catalog period, shape
+        (n_objects, n_bands, n_aliases)
+
+    max_theta: float
+        Maximum dispersion of a clean fold
+
+    margin: float
+        Ratio between the alias and the catalog dispersion needed to
+        prefer the alias
+    """
+    best = np.nanmin(np.where(np.isfinite(theta), theta, np.nan), axis=1)
+    best_alias = np.nanmin(np.where(np.isfinite(theta_alias), theta_alias, np.nan), axis=(1, 2))
+    codes = np.zeros(len(best), dtype=np.int8)
+    codes[(best_alias <= max_theta) & (best_alias < margin * best)] = 2
+    codes[best <= max_theta] = 1
+    return codes
+
+
+def auto_fold_scores(objs, periods_df, methods, max_drift=1.0, max_harmonic=3, half=False,
+                     n_bins=10, max_theta=0.7, return_statistics=False):
+    """
+    Scores the folded curves of every object and method automatically,
+    replacing the manual inspection. All the objects, bands and methods
+    are folded and scored in one vectorized pass. The result has the
+    format of the fold score spreadsheets: indexed by oid with the
+    'catalog' score and one '<method>_<band>' column per method and band,
+    ready for 'fold_scores_summary' with 'score_names(half)'
+
+    Parameters
+    ---------
+    objs: pandas DataFrame or light_curve_collection
+        Detections of the objects. All of them are used in the folds
+
+    periods_df: pandas DataFrame
+        Tags and estimations of the objects indexed by oid, as returned
+        by 'periodic_stars.compute_periods'. Multi band periods are
+        scored on each band
+
+    methods: string python list
+        Methods to be scored
+
+    max_drift, max_harmonic, half:
+        Classification of the periods, see 'classify_periods'
+
+    n_bins: positive integer
+        Number of phase bins of the dispersion, see 'fold_statistics'
+
+    max_theta: float
+        Maximum dispersion of a clean catalog fold, see 'classify_catalog'
+
+    return_statistics: boolean
+        Condition to also return a long DataFrame with the period
+        ratio, phase drift and fold statistics of each object, band
+        and candidate
+    """
+    if not isinstance(objs, light_curve_collection):
+        objs = light_curve_collection.from_dataframe(objs)
+    collection = objs[[oid for oid in periods_df.index if oid in objs]]
+    periods_df = periods_df.loc[collection.oids]
+    catalog_periods = periods_df.period.to_numpy(dtype=float)
+    candidates, names = candidate_periods(periods_df, methods, collection.fids)
+    candidates = np.concatenate([candidates, catalog_periods[:, None, None] * [[[2.0, 0.5]]]
+                                 * np.ones((1, len(collection.fids), 1))], axis=-1)
+    statistics = fold_statistics(collection, candidates, n_bins)
+    time_span = time_spans(collection)[:, None, None]
+    n_points = np.diff(collection.offsets, axis=1)[:, :, None]
+
+    method_periods = candidates[:, :, 1:len(names)]
+    codes = classify_periods(method_periods, catalog_periods[:, None, None], time_span,
+                             n_points, max_drift, max_harmonic, half)
+    catalog = classify_catalog(statistics['theta'][:, :, 0], statistics['theta'][:, :, len(names):],
+                               max_theta)
+    columns = {'catalog': catalog}
+    for method_idx, method in enumerate(methods):
+        for band_idx, band_fid in enumerate(collection.fids):
+            columns[f'{method}_{band_name(band_fid)}'] = codes[:, band_idx, method_idx]
+    scores = pd.DataFrame(columns, index=pd.Index(collection.oids, name='oid'))
+    if not return_statistics:
+        return scores
+
+    index = pd.MultiIndex.from_product(
+        [collection.oids, [band_name(band_fid) for band_fid in collection.fids],
+         names + ['catalog_x2', 'catalog_x0.5']], names=['oid', 'band', 'candidate'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        details = pd.DataFrame({
+            'period': candidates.ravel(),
+            'ratio': (candidates / catalog_periods[:, None, None]).ravel(),
+            'drift': phase_drift(candidates, catalog_periods[:, None, None], time_span).ravel(),
+            'theta': statistics['theta'].ravel(),
+            'string_length': statistics['string_length'].ravel()}, index=index)
+    return scores, details
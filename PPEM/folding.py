@@ -0,0 +1,229 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.ticker import MaxNLocator
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from PPEM.light_curves import light_curve_collection, band_name
+
+BAND_COLORS = {1: 'green', 2: 'red'}
+
+PANEL_GAP = 0.15
+
+
+def fold_phases(mjd, periods):
+    """
+    Phase in [0, 1) of the time instants folded with each period, with
+    shape (n_periods, n_detections). The periods can also be given per
+    detection with shape (n_periods, n_detections)
+
+    Parameters
+    ---------
+    mjd: float numpy array
+        Time instants of the detections
+
+    periods: float numpy array
+        Periods used to fold the curve [d]
+    """
+    periods = np.asarray(periods, dtype=float)
+    if periods.ndim == 1:
+        periods = periods[:, None]
+    return np.mod(mjd, periods) / periods
+
+
+def candidate_periods(periods_df, methods, fids=(1, 2), catalog=True):
+    """
+    Returns the candidate periods of each object and band as an array
+    of shape (n_objects, n_bands, n_candidates) and the names of the
+    candidates. The candidates are the catalog 'period' and the period
+    of each method, using the '<method>_T_g/_r' columns of single band
+    estimations or the '<method>_T' column of multi band ones
+
+    Parameters
+    ---------
+    periods_df: pandas DataFrame
+        Tags and estimations of the objects, as returned by
+        'periodic_stars.compute_periods'
+
+    methods: string python list
+        Methods whose periods are used
+
+    fids: int python tuple
+        Band identifiers, in order
+
+    catalog: boolean
+        Condition to include the catalog period as first candidate
+    """
+    names = (['catalog'] if catalog else []) + list(methods)
+    candidates = np.empty((len(periods_df), len(fids), len(names)))
+    for band_idx, band_fid in enumerate(fids):
+        columns = ['period'] if catalog else []
+        for method in methods:
+            band_column = f'{method}_T_{band_name(band_fid)}'
+            columns.append(band_column if band_column in periods_df else f'{method}_T')
+        candidates[:, band_idx] = periods_df[columns].to_numpy(dtype=float)
+    return candidates, names
+
+
+def detection_segments(collection):
+    """
+    Returns the segment of each detection of a light_curve_collection,
+    object position * n_bands + band position, which indexes the
+    flattened (n_objects, n_bands) arrays
+    """
+    counts = np.diff(collection.offsets, axis=1)
+    return np.repeat(np.arange(counts.size), counts.ravel())
+
+
+def fold_collection(collection, candidates):
+    """
+    Folds every detection of a light_curve_collection with every
+    candidate period of its object and band in one vectorized pass.
+    Returns the phases with shape (n_candidates, n_detections), aligned
+    with the arrays of the collection
+
+    Parameters
+    ---------
+    collection: light_curve_collection
+        Detections of the objects
+
+    candidates: float numpy array
+        Candidate periods with shape (n_objects, n_bands, n_candidates)
+        in the order of the objects and bands of the collection, see
+        'candidate_periods'
+    """
+    segments = detection_segments(collection)
+    return fold_phases(collection.mjd, candidates.reshape(-1, candidates.shape[-1])[segments].T)
+
+
+def _render_pages(collection, candidates, names, catalog_periods, pages, file, fmt, panel_size):
+    """
+    Renders pages of folded curves, each one a list of object positions,
+    with the Agg canvas. Every object is a single axes where the curves
+    folded with each candidate are placed side by side, shifted by one
+    phase unit plus a gap, so each band is drawn with one call for all
+    the candidates. PDF pages go to a single multi-page file and other
+    formats to one file per page. Returns the written files
+    """
+    phases = fold_collection(collection, candidates)
+    shift = 1 + PANEL_GAP
+    shifted = phases + shift * np.arange(len(names))[:, None]
+    written = []
+    pdf = PdfPages(file) if fmt == 'pdf' else None
+    try:
+        for page_idx, page in enumerate(pages):
+            fig = Figure(figsize=(panel_size[0] * len(names), panel_size[1] * max(len(page), 1)))
+            FigureCanvasAgg(fig)
+            axes = fig.subplots(max(len(page), 1), 1, squeeze=False)[:, 0]
+            fig.subplots_adjust(left=0.04, right=0.99, bottom=0.05, top=0.97, hspace=0.35)
+            for ax, obj_idx in zip(axes, page):
+                for band_idx, band_fid in enumerate(collection.fids):
+                    start, end = collection.offsets[obj_idx, band_idx:band_idx + 2]
+                    x = shifted[:, start:end].ravel()
+                    mag = np.tile(collection.mag[start:end], len(names))
+                    err = np.tile(collection.err[start:end], len(names))
+                    color = BAND_COLORS.get(band_fid)
+                    ax.vlines(x, mag - err, mag + err, color=color, lw=0.5, rasterized=True)
+                    ax.plot(x, mag, '.', ms=3, color=color, rasterized=True)
+                for col, name in enumerate(names):
+                    periods = ", ".join(f"{period:0.5f}" for period in candidates[obj_idx, :, col])
+                    ax.text(col * shift + 0.5, 1.01, f'{name} [{periods}] d', fontsize=7,
+                            ha='center', va='bottom', transform=ax.get_xaxis_transform())
+                    if col:
+                        ax.axvline(col * shift - PANEL_GAP / 2, color='gray', lw=0.5)
+                ax.set_xlim(-PANEL_GAP / 2, len(names) * shift - PANEL_GAP / 2)
+                ax.set_xticks((shift * np.arange(len(names))[:, None] + [0, 0.5, 1]).ravel())
+                ax.set_xticklabels(['0', '0.5', '1'] * len(names))
+                ax.yaxis.set_major_locator(MaxNLocator(4))
+                ax.tick_params(labelsize=6)
+                ax.invert_yaxis()
+                label = collection.oids[obj_idx]
+                if catalog_periods is not None:
+                    label += f'\nP = {catalog_periods[obj_idx]:0.5f} d'
+                ax.set_ylabel(label, fontsize=7)
+            if pdf is not None:
+                pdf.savefig(fig)
+            else:
+                page_file = f'{os.path.splitext(file)[0]}_{page_idx:04d}.{fmt}'
+                fig.savefig(page_file)
+                written.append(page_file)
+    finally:
+        if pdf is not None:
+            pdf.close()
+            written.append(file)
+    return written
+
+
+def render_folded_curves(objs, periods_df, methods, path, objs_per_page=6, n_jobs=1,
+                         fmt='pdf', catalog=True, panel_size=(3.0, 2.2)):
+    """
+    Renders the folded curves of many objects with the catalog period
+    and the period of each method side by side, as inspection sheets
+    written to files. Each page has one row per object with the curve
+    folded with each candidate side by side and the bands overlaid. The phases of all
+    the objects and candidates are computed in one vectorized pass and
+    the pages are drawn with the non interactive Agg canvas, optionally
+    in parallel workers. Returns the list of written files
+
+    Parameters
+    ---------
+    objs: pandas DataFrame or light_curve_collection
+        Detections of the objects
+
+    periods_df: pandas DataFrame
+        Tags and estimations of the objects indexed by oid, as returned
+        by 'periodic_stars.compute_periods'. Only its objects are rendered
+
+    methods: string python list
+        Methods whose periods are rendered
+
+    path: string
+        Directory where the files are written
+
+    objs_per_page: positive integer
+        Number of objects of each page
+
+    n_jobs: positive integer
+        Number of worker processes. Each one renders a contiguous
+        range of pages into its own file
+
+    fmt: string
+        'pdf' writes multi-page files, other formats supported by
+        matplotlib ('png', 'svg') write one file per page
+
+    catalog: boolean
+        Condition to include the catalog period as first candidate
+
+    panel_size: float python tuple
+        Size (width, height) of each panel [in]
+    """
+    if not isinstance(objs, light_curve_collection):
+        objs = light_curve_collection.from_dataframe(objs)
+    collection = objs[[oid for oid in periods_df.index if oid in objs]]
+    periods_df = periods_df.loc[collection.oids]
+    candidates, names = candidate_periods(periods_df, methods, collection.fids, catalog)
+    catalog_periods = periods_df.period.to_numpy(dtype=float) if 'period' in periods_df else None
+    os.makedirs(path, exist_ok=True)
+
+    positions = np.arange(len(collection))
+    pages = [positions[i:i + objs_per_page].tolist() for i in range(0, len(positions), objs_per_page)]
+    n_files = max(1, min(n_jobs, len(pages)))
+    groups = [list(group) for group in np.array_split(np.arange(len(pages)), n_files)]
+    jobs = []
+    for file_idx, group in enumerate(groups):
+        group_pages = [pages[idx] for idx in group]
+        group_positions = [position for page in group_pages for position in page]
+        first = group_positions[0] if group_positions else 0
+        local_pages = [[position - first for position in page] for page in group_pages]
+        span = slice(first, first + len(group_positions))
+        name = 'folded_curves' if n_files == 1 else f'folded_curves_{file_idx:03d}'
+        jobs.append((collection[list(collection.oids[span])], candidates[span], names,
+                     None if catalog_periods is None else catalog_periods[span],
+                     local_pages, os.path.join(path, f'{name}.{fmt}'), fmt, panel_size))
+    if n_jobs == 1:
+        written = [_render_pages(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            written = list(pool.map(_render_pages, *zip(*jobs)))
+    return [file for files in written for file in files]
@@ -0,0 +1,257 @@
+import numpy as np
+from PPEM.profiling import stage_timer
+
+
+class frequency_grid:
+
+    def __init__(self, fmin=1e-3, fmax=20.0, fresolution=1e-3, log_period_spacing=True,
+                 finetune_resolution=1e-4, n_local_optima=10,
+                 search='exhaustive', top_k=10, coarse_factor=1.25):
+        """
+        Trial frequencies of the periodograms. The grid is defined once
+        and shared by every object, band and method, instead of being
+        hardcoded inside the estimation
+
+        Parameters
+        ---------
+        fmin: float
+            Minimum trial frequency [1/d]
+
+        fmax: float
+            Maximum trial frequency [1/d]
+
+        fresolution: float
+            Step of the coarse sweep [1/d]
+
+        log_period_spacing: boolean
+            Condition to space the coarse trials uniformly on the
+            logarithm of the period instead of on the frequency
+
+        finetune_resolution: float
+            Step used to refine the best local optima [1/d]
+
+        n_local_optima: positive integer
+            Number of local optima of the coarse sweep to be refined
+
+        search: {'exhaustive', 'adaptive'}
+            Search mode of the periodogram
+
+            exhaustive: sweeps all the grid with fresolution and refines
+                the best n_local_optima
+            adaptive: sweeps the grid with a coarse step scaled to the
+                time span T of the light curve, coarse_factor/T, and
+                refines only the best top_k peaks
+
+        top_k: positive integer
+            Number of peaks of the coarse sweep refined by the adaptive
+            search
+
+        coarse_factor: float
+            Coarse step of the adaptive search in units of 1/T. The
+            periodogram peaks have a width of about 1/T, so larger
+            factors miss more of them. The step is never finer than
+            fresolution, which ZTF light curves spanning ~1000 d already
+            reach with a factor of 1. On the bundled samples 1.25 saves
+            ~18% of the trials within 3 points of the hit rate of the
+            exhaustive search, while 2 halves the trials but loses a
+            third of the hits, see 'benchmark.benchmark_search_modes'
+        """
+        self.fmin = fmin
+        self.fmax = fmax
+        self.fresolution = fresolution
+        self.log_period_spacing = log_period_spacing
+        self.finetune_resolution = finetune_resolution
+        self.n_local_optima = n_local_optima
+        self.search = search
+        self.top_k = top_k
+        self.coarse_factor = coarse_factor
+        self._frequencies = None
+
+
+    def __repr__(self):
+        settings = ", ".join(f"{key}={value}" for key, value in self.settings().items())
+        return f"frequency_grid({settings})"
+
+
+    def __eq__(self, other):
+        return isinstance(other, frequency_grid) and self.settings() == other.settings()
+
+
+    def __hash__(self):
+        return hash(tuple(self.settings().items()))
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_frequencies'] = None
+        return state
+
+
+    def settings(self):
+        """
+        Returns the parameters of the grid as a dictionary. The
+        parameters of the adaptive search are only included when
+        it's used
+        """
+        settings = {'fmin': self.fmin,
+                    'fmax': self.fmax,
+                    'fresolution': self.fresolution,
+                    'log_period_spacing': self.log_period_spacing,
+                    'finetune_resolution': self.finetune_resolution,
+                    'n_local_optima': self.n_local_optima}
+        if self.search != 'exhaustive':
+            settings.update({'search': self.search,
+                             'top_k': self.top_k,
+                             'coarse_factor': self.coarse_factor})
+        return settings
+
+
+    def exhaustive(self):
+        """
+        Returns the grid with the same trial frequencies and fine
+        tuning but swept exhaustively, as the numpy backend does
+        """
+        return frequency_grid(**dict(self.settings(), search='exhaustive'))
+
+
+    @property
+    def n_trials(self):
+        """
+        Number of trial frequencies of the coarse sweep
+        """
+        return int(np.ceil((self.fmax - self.fmin) / self.fresolution))
+
+
+    @property
+    def frequencies(self):
+        """
+        Trial frequencies of the coarse sweep in ascending order. They
+        are computed on the first access and reused afterwards. With
+        log_period_spacing the same number of trials is distributed
+        uniformly on the logarithm of the period
+        """
+        if self._frequencies is None:
+            if self.log_period_spacing:
+                periods = np.geomspace(1 / self.fmin, 1 / self.fmax, self.n_trials)
+                self._frequencies = 1 / periods
+            else:
+                self._frequencies = self.fmin + self.fresolution * np.arange(self.n_trials)
+        return self._frequencies
+
+
+    def evaluate(self, my_per, mjd=None, timer=None):
+        """
+        Runs the sweep and the fine tuning of a P4J periodogram with
+        the data already set, following the search mode of the grid.
+        Returns the number of trial frequencies evaluated
+
+        Parameters
+        ---------
+        my_per: P4J periodogram or MultiBandPeriodogram
+            Periodogram to be evaluated
+
+        mjd: float numpy array
+            Time instants of the light curve. Required by the
+            adaptive search to scale the coarse step
+
+        timer: stage_timer object
+            If given, the 'sweep' and 'finetune' stages are timed on it
+        """
+        if timer is None:
+            timer = stage_timer()
+        if self.search == 'adaptive':
+            return self._adaptive_evaluate(my_per, mjd, timer)
+        with timer.stage('sweep'):
+            my_per.frequency_grid_evaluation(fmin=self.fmin, fmax=self.fmax,
+                                             fresolution=self.fresolution,
+                                             log_period_spacing=self.log_period_spacing)
+        _check_local_optima(my_per, self.n_local_optima)
+        with timer.stage('finetune'):
+            my_per.finetune_best_frequencies(fresolution=self.finetune_resolution,
+                                             n_local_optima=self.n_local_optima)
+        return self.n_trials + self.n_local_optima * self._finetune_trials(self.fresolution)
+
+
+    def coarse_resolution(self, mjd):
+        """
+        Returns the step of the coarse sweep of the adaptive search
+        for a light curve. It's never finer than the exhaustive step
+
+        Parameters
+        ---------
+        mjd: float numpy array
+            Time instants of the light curve
+        """
+        time_span = np.ptp(mjd)
+        if time_span <= 0:
+            return self.fresolution
+        return max(self.fresolution, self.coarse_factor / time_span)
+
+
+    def _adaptive_evaluate(self, my_per, mjd, timer):
+        """
+        Coarse to fine search: evaluates a linear grid with the coarse
+        resolution of the light curve and refines the best top_k peaks
+        with finetune_resolution. Returns the number of trial
+        frequencies evaluated
+        """
+        if mjd is None:
+            raise ValueError("The adaptive search needs the time instants of the light curve")
+        fresolution = self.coarse_resolution(mjd)
+        with timer.stage('sweep'):
+            my_per.frequency_grid_evaluation(fmin=self.fmin, fmax=self.fmax,
+                                             fresolution=fresolution,
+                                             log_period_spacing=False)
+        _check_local_optima(my_per, self.top_k)
+        with timer.stage('finetune'):
+            my_per.finetune_best_frequencies(fresolution=self.finetune_resolution,
+                                             n_local_optima=self.top_k)
+        n_coarse = int(np.ceil((self.fmax - self.fmin) / fresolution))
+        return n_coarse + self.top_k * self._finetune_trials(fresolution)
+
+
+    def _finetune_trials(self, fresolution):
+        """
+        Number of trials evaluated around each refined local optimum
+        """
+        return int(np.ceil(2 * fresolution / self.finetune_resolution))
+
+
+def _check_local_optima(my_per, n_local_optima):
+    """
+    Raises a ValueError if the swept periodogram has less than
+    n_local_optima local maxima to fine tune, as P4J would fail
+    without telling why, e.g. on light curves with very few detections
+    """
+    per = my_per.per
+    n_found = int(np.sum((per[1:-1] > per[:-2]) & (per[1:-1] > per[2:])))
+    if n_found < n_local_optima:
+        raise ValueError(f"The periodogram has {n_found} local maxima, {n_local_optima} "
+                         "are needed to fine tune it")
+
+
+DEFAULT_GRID = frequency_grid()
+
+ADAPTIVE_GRID = frequency_grid(search='adaptive')
+
+CLASS_GRIDS = {
+    'RRL': frequency_grid(fmin=0.25, fmax=10.0),
+    'DSCT': frequency_grid(fmin=1.0, fmax=20.0),
+    'Ceph': frequency_grid(fmin=1e-3, fmax=5.0),
+    'LPV': frequency_grid(fmin=1e-3, fmax=1.0),
+}
+
+
+def class_grid(obj_class):
+    """
+    Returns the frequency grid adapted to the periods a class of
+    periodic variable star can have. Short period classes skip the
+    low frequencies and long period classes skip the high ones. Classes
+    without a specific grid use 'DEFAULT_GRID'
+
+    Parameters
+    ---------
+    obj_class: {'RRL', 'Ceph', 'LPV', 'DSCT', 'EB/EW'}
+        Periodic variable star type to be considered
+    """
+    return CLASS_GRIDS.get(obj_class, DEFAULT_GRID)
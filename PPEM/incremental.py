@@ -0,0 +1,378 @@
+import os
+import json
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from PPEM.frequency_grid import frequency_grid, DEFAULT_GRID
+from PPEM.batch_periodogram import (_STATISTICS, _phase, pad_light_curves, refine_periods,
+                                    band_groups)
+from PPEM.light_curves import ARRAYS, object_ids, select_objects, band_name
+from PPEM.period_estimation import prepare_bands, method_columns
+from PPEM.profiling import stage_timer
+
+INCREMENTAL_METHODS = ['MHAOV', 'PDM1']
+
+N_BINS = 8
+
+
+class incremental_periodogram:
+
+    def __init__(self, method, grid=None):
+        """
+        Periodogram of a light curve kept as sufficient statistics over
+        the coarse trial frequencies, so appending detections updates it
+        in O(new detections x trial frequencies) instead of evaluating
+        the whole curve again. The statistics are the ones of the
+        vectorized engine of 'batch_periodogram', accumulated over the
+        magnitudes relative to the first weighted mean:
+
+            MHAOV: weighted sums of the one harmonic basis and of its
+                products with the magnitudes, see '_mhaov_statistic'
+            PDM1: weighted moments of the magnitudes inside each of
+                the 8 phase bins, see '_pdm_statistic'
+
+        The detections are kept too, to refine the best optima over the
+        fine grid, see 'incremental_period'. The grid is always swept
+        exhaustively
+
+        Parameters
+        ---------
+        method: {'MHAOV', 'PDM1'}
+            Statistic of the periodogram, see 'INCREMENTAL_METHODS'
+
+        grid: frequency_grid object
+            Trial frequencies and fine tuning of the periodogram. By
+            default 'DEFAULT_GRID' is used
+        """
+        if method not in INCREMENTAL_METHODS:
+            raise ValueError(f"Method {method} has no incremental periodogram, use one of "
+                             f"{INCREMENTAL_METHODS}")
+        self.method = method
+        self.grid = grid if grid is not None else DEFAULT_GRID
+        n_freqs = len(self.grid.frequencies)
+        self.mjd = np.empty(0, dtype=ARRAYS['mjd'])
+        self.mag = np.empty(0, dtype=ARRAYS['mag'])
+        self.err = np.empty(0, dtype=ARRAYS['err'])
+        self.mag_ref = np.nan
+        self.totals = np.zeros(4)
+        if method == 'MHAOV':
+            self.sums = np.zeros((6, n_freqs))
+        else:
+            self.sums = np.zeros((n_freqs, N_BINS, 4))
+            self.counts = np.zeros((n_freqs, N_BINS), dtype=np.int32)
+
+
+    def __len__(self):
+        return len(self.mjd)
+
+
+    @property
+    def last_mjd(self):
+        """
+        Time of the latest detection, -inf if there's none
+        """
+        return self.mjd.max() if len(self.mjd) else -np.inf
+
+
+    def update(self, mjd, mag, err, max_elements=2**22):
+        """
+        Appends detections to the light curve and adds their
+        contribution to the statistics of every trial frequency
+
+        Parameters
+        ---------
+        mjd, mag, err: float numpy arrays
+            Time instants, magnitudes and errors of the new detections
+
+        max_elements: positive integer
+            Maximum size of the temporary arrays
+        """
+        mjd = np.asarray(mjd, dtype=np.float64)
+        if len(mjd) == 0:
+            return self
+        mag = np.asarray(mag, dtype=np.float64)
+        w = 1 / np.asarray(err, dtype=np.float64)**2
+        if np.isnan(self.mag_ref):
+            self.mag_ref = (w * mag).sum() / w.sum()
+        y = mag - self.mag_ref
+        self.totals += [w.sum(), (w * y).sum(), (w * y**2).sum(), (w**2).sum()]
+
+        freqs = self.grid.frequencies
+        chunk = max(1, max_elements // len(mjd))
+        for start in range(0, len(freqs), chunk):
+            phase = _phase(mjd[None], freqs[None, start:start + chunk])[0]
+            if self.method == 'MHAOV':
+                arg = 2 * np.pi * phase
+                c, s = np.cos(arg), np.sin(arg)
+                self.sums[:, start:start + chunk] += [c @ w, s @ w, c @ (w * y), s @ (w * y),
+                                                      (c * c) @ w, (c * s) @ w]
+            else:
+                n_chunk = phase.shape[0]
+                bins = (phase * N_BINS).astype(np.int64) + N_BINS * np.arange(n_chunk)[:, None]
+                bins = bins.ravel()
+                size = n_chunk * N_BINS
+                moments = [np.bincount(bins, np.tile(values, n_chunk), size)
+                           for values in [w, w * y, w * y**2, w**2]]
+                self.sums[start:start + chunk] += np.stack(moments, -1).reshape(n_chunk, N_BINS, 4)
+                self.counts[start:start + chunk] += np.bincount(bins, minlength=size).reshape(
+                    n_chunk, N_BINS).astype(np.int32)
+
+        self.mjd = np.concatenate([self.mjd, mjd.astype(ARRAYS['mjd'])])
+        self.mag = np.concatenate([self.mag, mag.astype(ARRAYS['mag'])])
+        self.err = np.concatenate([self.err, np.asarray(err, dtype=ARRAYS['err'])])
+        return self
+
+
+    def statistic(self):
+        """
+        Returns the sums of the statistic over the trial frequencies,
+        with the layout of '_STATISTICS', so the periodograms of several
+        bands can be pooled by adding them
+        """
+        S, WY, WY2, W2 = self.totals
+        wvar = WY2 - WY**2 / S
+        if self.method == 'MHAOV':
+            C, Sn, WYC, WYS, CC, CS = self.sums
+            YC = WYC - WY / S * C
+            YS = WYS - WY / S * Sn
+            SS = S - CC - Sn**2 / S
+            CC = CC - C**2 / S
+            CS = CS - C * Sn / S
+            aov = (SS * YC**2 - 2 * CS * YC * YS + CC * YS**2) / (CC * SS - CS**2)
+            return np.array([[(len(self) - 3) / 2]]), aov[None], np.array([[wvar]])
+        V1, S1, S2, V2 = np.moveaxis(self.sums, -1, 0)
+        used = self.counts > 2
+        V1 = np.where(used, V1, 1.0)
+        num = np.where(used, S2 - S1**2 / V1, 0.0).sum(-1)
+        den = np.where(used, V1 - V2 / V1, 0.0).sum(-1)
+        return num[None], den[None], np.array([[wvar]]), np.array([[S - W2 / S]])
+
+
+    def periodogram(self):
+        """
+        Returns the periodogram over the coarse trial frequencies, with
+        larger values being better as in 'batch_periodogram'
+        """
+        return incremental_periodogram_values([self])[0]
+
+
+    def get_period(self, timer=None):
+        """
+        Returns the (period, elapsed time) of the light curve, see
+        'incremental_period'
+        """
+        return incremental_period([self], timer=timer)
+
+
+    def save(self, path):
+        """
+        Writes the state to a compressed '.npz' file. The file is
+        written to a temporary name and then renamed, so an interrupted
+        update never leaves a partial state
+        """
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        arrays = {'mjd': self.mjd, 'mag': self.mag, 'err': self.err, 'sums': self.sums,
+                  'totals': self.totals, 'mag_ref': np.array(self.mag_ref),
+                  'settings': np.array(json.dumps({'method': self.method,
+                                                   'grid': self.grid.settings()}))}
+        if self.method != 'MHAOV':
+            arrays['counts'] = self.counts
+        fd, tmp_file = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_file, path)
+
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a state written by 'save'
+        """
+        with np.load(path) as data:
+            settings = json.loads(str(data['settings']))
+            state = cls.__new__(cls)
+            state.method = settings['method']
+            state.grid = frequency_grid(**settings['grid'])
+            for name in ['mjd', 'mag', 'err', 'sums', 'totals', 'counts']:
+                if name in data:
+                    setattr(state, name, data[name])
+            state.mag_ref = float(data['mag_ref'])
+        return state
+
+
+def incremental_periodogram_values(states):
+    """
+    Periodogram over the coarse trial frequencies of one light curve or,
+    with several states, the multi band periodogram pooling their sums
+    as 'batch_periodogram' does. Empty states are left out. Returns an
+    array of shape (1, n_freqs)
+    """
+    states = [state for state in states if len(state)]
+    _, combine = _STATISTICS[states[0].method]
+    sums = [sum(terms) for terms in zip(*[state.statistic() for state in states])]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nan_to_num(combine(*sums), nan=-np.inf)
+
+
+def incremental_period(states, max_elements=2**22, timer=None):
+    """
+    Computes the period of one light curve, or the multi band period of
+    several bands of an object, from their incremental periodograms.
+    The coarse periodogram comes from the accumulated statistics and
+    only the best local optima are refined with the detections, see
+    'batch_periodogram.refine_periods'. Returns (period, elapsed time)
+    with the contract of 'get_period'
+
+    Parameters
+    ---------
+    states: incremental_periodogram python list
+        States of the bands, with the same method and grid
+
+    max_elements: positive integer
+        Maximum size of the temporary arrays
+
+    timer: stage_timer object
+        If given, the 'sweep', 'finetune' and 'best' stages are timed
+        on it
+    """
+    if timer is None:
+        timer = stage_timer()
+    states = [state for state in states if len(state)]
+    if not states:
+        return np.nan, np.nan
+    start = time.perf_counter()
+    with timer.stage('sweep'):
+        per = incremental_periodogram_values(states)
+    mjd, mag, err, mask = pad_light_curves([(state.mjd, state.mag, state.err) for state in states])
+    groups = band_groups([len(states)]) if len(states) > 1 else None
+    grid = states[0].grid
+    period = refine_periods(states[0].method, per, grid.frequencies, grid, mjd, mag, err, mask,
+                            max_elements, timer, groups)[0]
+    return float(period), time.perf_counter() - start
+
+
+class incremental_store:
+
+    def __init__(self, path, methods, grid=None, fids=(1, 2)):
+        """
+        On disk store of the incremental periodograms of many objects,
+        usually kept next to the light curves, e.g. in a 'periodograms'
+        directory inside a light_curve_collection directory. Each object,
+        method and band has its own state file, so updating an object
+        only reads and writes its own states. See 'update'
+
+        Parameters
+        ---------
+        path: string
+            Directory of the store. It's created if it doesn't exist
+
+        methods: string python list
+            Methods of the store, see 'INCREMENTAL_METHODS'
+
+        grid: frequency_grid object
+            Trial frequencies of the periodograms. By default
+            'DEFAULT_GRID' is used. An existing store must be opened
+            with the grid it was created with
+
+        fids: int python tuple
+            Band identifiers of the states, in order
+        """
+        unavailable = [method for method in methods if method not in INCREMENTAL_METHODS]
+        if unavailable:
+            raise ValueError(f"Methods {unavailable} have no incremental periodogram, use "
+                             f"{INCREMENTAL_METHODS}")
+        self.path = path
+        self.methods = list(methods)
+        self.grid = grid if grid is not None else DEFAULT_GRID
+        self.fids = tuple(fids)
+        config_file = os.path.join(path, 'store.json')
+        if os.path.exists(config_file):
+            with open(config_file) as f:
+                config = json.load(f)
+            if config['grid'] != self.grid.settings():
+                raise ValueError(f"The store at {path} was created with the grid {config['grid']}")
+        else:
+            os.makedirs(path, exist_ok=True)
+            with open(config_file, 'w') as f:
+                json.dump({'grid': self.grid.settings()}, f)
+
+
+    def _file(self, oid, method, band_fid):
+        return os.path.join(self.path, str(oid), f"{method}_{band_name(band_fid)}.npz")
+
+
+    def state(self, oid, method, band_fid):
+        """
+        Returns the state of an object, method and band, empty if it
+        has not been stored yet
+        """
+        file = self._file(oid, method, band_fid)
+        if os.path.exists(file):
+            return incremental_periodogram.load(file)
+        return incremental_periodogram(method, self.grid)
+
+
+    def update(self, objs, multiband=False):
+        """
+        Adds the detections of the objects to their stored periodograms
+        and returns their periods. Only the detections later than the
+        latest one of each stored band are added, so the whole light
+        curves can be passed each time and the cost scales with the new
+        detections. Detections not stored yet but earlier than the
+        latest stored one can't be added to the statistics and are left
+        out: their number by oid is kept in the 'rejected' entry of the
+        'attrs' of the result and reported. The result has the same
+        columns as 'multi_method_estimation', with the number of
+        detections of each band accumulated in the state and the time
+        of the update and estimation
+
+        Parameters
+        ---------
+        objs: pandas DataFrame or light_curve_collection
+            Detections of the objects, indexed by oid
+
+        multiband: boolean
+            Condition to choose if the period is computed for each band
+            (single band) or pooling the bands (multi band)
+        """
+        rows = []
+        rejected = {}
+        for oid in object_ids(objs):
+            bands = prepare_bands(select_objects(objs, oid), fids=self.fids)
+            row = [oid]
+            for method_idx, method in enumerate(self.methods):
+                states = []
+                comp_time = []
+                for band_fid, (mjd, mag, err) in zip(self.fids, bands):
+                    start = time.perf_counter()
+                    state = self.state(oid, method, band_fid)
+                    new = mjd > state.last_mjd
+                    if method_idx == 0:
+                        late = np.sum(~new & ~np.isin(mjd, state.mjd))
+                        if late:
+                            rejected[oid] = rejected.get(oid, 0) + int(late)
+                    if new.any():
+                        state.update(mjd[new], mag[new], err[new])
+                        state.save(self._file(oid, method, band_fid))
+                    states.append(state)
+                    comp_time.append(time.perf_counter() - start)
+                if multiband:
+                    fbest, p_time = incremental_period(states)
+                    fbest, comp_time = [fbest], [p_time + sum(comp_time)]
+                else:
+                    estimations = [incremental_period([state]) for state in states]
+                    fbest = [period for period, _ in estimations]
+                    comp_time = [band_time + p_time
+                                 for band_time, (_, p_time) in zip(comp_time, estimations)]
+                row += [len(state) for state in states] + comp_time + fbest
+            rows.append(row)
+        columns = [column for method in self.methods
+                   for column in method_columns(method, multiband, self.fids)]
+        result = pd.DataFrame(rows, columns=['oid'] + columns).set_index('oid')
+        result.attrs['rejected'] = rejected
+        if rejected:
+            print(f"{sum(rejected.values())} detections of {len(rejected)} objects are earlier "
+                  "than the stored ones and were left out")
+        return result
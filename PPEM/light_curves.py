@@ -0,0 +1,283 @@
+import os
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+light_curve = namedtuple('light_curve', ['mjd', 'mag', 'err', 'fid'])
+
+ARRAYS = {'mjd': np.float64, 'mag': np.float32, 'err': np.float32, 'fid': np.int8}
+
+BAND_NAMES = {1: 'g', 2: 'r', 3: 'i'}
+
+
+def band_name(band_fid):
+    """
+    Returns the name of a band identifier used in the column names,
+    the identifier itself for unknown bands
+    """
+    return BAND_NAMES.get(int(band_fid), str(band_fid))
+
+
+class light_curve_collection:
+
+    def __init__(self, oids, offsets, mjd, mag, err, fid, fids=(1, 2)):
+        """
+        Compact container of the light curves of multiple objects. The
+        detections of all the objects are stored in contiguous arrays,
+        grouped by object and by band keeping their original order, and
+        an offset table marks where each object and band starts. Objects
+        and bands are returned as views of the arrays, which can be
+        memory mapped from disk, see 'save' and 'load'
+
+        Parameters
+        ---------
+        oids: string numpy array
+            oid of each object, in order
+
+        offsets: integer numpy array
+            Table with shape (n_objects, n_bands + 1). The detections of
+            the band j of the object i are in [offsets[i, j], offsets[i, j+1])
+
+        mjd: float64 numpy array
+            Time instants of the detections
+
+        mag: float32 numpy array
+            Corrected magnitudes of the detections
+
+        err: float32 numpy array
+            Errors of the corrected magnitudes
+
+        fid: int8 numpy array
+            Band identifier of the detections
+
+        fids: int python tuple
+            Band identifiers of the columns of the offset table
+        """
+        self.oids = oids
+        self.offsets = offsets
+        self.mjd = mjd
+        self.mag = mag
+        self.err = err
+        self.fid = fid
+        self.fids = tuple(int(band_fid) for band_fid in fids)
+        self._positions = None
+
+
+    @classmethod
+    def from_dataframe(cls, objs_df, fids=(1, 2), mag='magpsf_corr', err='sigmapsf_corr_ext'):
+        """
+        Builds the collection from a DataFrame of detections indexed by
+        oid, as returned by 'periodic_stars.get_objects'. Only the
+        columns used for the estimation are kept and the detections of
+        other bands are dropped
+
+        Parameters
+        ---------
+        objs_df: pandas DataFrame
+            DataFrame containing the detection data of multiple
+            objects
+
+        fids: int python tuple
+            Band identifiers to be stored, in order
+
+        mag: string
+            Column of the magnitudes
+
+        err: string
+            Column of the magnitude errors
+        """
+        objs_df = objs_df[objs_df.fid.isin(fids)]
+        codes, oids = pd.factorize(objs_df.index)
+        bands = pd.Index(fids).get_indexer(objs_df.fid.values)
+        order = np.lexsort((bands, codes))
+        counts = np.zeros((len(oids), len(fids)), dtype=np.int64)
+        np.add.at(counts, (codes, bands), 1)
+        starts = np.concatenate([[0], np.cumsum(counts.ravel())])
+        offsets = starts[np.arange(len(oids))[:, None] * len(fids) + np.arange(len(fids) + 1)]
+        return cls(np.asarray(oids, dtype=str), offsets,
+                   objs_df.mjd.values[order].astype(ARRAYS['mjd']),
+                   objs_df[mag].values[order].astype(ARRAYS['mag']),
+                   objs_df[err].values[order].astype(ARRAYS['err']),
+                   objs_df.fid.values[order].astype(ARRAYS['fid']),
+                   fids)
+
+
+    def save(self, path):
+        """
+        Saves the collection as a directory of '.npy' files, one per
+        array, which can be memory mapped by 'load'
+
+        Parameters
+        ---------
+        path: string
+            Directory where the arrays are written
+        """
+        os.makedirs(path, exist_ok=True)
+        arrays = {'oids': self.oids, 'offsets': self.offsets, 'fids': np.array(self.fids)}
+        arrays.update({name: getattr(self, name) for name in ARRAYS})
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), array)
+
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Loads a collection saved with 'save'. By default the detection
+        arrays are memory mapped, so only the pages of the objects
+        being used are read from disk
+
+        Parameters
+        ---------
+        path: string
+            Directory of the collection
+
+        mmap_mode: {None, 'r', 'r+', 'c'}
+            Memory mapping mode of the detection arrays, see 'numpy.load'.
+            With None the arrays are read into memory
+        """
+        def read(name, mode=None):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode)
+        return cls(read('oids'), read('offsets'),
+                   *[read(name, mmap_mode) for name in ARRAYS],
+                   fids=read('fids'))
+
+
+    def __len__(self):
+        return len(self.oids)
+
+
+    def __iter__(self):
+        return iter(self.oids)
+
+
+    def __contains__(self, oid):
+        return oid in self.positions
+
+
+    def __repr__(self):
+        return f"light_curve_collection({len(self)} objects, {len(self.mjd)} detections)"
+
+
+    def __getitem__(self, key):
+        """
+        Returns the light curve of an oid as views of the arrays, or a
+        new collection when a list of oids is given, see 'subset'
+        """
+        if isinstance(key, str):
+            start, end = self._span(self.position(key))
+            return light_curve(self.mjd[start:end], self.mag[start:end],
+                               self.err[start:end], self.fid[start:end])
+        return self.subset(key)
+
+
+    @property
+    def positions(self):
+        """
+        Dictionary from oid to its position in the collection
+        """
+        if self._positions is None:
+            self._positions = {oid: idx for idx, oid in enumerate(self.oids.tolist())}
+        return self._positions
+
+
+    @property
+    def nbytes(self):
+        """
+        Size in bytes of the arrays of the collection
+        """
+        return sum(getattr(self, name).nbytes for name in ['oids', 'offsets'] + list(ARRAYS))
+
+
+    def position(self, oid):
+        """
+        Returns the position of an oid in the collection
+        """
+        try:
+            return self.positions[oid]
+        except KeyError:
+            raise KeyError(f"Object {oid} is not in the collection") from None
+
+
+    def _span(self, idx):
+        return int(self.offsets[idx, 0]), int(self.offsets[idx, -1])
+
+
+    def band(self, oid, band_fid):
+        """
+        Returns the (mjd, mag, err) views of a band of an object
+
+        Parameters
+        ---------
+        oid: string
+            oid of an object of the collection
+
+        band_fid: integer
+            Band identifier, one of 'fids'
+        """
+        idx = self.position(oid)
+        band_idx = self.fids.index(band_fid)
+        start, end = self.offsets[idx, band_idx], self.offsets[idx, band_idx + 1]
+        return self.mjd[start:end], self.mag[start:end], self.err[start:end]
+
+
+    def subset(self, oids):
+        """
+        Returns a new collection with the objects of a list of oids, in
+        that order. Consecutive objects are returned as views, otherwise
+        their detections are copied
+
+        Parameters
+        ---------
+        oids: string python list
+            oids of objects of the collection
+        """
+        positions = np.array([self.position(oid) for oid in oids], dtype=np.int64)
+        if len(positions) == 0:
+            return light_curve_collection(self.oids[:0], self.offsets[:0], *[
+                getattr(self, name)[:0] for name in ARRAYS], fids=self.fids)
+        if np.all(np.diff(positions) == 1):
+            start, end = self.offsets[positions[0], 0], self.offsets[positions[-1], -1]
+            return light_curve_collection(
+                self.oids[positions[0]:positions[-1] + 1],
+                self.offsets[positions[0]:positions[-1] + 1] - start,
+                *[getattr(self, name)[start:end] for name in ARRAYS], fids=self.fids)
+        spans = [self._span(idx) for idx in positions]
+        rows = np.concatenate([np.arange(start, end) for start, end in spans])
+        sizes = self.offsets[positions] - self.offsets[positions, :1]
+        starts = np.concatenate([[0], np.cumsum(sizes[:, -1])[:-1]])
+        return light_curve_collection(self.oids[positions], sizes + starts[:, None],
+                                      *[getattr(self, name)[rows] for name in ARRAYS],
+                                      fids=self.fids)
+
+
+    def to_dataframe(self):
+        """
+        Returns the detections as a DataFrame indexed by oid with the
+        column names used by the database queries
+        """
+        counts = np.diff(self.offsets[:, [0, -1]], axis=1)[:, 0]
+        return pd.DataFrame({'mjd': np.asarray(self.mjd),
+                             'fid': np.asarray(self.fid),
+                             'magpsf_corr': np.asarray(self.mag),
+                             'sigmapsf_corr_ext': np.asarray(self.err)},
+                            index=pd.Index(np.repeat(self.oids, counts), name='oid'))
+
+
+def object_ids(objs):
+    """
+    Returns the oids of a DataFrame of detections or a
+    light_curve_collection, in order
+    """
+    if isinstance(objs, light_curve_collection):
+        return objs.oids
+    return objs.index.unique()
+
+
+def select_objects(objs, oids):
+    """
+    Selects the detections of an oid, or of a list of oids, from a
+    DataFrame of detections or a light_curve_collection
+    """
+    if isinstance(objs, light_curve_collection):
+        return objs[oids]
+    return objs.loc[oids]
@@ -1,11 +1,24 @@
 import P4J
-import time
+import os
 import pandas as pd
 import numpy as np
 import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PPEM.frequency_grid import DEFAULT_GRID
+from PPEM.batch_periodogram import BATCH_METHODS, batch_get_period, band_groups
+from PPEM.light_curves import object_ids, select_objects, band_name
+from PPEM.profiling import stage_timer, capture, stage_summary, tagged_sink
+from PPEM.results import method_columns, result_table
 
+MULTIBAND_METHODS = ['MHAOV']
 
-def get_period(method, mjd, mag, error, fids=None):
+# Failures of a light curve that can't be estimated, e.g. an empty band or
+# a periodogram without enough local optima. They leave a NaN period
+ESTIMATION_ERRORS = (ValueError, ArithmeticError)
+
+
+def get_period(method, mjd, mag, error, fids=None, cache=None, grid=None, return_trials=False,
+               sink=None, profile=None, n_candidates=None):
     """ 
     Computes the period from the periodogram created with the
     input data using one of the methods from P4J
@@ -32,26 +45,266 @@ def get_period(method, mjd, mag, error, fids=None):
         Photometric error
 
     fids: int python list
-        Band identifier
+        Band identifier of each detection. If given, the multi band
+        periodogram of all the bands is used, see 'MULTIBAND_METHODS'
+
+    cache: period_cache object
+        If given, the result is looked up in the cache before computing
+        the periodogram and stored in it afterwards. The returned time
+        is the one of the original computation
+
+    grid: frequency_grid object
+        Trial frequencies, fine tuning and search mode of the
+        periodogram. By default 'DEFAULT_GRID' is used
+
+    return_trials: boolean
+        Condition to also return the number of trial frequencies
+        evaluated
+
+    sink: function
+        If given, it's called with a record of the estimation: the
+        'method', the number of points 'n_points', 'multiband', whether
+        it was 'cached' and the elapsed nanoseconds of each stage
+        ('cache', 'set_data', 'sweep', 'finetune', 'best') in 'stages'.
+        See 'PPEM.profiling' for sinks that collect or log them
+
+    profile: {None, 'cprofile', 'tracemalloc'} or python list
+        Profilers run over the estimation, their results are added to
+        the record sent to the sink, see 'profiling.capture'
+
+    n_candidates: positive integer
+        If given, the periods of the best n_candidates local optima of
+        the periodogram are also returned, best first and NaN padded.
+        P4J keeps 'n_local_optima' of them, see 'aliases.rank_candidates'
     """
-    if fids != None:
-        my_per = P4J.MultiBandPeriodogram(method=method)
-        my_per.set_data(mjd, mag, error, fids)
-    else:
-        my_per = P4J.periodogram(method=method)
-        my_per.set_data(mjd, mag, error)        
+    if grid is None:
+        grid = DEFAULT_GRID
+    if fids is not None and method not in MULTIBAND_METHODS:
+        raise ValueError(f"P4J has no multi band {method} periodogram, use one of {MULTIBAND_METHODS}")
+    if not np.any(np.isfinite(mjd) & np.isfinite(mag) & np.isfinite(error)):
+        raise ValueError("There are no valid detections to estimate the period")
+    timer = stage_timer()
+    record = {'method': method, 'n_points': len(mjd), 'multiband': fids is not None,
+              'cached': False, 'stages': timer.stages}
+    if cache is not None:
+        with timer.stage('cache'):
+            key = cache.key(method, [mjd, mag, error, fids], p4j=P4J.__version__,
+                            grid=grid.settings())
+            fields = ((['trials'] if return_trials else [])
+                      + (['candidates'] if n_candidates is not None else []))
+            value = cache.get(key, fields)
+        if value is not None:
+            if sink is not None:
+                record['cached'] = True
+                sink(record)
+            result = (value['period'], value['time'])
+            if return_trials:
+                result += (value['trials'],)
+            if n_candidates is not None:
+                result += (_pad_candidates(value['candidates'], n_candidates),)
+            return result
+
+    with capture(profile) as profiled:
+        with timer.stage('set_data'):
+            if fids is not None:
+                my_per = P4J.MultiBandPeriodogram(method=method)
+                my_per.set_data(mjd, mag, error, fids)
+            else:
+                my_per = P4J.periodogram(method=method)
+                my_per.set_data(mjd, mag, error)        
+        
+        n_trials = grid.evaluate(my_per, mjd, timer)
+        p_time = timer.total('sweep', 'finetune') / 1e9
+        
+        with timer.stage('best'):
+            fbest, pbest = my_per.get_best_frequencies()
+    period = float(1/fbest[0])
+    candidates = [float(1/freq) for freq in fbest]
+    if sink is not None:
+        record.update(profiled)
+        sink(record)
+    if cache is not None:
+        cache.set(key, {'period': period, 'time': p_time, 'trials': n_trials,
+                        'candidates': candidates})
+    result = (period, p_time)
+    if return_trials:
+        result += (n_trials,)
+    if n_candidates is not None:
+        result += (_pad_candidates(candidates, n_candidates),)
+    return result
+
+
+def _pad_candidates(candidates, n_candidates):
+    """
+    Returns the first n_candidates periods, padded with NaN
+    """
+    return list(candidates[:n_candidates]) + [np.nan] * (n_candidates - len(candidates))
+
+
+def prepare_bands(obj, n_samples=None, fids=(1, 2)):
+    """ 
+    Extracts the arrays of each band of an object once, so they can be
+    reused by every method. The sampling draws the same detections as
+    'DataFrame.sample(n=n_samples, random_state=42)' does for each band
     
-    start = time.time()
-    my_per.frequency_grid_evaluation(fmin=1e-3, fmax=20.0, fresolution=1e-3, log_period_spacing=True)
-    my_per.finetune_best_frequencies(fresolution=1e-4, n_local_optima=10)
-    p_time = time.time() - start
+    Parameters
+    ---------
+    obj: pandas DataFrame or light_curve
+        DataFrame containing the detection data of a determined
+        object, or its view from a light_curve_collection
+
+    n_samples: positive integer
+        Number of samples to be used for the period estimation. Bands
+        with less detections than n_samples are used complete
+
+    fids: int python tuple
+        Band identifiers to be extracted, in order
+    """
+    if isinstance(obj, pd.DataFrame):
+        mjd, mag, err, fid = (obj.mjd.values, obj.magpsf_corr.values,
+                              obj.sigmapsf_corr_ext.values, obj.fid.values)
+    else:
+        mjd, mag, err, fid = obj
+    return [(mjd[idx], mag[idx], err[idx]) for idx in _band_indices(fid, n_samples, fids)]
+
+
+def _band_indices(fid, n_samples=None, fids=(1, 2)):
+    """
+    Indices of the detections of each band, sampled as 'prepare_bands'
+    does
+    """
+    indices = []
+    for band_fid in fids:
+        idx = np.flatnonzero(fid == band_fid)
+        if n_samples != None and len(idx) >= n_samples:
+            idx = idx[np.random.RandomState(42).choice(len(idx), size=n_samples, replace=False)]
+        indices.append(idx)
+    return indices
+
+
+def prepare_multiband(obj, n_samples=None, fids=(1, 2)):
+    """
+    Extracts the concatenated (mjd, mag, err, fid) arrays of all the
+    bands of an object for a multi band periodogram, with the bands in
+    the order of fids and the same detections as 'prepare_bands'. They
+    are gathered with a single indexing, or returned as views when the
+    detections are already grouped by band, as in a
+    light_curve_collection. Returns the arrays and the number of
+    detections of each band
+
+    Parameters
+    ---------
+    obj: pandas DataFrame or light_curve
+        DataFrame containing the detection data of a determined
+        object, or its view from a light_curve_collection
+
+    n_samples: positive integer
+        Number of samples of each band, see 'prepare_bands'
+
+    fids: int python tuple
+        Band identifiers to be used, in order
+    """
+    if isinstance(obj, pd.DataFrame):
+        arrays = (obj.mjd.values, obj.magpsf_corr.values, obj.sigmapsf_corr_ext.values,
+                  obj.fid.values)
+    else:
+        arrays = tuple(obj)
+    indices = _band_indices(arrays[3], n_samples, fids)
+    n_band_samples = [len(idx) for idx in indices]
+    idx = np.concatenate(indices)
+    if len(idx) and np.array_equal(idx, np.arange(idx[0], idx[0] + len(idx))):
+        return tuple(array[idx[0]:idx[0] + len(idx)] for array in arrays), n_band_samples
+    return tuple(array[idx] for array in arrays), n_band_samples
+
+
+def object_multi_estimation(obj, methods, n_samples=None, multiband=False, cache=None, grid=None,
+                            profile=None, fids=(1, 2), n_candidates=None, sink=None):
+    """ 
+    Computes the period of an object using several methods from P4J. The
+    arrays of each band, or the concatenated arrays of all the bands on
+    multi band, are prepared only once and shared by all the methods.
+    The results have the layout of 'method_columns'
     
-    freq, per = my_per.get_periodogram()
-    fbest, pbest = my_per.get_best_frequencies()
-    return 1/fbest[0], p_time
+    Parameters
+    ---------
+    obj: pandas DataFrame
+        DataFrame containing the detection data of a determined
+        object
+
+    methods: string python list
+        Methods used to perform the fit, see 'get_period'
+
+    n_samples: positive integer
+        Number of samples to be used for the period estimation
+
+    multiband: boolean
+        Condition to choose if the period estimation will consider
+        the bands seperatly (single band) or all together (multi band)
+
+    cache: period_cache object
+        Cache of the already computed estimations, see 'get_period'
 
+    grid: frequency_grid object
+        Trial frequencies of the periodograms, see 'get_period'
 
-def object_estimation(obj, method, n_samples=None, multiband=False):
+    profile:
+        Profilers run over each estimation, see 'get_period'
+
+    fids: int python tuple
+        Band identifiers to be used, in order
+
+    n_candidates: positive integer
+        If given, the periods of the next n_candidates - 1 local optima
+        of each periodogram are added after the best ones, see
+        'get_period' and 'method_columns'
+
+    sink: function
+        Timing records of each estimation, see 'get_period'. The records
+        are tagged with their 'band'
+    """
+    if multiband:
+        band_list, n_band_samples = prepare_multiband(obj, n_samples, fids)
+        band_list = [band_list]
+        band_names = ['multi']
+    else:
+        band_list = prepare_bands(obj, n_samples, fids)
+        n_band_samples = [band[0].shape[0] for band in band_list]
+        band_names = [band_name(band_fid) for band_fid in fids]
+    estimations = []
+    for method in methods:
+        fbest = []
+        comp_time = []
+        candidates = []
+        for name, band_data in zip(band_names, band_list):
+            band_sink = None if sink is None else tagged_sink(sink, band=name)
+            try:
+                fbest_band, comp_time_band, *candidates_band = get_period(
+                    method, *band_data, cache=cache, grid=grid, sink=band_sink, profile=profile,
+                    n_candidates=n_candidates)
+            except ESTIMATION_ERRORS:
+                fbest_band, comp_time_band = np.nan, np.nan
+                candidates_band = [[np.nan] * (n_candidates or 1)]
+            fbest.append(fbest_band)
+            comp_time.append(comp_time_band)
+            candidates.append(candidates_band[0] if candidates_band else [])
+        estimations += n_band_samples + comp_time + fbest + _candidate_values(candidates,
+                                                                              n_candidates)
+    return estimations
+
+
+def _candidate_values(candidates, n_candidates=None):
+    """
+    Flattens the candidates of each band in the order of the candidate
+    columns of 'method_columns', leaving out the best periods
+    """
+    if n_candidates is None:
+        return []
+    return [band_candidates[rank] for rank in range(1, n_candidates)
+            for band_candidates in candidates]
+
+
+def object_estimation(obj, method, n_samples=None, multiband=False, cache=None, grid=None,
+                      profile=None, fids=(1, 2), n_candidates=None, sink=None):
     """ 
     Computes the period of an object using one of the methods from P4J
     
@@ -77,54 +330,259 @@ def object_estimation(obj, method, n_samples=None, multiband=False):
     multiband: boolean
         Condition to choose if the period estimation will consider
         the bands seperatly (single band) or all together (multi band)
+
+    cache: period_cache object
+        Cache of the already computed estimations, see 'get_period'
+
+    grid: frequency_grid object
+        Trial frequencies of the periodograms, see 'get_period'
+
+    profile, fids, n_candidates, sink:
+        Profiling, bands, candidates and timing records, see
+        'object_multi_estimation'
     """    
-    obj_g = obj[obj["fid"] == 1]
-    obj_r = obj[obj["fid"] == 2]
-    if n_samples != None:
-        try:
-            obj_g = obj_g.sample(n = n_samples, random_state = 42)
-            obj_r = obj_r.sample(n = n_samples, random_state = 42)
-            obj_band_list = [obj_g, obj_r]
-        except:
-            pass
-    fbest = []
-    comp_time = []
+    return object_multi_estimation(obj, [method], n_samples, multiband, cache, grid,
+                                   profile, fids, n_candidates, sink)
+
+
+def _chunk_estimation(objs_chunk, estimation, args, batch=False, collect=False):
+    """ 
+    Applies an estimation function to every object inside a chunk of the
+    detections DataFrame. It's the unit of work sent to the process pool
+    by '_run_estimation'. Returns the rows and the timing records of the
+    chunk, which are sent back to the parent process
+
+    Parameters
+    ---------
+    objs_chunk: pandas DataFrame or light_curve_collection
+        Detection data of the objects of the chunk
+
+    estimation: function
+        Module level function receiving the detections of one object
+        followed by args, e.g. 'object_estimation'
+
+    args: tuple
+        Extra arguments of the estimation function
+
+    batch: boolean
+        Condition to choose if the estimation function receives the
+        whole chunk, see '_run_estimation'
+
+    collect: boolean
+        Condition to collect the timing records of the estimations
+    """
+    records = []
+    sink = records.append if collect else None
+    if batch:
+        return estimation(objs_chunk, *args, sink=sink), records
+    period_list = []
+    for oid in object_ids(objs_chunk):
+        oid_sink = None if sink is None else tagged_sink(sink, oid=str(oid))
+        query = estimation(select_objects(objs_chunk, oid), *args, sink=oid_sink)
+        period_list.append([oid] + query)
+    return period_list, records
+
+
+def _oid_chunks(objs_oid, n_jobs, chunksize=None):
+    """ 
+    Splits the oids in contiguous chunks to be dispatched to the workers.
+    By default each worker receives about four chunks, which keeps the
+    pool balanced without sending one message per object
+
+    Parameters
+    ---------
+    objs_oid: pandas Index
+        Unique oids of the objects to be processed
+
+    n_jobs: positive integer
+        Number of workers of the pool
+
+    chunksize: positive integer
+        Number of objects inside each chunk
+    """
+    if chunksize is None:
+        chunksize = max(1, int(np.ceil(len(objs_oid) / (4 * n_jobs))))
+    return [objs_oid[i:i + chunksize] for i in range(0, len(objs_oid), chunksize)]
+
+
+def _batch_estimation(objs_chunk, methods, n_samples=None, grid=None, multiband=False,
+                      fids=(1, 2), n_candidates=None, sink=None):
+    """ 
+    Computes the period of every object inside a chunk of the detections
+    DataFrame with the vectorized engine of 'batch_periodogram'. All the
+    bands of the chunk are evaluated together for each method, and on
+    multi band the bands of each object are pooled in one periodogram.
+    The rows have the same layout as 'object_multi_estimation'
+
+    Parameters
+    ---------
+    objs_chunk: pandas DataFrame or light_curve_collection
+        Detection data of the objects of the chunk
+
+    methods: string python list
+        Methods used to perform the fit, see 'BATCH_METHODS'
+
+    n_samples: positive integer
+        Number of samples to be used for the period estimation
+
+    grid: frequency_grid object
+        Trial frequencies of the periodograms, see 'get_period'
+
+    multiband: boolean
+        Condition to choose if the period estimation will consider
+        the bands seperatly (single band) or all together (multi band)
+
+    fids: int python tuple
+        Band identifiers to be used, in order
+
+    n_candidates: positive integer
+        Number of candidate periods of each periodogram, see
+        'object_multi_estimation'
+
+    sink: function
+        If given, it's called with one timing record per method for
+        the whole chunk, see 'batch_get_period'
+    """
+    objs_oid = object_ids(objs_chunk)
+    bands = [prepare_bands(select_objects(objs_chunk, oid), n_samples, fids) for oid in objs_oid]
+    n_band_samples = [[band[0].shape[0] for band in obj_bands] for obj_bands in bands]
     if multiband:
-        try:
-            obj = pd.concat(obj_band_list)
-            fbest_mb, comp_time_mb = get_period(
-                method, 
-                obj.mjd.values,
-                obj.magpsf_corr.values,
-                obj.sigmapsf_corr_ext.values,
-                obj.fid.values)
-        except:
-            fbest, comp_time = np.nan, np.nan
-        fbest.append(fbest_mb)
-        comp_time.append(comp_time_mb)
+        curves = [band for obj_bands in bands for band in obj_bands if band[0].shape[0]]
+        n_curves = [sum(1 for n in obj_samples if n) for obj_samples in n_band_samples]
+        groups = band_groups(n_curves)
+        has_curves = np.flatnonzero(n_curves)
     else:
-        for obj_band in obj_band_list:
-            try:
-                fbest_band, comp_time_band = get_period(
-                    method, 
-                    obj_band.mjd.values,
-                    obj_band.magpsf_corr.values,
-                    obj_band.sigmapsf_corr_ext.values)
-            except:
-                fbest_band, comp_time_band = np.nan, np.nan 
-            fbest.append(fbest_band)
-            comp_time.append(comp_time_band)                
-    return [obj_g.shape[0], obj_r.shape[0]] + comp_time + fbest
+        curves = [band for obj_bands in bands for band in obj_bands]
+        groups = None
+    period_list = [[oid] for oid in objs_oid]
+    for method in methods:
+        timer = stage_timer()
+        estimations = batch_get_period(method, curves, grid, timer=timer, groups=groups,
+                                       n_candidates=n_candidates)
+        if sink is not None:
+            sink({'method': method, 'backend': 'numpy', 'n_curves': len(curves),
+                  'n_points': sum(len(curve[0]) for curve in curves), 'multiband': multiband,
+                  'cached': False, 'stages': timer.stages})
+        if multiband:
+            missing = (np.nan, np.nan) + (([np.nan] * n_candidates,) if n_candidates else ())
+            obj_estimations = [[missing] for _ in objs_oid]
+            for idx, estimation in zip(has_curves, estimations):
+                obj_estimations[idx] = [estimation]
+        else:
+            obj_estimations = [estimations[idx:idx + len(fids)]
+                               for idx in range(0, len(estimations), len(fids))]
+        for idx, estimation in enumerate(obj_estimations):
+            period_list[idx] += (n_band_samples[idx] + [band[1] for band in estimation]
+                                 + [band[0] for band in estimation]
+                                 + _candidate_values([band[2] for band in estimation]
+                                                     if n_candidates else [], n_candidates))
+    return period_list
+
+
+def _run_estimation(objs_df, estimation, args, n_jobs=1, chunksize=None, executor=None,
+                    batch=False, sink=None, out=None):
+    """ 
+    Applies an estimation function to every object of 'objs_df', serially
+    or sharded across a process pool, and returns the rows in the same
+    oid order as 'objs_df'
+
+    Parameters
+    ---------
+    objs_df: pandas DataFrame or light_curve_collection
+        DataFrame containing the detection data of multiple
+        objects, or the same data in a light_curve_collection
+
+    estimation: function
+        Module level function receiving the detections of one object
+        followed by args and the keyword 'sink'
+
+    args: tuple
+        Extra arguments of the estimation function
+
+    n_jobs, chunksize, executor:
+        See 'multi_object_estimation'
 
-def multi_object_estimation(objs_df, method, n_samples=None, multiband=False):
+    batch: boolean
+        Condition to choose if the estimation function receives the
+        detections of a whole chunk of objects and returns their rows,
+        like '_batch_estimation'. Serial batches have 256 objects by
+        default
+
+    sink: function
+        If given, it receives the timing records of the estimations
+        tagged with their 'oid'. The records of the workers are sent
+        back and passed to it in this process
+
+    out: result_table object
+        If given, the rows are written to it as they arrive instead of
+        being kept, and it's returned
+    """
+    objs_oid = object_ids(objs_df)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    period_list = []
+
+    def collect(start, rows):
+        if out is None:
+            period_list.extend(rows)
+        else:
+            out.fill(start, [row[1:] for row in rows])
+
+    if executor is None and n_jobs == 1:
+        with tqdm.tqdm(total=len(objs_oid)) as pbar:
+            if batch:
+                start = 0
+                for chunk in _oid_chunks(objs_oid, 1, chunksize or 256):
+                    collect(start, estimation(select_objects(objs_df, chunk), *args, sink=sink))
+                    start += len(chunk)
+                    pbar.update(len(chunk))
+                return period_list if out is None else out
+            for idx, oid in enumerate(objs_oid):
+                oid_sink = None if sink is None else tagged_sink(sink, oid=str(oid))
+                query = estimation(select_objects(objs_df, oid), *args, sink=oid_sink)
+                pbar.update(1)
+                collect(idx, [[oid] + query])
+        return period_list if out is None else out
+
+    pool = executor if executor is not None else ProcessPoolExecutor(max_workers=n_jobs)
+    try:
+        chunks = _oid_chunks(objs_oid, n_jobs, chunksize)
+        starts = np.cumsum([0] + [len(chunk) for chunk in chunks])
+        futures = {pool.submit(_chunk_estimation, select_objects(objs_df, chunk), estimation,
+                               args, batch, sink is not None): idx
+                   for idx, chunk in enumerate(chunks)}
+        chunk_results = [[] for _ in chunks]
+        with tqdm.tqdm(total=len(objs_oid)) as pbar:
+            for future in as_completed(futures):
+                idx = futures[future]
+                rows, records = future.result()
+                if out is None:
+                    chunk_results[idx] = rows
+                else:
+                    out.fill(starts[idx], [row[1:] for row in rows])
+                for record in records:
+                    sink(record)
+                pbar.update(len(chunks[idx]))
+    finally:
+        if executor is None:
+            pool.shutdown()
+    if out is not None:
+        return out
+    return [row for chunk_result in chunk_results for row in chunk_result]
+
+
+def multi_object_estimation(objs_df, method, n_samples=None, multiband=False,
+                            n_jobs=1, chunksize=None, executor=None, cache=None, grid=None,
+                            backend='P4J', sink=None, profile=None, fids=(1, 2),
+                            n_candidates=None, layout='wide'):
     """ 
     Computes the period of multiple objects using one of the methods from P4J
     
     Parameters
     ---------
-    objs_df: pandas DataFrame
+    objs_df: pandas DataFrame or light_curve_collection
         DataFrame containing the detection data of multiple
-        objects
+        objects, or the same data in a light_curve_collection
 
     method: {'PDM1', 'LKSL', 'AOV', 'MHAOV', 'QMICS', 'QMIEU'} 
         Method used to perform the fit
@@ -141,20 +599,142 @@ def multi_object_estimation(objs_df, method, n_samples=None, multiband=False):
 
     multiband: boolean
         Condition to choose if the period estimation will consider
-        the bands seperatly (single band) or all together (multi band)
+        the bands seperatly (single band) or all together (multi band).
+        Multi band is available for the methods in 'MULTIBAND_METHODS'
+        with P4J and in 'BATCH_METHODS' with numpy
+
+    n_jobs: positive integer
+        Number of worker processes used to shard the objects. With
+        n_jobs=1 and no executor the objects are processed serially
+        in the current process. -1 uses all the available cores
+
+    chunksize: positive integer
+        Number of objects sent to a worker on each dispatch. By default
+        the objects are split in about four chunks per worker
+
+    executor: concurrent.futures.Executor
+        Already running executor to be used instead of creating a new
+        process pool. It's not shut down after the estimation
+
+    cache: period_cache object
+        Cache of the already computed estimations, see 'get_period'.
+        The hit and miss counters are only updated when the objects
+        are processed in the current process
+
+    grid: frequency_grid object
+        Trial frequencies of the periodograms, computed once and
+        shared by all the objects. By default 'DEFAULT_GRID' is used
+
+    backend: {'P4J', 'numpy'}
+        Engine used to compute the periodograms
+
+        P4J: one periodogram at a time with P4J
+        numpy: the vectorized engine of 'batch_periodogram', which
+            evaluates the bands of a whole chunk of objects at once.
+            It's available for the methods in 'BATCH_METHODS', on
+            single and multi band, with exhaustive grids only, and
+            doesn't use the cache
+
+    sink: function
+        If given, it receives the timing record of every estimation
+        tagged with its 'oid' and 'band', see 'get_period'. The per
+        method breakdown of the stages is stored in the 'stages' entry
+        of the 'attrs' of the result, see 'profiling.stage_summary'
+
+    profile: {None, 'cprofile', 'tracemalloc'} or python list
+        Profilers run over each estimation, see 'get_period'. It's
+        ignored by the numpy backend
+
+    fids: int python tuple
+        Band identifiers to be used, in order. Any number of bands
+        can be used, each one gets its own columns
+
+    n_candidates: positive integer
+        If given, the periods of the best n_candidates local optima of
+        each periodogram are kept, see 'method_columns'. They are the
+        input of 'aliases.rank_candidates'
+
+    layout: {'wide', 'long'}
+        Layout of the result
+
+        wide: one row per object with the columns of 'method_columns'
+        long: one row per object, method and band with categorical
+            oid, method and band, int16 number of samples, float32
+            times and float64 periods, written to a preallocated
+            'results.result_table' as the estimations arrive. It's
+            pivoted to the wide layout with 'results.to_wide'
     """    
-    period_list = []
-    objs_oid = objs_df.index.unique()
-    with tqdm.tqdm(total=len(objs_oid)) as pbar:
-        for oid in objs_oid:
-            obj_estimations = []
-            query = object_estimation(objs_df.loc[oid], method, n_samples, multiband)
-            obj_estimations += query
-            pbar.update(1)
-            period_list.append([oid] +obj_estimations)
-    if multiband:
-        band_columns =  [f"{method}_time", f"{method}_T"]
+    return multi_method_estimation(objs_df, [method], n_samples, multiband,
+                                   n_jobs, chunksize, executor, cache, grid, backend,
+                                   sink, profile, fids, n_candidates, layout)
+
+
+def multi_method_estimation(objs_df, methods, n_samples=None, multiband=False,
+                            n_jobs=1, chunksize=None, executor=None, cache=None, grid=None,
+                            backend='P4J', sink=None, profile=None, fids=(1, 2),
+                            n_candidates=None, layout='wide'):
+    """ 
+    Computes the period of multiple objects using several methods from
+    P4J. Objects are processed one at a time running all the methods on
+    the same prepared arrays. The result has the same columns as
+    concatenating the output of 'multi_object_estimation' for each method
+    
+    Parameters
+    ---------
+    objs_df: pandas DataFrame or light_curve_collection
+        DataFrame containing the detection data of multiple
+        objects, or the same data in a light_curve_collection
+
+    methods: string python list
+        Methods used to perform the fit, see 'multi_object_estimation'
+
+    n_samples: positive integer
+        Number of samples to be used for the period estimation
+
+    multiband: boolean
+        Condition to choose if the period estimation will consider
+        the bands seperatly (single band) or all together (multi band)
+
+    n_jobs, chunksize, executor, cache, grid, backend, sink, profile, fids, n_candidates, layout:
+        See 'multi_object_estimation'
+    """
+    if layout not in ['wide', 'long']:
+        raise ValueError(f"Unknown layout {layout}, use 'wide' or 'long'")
+    out = None
+    if layout == 'long':
+        out = result_table(object_ids(objs_df), methods, multiband, fids, n_candidates)
+    records = []
+    if sink is not None:
+        user_sink = sink
+        def sink(record):
+            records.append(record)
+            user_sink(record)
+    if backend == 'numpy':
+        unavailable = [method for method in methods if method not in BATCH_METHODS]
+        if unavailable:
+            raise ValueError(f"Methods {unavailable} are not available in the numpy backend")
+        period_list = _run_estimation(objs_df, _batch_estimation,
+                                      (list(methods), n_samples, grid, multiband, tuple(fids),
+                                       n_candidates),
+                                      n_jobs, chunksize, executor, batch=True, sink=sink,
+                                      out=out)
+    elif backend == 'P4J':
+        unavailable = [method for method in methods if method not in MULTIBAND_METHODS]
+        if multiband and unavailable:
+            raise ValueError(f"Methods {unavailable} have no multi band periodogram in P4J, "
+                             f"use the numpy backend or {MULTIBAND_METHODS}")
+        period_list = _run_estimation(objs_df, object_multi_estimation,
+                                      (list(methods), n_samples, multiband, cache, grid, profile,
+                                       tuple(fids), n_candidates),
+                                      n_jobs, chunksize, executor, sink=sink, out=out)
+    else:
+        raise ValueError(f"Unknown backend {backend}")
+    if layout == 'long':
+        estimated_periods = period_list.to_frame()
     else:
-        band_columns = [f"{method}_time_g", f"{method}_time_r",f"{method}_T_g",f"{method}_T_r"]
-    return pd.DataFrame(period_list,
-                        columns = ['oid', f'{method}_samples_g', f"{method}_samples_r"] + band_columns).set_index("oid")
\ No newline at end of file
+        columns = [column for method in methods
+                   for column in method_columns(method, multiband, fids, n_candidates)]
+        estimated_periods = pd.DataFrame(period_list, columns = ['oid'] + columns).set_index("oid")
+    if sink is not None:
+        estimated_periods.attrs['stages'] = stage_summary(records)
+    return estimated_periods
@@ -1,124 +1,188 @@
+import itertools
 import matplotlib.pylab as plt
-import numpy as np
 import tqdm
 import pandas as pd
-from PPEM.period_estimation import multi_object_estimation
+from PPEM.period_estimation import multi_method_estimation, prepare_bands
+from PPEM.frequency_grid import class_grid
+from PPEM.storage import load_objects, load_periods
+from PPEM.light_curves import object_ids, select_objects
+from PPEM.folding import fold_phases, render_folded_curves
+from PPEM.fold_quality import auto_fold_scores
+from PPEM.database import filter_detections, _detections_frame
+from PPEM.pipeline import prefetch_estimation
+from PPEM.bootstrap import subsample_sweep
+from PPEM.screening import cascade_estimation
+from PPEM.aliases import rank_candidates
 
 class periodic_stars:
 
-	def __init__(self, database, obj_class, n_objs, n_min):
-	    """
-	    Class for holding all the objects and tags from a database for 
-	    a given type of periodic variable star. From these objects the
-	    periods can be computed and then used to inspect the folde curve 
-	    
-	    Parameters
-	    ---------
-	    database: postgreSQL_database object
-	    	Object to be used as a database to retrieve the objects
-	    	detections
-	        
-	    obj_class: {'RRL', 'Ceph', 'LPV', 'DSCT', 'EB/EW'} 
-	        Periodic variable star type to be considered
-		
-		n_objs: positive integer
-			Number of objects to be used
-
-		n_min: positive integer
-			Minimum number of detection for each object
-
-		objs_df: pandas DataFrame
-			DataFrame containing all the objects with their
-			corresponding detections
-
-		tags: pandas DataFrame
-			DataFrame containing the tags of all the objects;
-			oid, catalog period, and source
-	        
-	    """		
-		self.database = database
-		self.obj_class = obj_class
-		self.n_objs = n_objs
-		self.n_min = n_min
-
-
-	def get_objects(self, tags, noisy=False, max_sigma=1.0):
-	    """
-	    Gets the detections from the database of the objects 
-	    within the input tags, considering the n_objs and n_min of 
-	    the class. The data and the filtered tags are saved in new
-	    attributes as 'objs_df' and 'tags', respectivly
-	    
-	    Parameters
-	    ---------
-
-		tags: pandas DataFrame
-			DataFrame containing the tags of all the objects;
-			oid, catalog period, and source
-
-		noisy: boolean
-			Condition to choose if the noisy detections will
-			be included
-
-		max_sigma: float
-			Limit to be considered as the max amount of noise
-			allowed for a detection to be included
-	        
-	    """		
-
-		objs_oids = tags.index
-		obj_samples = []
-		with tqdm.tqdm(total=self.n_objs) as pbar:
-			for oid in objs_oids:
-				if len(obj_samples) >= self.n_objs:
-					self.objs_df = pd.concat(obj_samples)
-					self.tags = tags.loc[self.objs_df.index.unique()]
-					return
-				obj = self.database.query(oid)
-				if not noisy:
-					obj = obj[((obj['sigmapsf_corr_ext'] > 0.0) &
-						(obj['sigmapsf_corr_ext'] < max_sigma))]          
-				n_g = obj[obj.fid == 1].shape[0]
-				n_r = obj[obj.fid == 2].shape[0]
-				if (n_g < self.n_min) | (n_r < self.n_min):
-					continue
-				else:
-					obj_samples.append(obj)
-					pbar.update(1)
-
-
-	def set_objects(self, objs_df, tags):	
-	    """
-	    Sets the detections data and tags manually. It can be
-	    used to load previously computed data in csv format
-	    
-	    Parameters
-	    ---------
-
-		objs_df: pandas DataFrame
-			DataFrame containing all the objects with their
-			corresponding detections
-
-		tags: pandas DataFrame
-			DataFrame containing the tags of all the objects;
-			oid, catalog period, and source
-	        
-	    """	
-
-		self.objs_df = objs_df
-		self.tags = tags.loc[self.objs_df.index.unique()]
-
-
-	def compute_periods(self, methods, n_samples=None, multiband=False):
-	    """
-	    Method for computing the periods of the objects insided the
-	    'objs_df' DataFrame using a list of methods available at P4J
-	    
-	    Parameters
-	    ---------
-
-	    methods: python list 
-	    	Method used to perform the fit
+    def __init__(self, database, obj_class, n_objs, n_min):
+        """
+        Class for holding all the objects and tags from a database for 
+        a given type of periodic variable star. From these objects the
+        periods can be computed and then used to inspect the folde curve 
+        
+        Parameters
+        ---------
+        database: postgreSQL_database object
+            Object to be used as a database to retrieve the objects
+            detections
+            
+        obj_class: {'RRL', 'Ceph', 'LPV', 'DSCT', 'EB/EW'} 
+            Periodic variable star type to be considered
+        
+        n_objs: positive integer
+            Number of objects to be used
+
+        n_min: positive integer
+            Minimum number of detection for each object
+
+        objs_df: pandas DataFrame
+            DataFrame containing all the objects with their
+            corresponding detections
+
+        tags: pandas DataFrame
+            DataFrame containing the tags of all the objects;
+            oid, catalog period, and source
+            
+        """     
+        self.database = database
+        self.obj_class = obj_class
+        self.n_objs = n_objs
+        self.n_min = n_min
+
+
+    def iter_objects(self, tags, noisy=False, max_sigma=1.0):
+        """
+        Generator yielding (oid, DataFrame) for the objects within the
+        input tags that pass the noise filter and have at least n_min
+        detections on each band, in the order of the tags. Candidates
+        are fetched lazily, so nothing beyond the consumed objects
+        (and the batch being read) is downloaded
+        
+        Parameters
+        ---------
+
+        tags: pandas DataFrame
+            DataFrame containing the tags of all the objects;
+            oid, catalog period, and source
+
+        noisy: boolean
+            Condition to choose if the noisy detections will
+            be included
+
+        max_sigma: float
+            Limit to be considered as the max amount of noise
+            allowed for a detection to be included
+
+        When the database has a 'query_many' method the detections
+        are fetched in batches and the noise filter and the per band
+        counts are evaluated by the database
+        """
+        objs_oids = tags.index
+        if hasattr(self.database, 'query_many'):
+            candidates = self.database.query_many(
+                objs_oids,
+                max_sigma=None if noisy else max_sigma,
+                n_min=self.n_min)
+        else:
+            candidates = ((oid, self.database.query(oid)) for oid in objs_oids)
+        for oid, obj in candidates:
+            obj = filter_detections(obj, self.n_min, None if noisy else max_sigma)
+            if obj is not None:
+                yield oid, obj
+
+
+    def get_objects(self, tags, noisy=False, max_sigma=1.0):
+        """
+        Gets the detections from the database of the objects 
+        within the input tags, considering the n_objs and n_min of 
+        the class. The data and the filtered tags are saved in new
+        attributes as 'objs_df' and 'tags', respectivly. The selection
+        stops as soon as n_objs objects have been found. If none is
+        found 'objs_df' has the detection columns and no rows
+        
+        Parameters
+        ---------
+
+        tags: pandas DataFrame
+            DataFrame containing the tags of all the objects;
+            oid, catalog period, and source
+
+        noisy: boolean
+            Condition to choose if the noisy detections will
+            be included
+
+        max_sigma: float
+            Limit to be considered as the max amount of noise
+            allowed for a detection to be included
+        """     
+        objects = self.iter_objects(tags, noisy, max_sigma)
+        obj_samples = []
+        with tqdm.tqdm(total=self.n_objs) as pbar:
+            for oid, obj in itertools.islice(objects, self.n_objs):
+                obj_samples.append(obj)
+                pbar.update(1)
+        objects.close()
+        self.objs_df = pd.concat(obj_samples) if obj_samples else _detections_frame([])
+        self.tags = tags.loc[self.objs_df.index.unique()]
+
+
+    def set_objects(self, objs_df, tags):   
+        """
+        Sets the detections data and tags manually. It can be
+        used to load previously computed data in csv format
+        
+        Parameters
+        ---------
+
+        objs_df: pandas DataFrame or light_curve_collection
+            DataFrame containing all the objects with their
+            corresponding detections, or the same data in a
+            light_curve_collection
+
+        tags: pandas DataFrame
+            DataFrame containing the tags of all the objects;
+            oid, catalog period, and source
+            
+        """ 
+
+        self.objs_df = objs_df
+        self.tags = tags.loc[object_ids(self.objs_df)]
+
+
+    def load_objects(self, objs_path, tags_path):
+        """
+        Sets the detections data and tags from columnar files written
+        with 'PPEM.storage', which load faster than the csv files
+        
+        Parameters
+        ---------
+
+        objs_path: string
+            File with the detections, see 'storage.save_objects'
+
+        tags_path: string
+            File with the tags, usually the periods of a previous
+            sweep, see 'storage.save_periods'
+        """
+        tags = load_periods(tags_path, columns=['classALeRCE', 'period', 'source'])
+        self.set_objects(load_objects(objs_path), tags)
+
+
+    def compute_periods(self, methods, n_samples=None, multiband=False,
+                        n_jobs=1, chunksize=None, executor=None, cache=None, grid=None,
+                        backend='P4J', sink=None, profile=None, n_candidates=None):
+        """
+        Method for computing the periods of the objects insided the
+        'objs_df' DataFrame using a list of methods available at P4J.
+        Each object is prepared once and all the methods run on it
+        
+        Parameters
+        ---------
+
+        methods: python list 
+            Method used to perform the fit
             
             PDM: Phase Dispersion Minimization
             LKSL: Lafler Kinman statistic for string length
@@ -127,62 +191,336 @@ class periodic_stars:
             QMICS: Cauchy Schwarz Quadratic Mutual Information
             QMIEU: Euclidean Quadratic Mutual Information
 
-		n_samples: positive integer
-			Number of samples to be used for the period estimation
-
-		multiband: boolean
-			Condition to choose if the period estimation will consider
-			the bands seperatly (single band) or all together (multi band)
-	    """			
-		period_list = []
-		estimated_periods = []
-		for method in methods:
-			print("-"*10 + " " + method + " " + "-"*10)
-			method_estimated_periods = multi_object_estimation(self.objs_df, method, n_samples, multiband)
-			estimated_periods.append(method_estimated_periods)
-		return pd.concat([self.tags]+estimated_periods,axis=1)
-
-
-	def folded_curve(self, obj_oid, band_periods):
-	    """
-	    Method for plotting the folded curve of an object according
-	    to it's 'oid', using the input periods
-	    
-	    Parameters
-	    ---------
-
-	    obj_oid: string 
-	    	oid of an object inside 'objs_df'
-
-		band_periods: tuple
-			Tuple of periods to select the g-band and r-band periods
-			to be used for folding the curve
-
-	    """				
-		print(obj_oid)
-		obj = self.objs_df.loc[obj_oid]
-		catalog_period = self.tags.loc[obj_oid].period
-		print(f'Catalog period = {catalog_period}')
-		bands = ["green","red"]
-		fig, ax = plt.subplots(1, 2, figsize=(20,5))
-		for idx, band in enumerate(bands):
-			period = band_periods[idx]
-			print(f'{band[0]}-band period = {band_periods[idx]}')
-
-			obj_band = obj[obj.fid == idx+1]
-
-			phase = np.mod(obj_band.mjd, period)* (1/period)
-			
-			ax[idx].errorbar(
-				phase, 
-				obj_band.magpsf_corr.values, 
-				obj_band.sigmapsf_corr_ext.values, 
-				fmt='.', color=band)
-			ax[idx].set_title(f'{obj_oid} {band[0]}-band folded curve')
-			ax[idx].set_xlabel('Phase @ %0.5f [1/d], %0.5f [d]' %(1/period, period))
-			ax[idx].set_ylabel('Magnitude')
-			ax[idx].invert_yaxis()
-			ax[idx].grid()
-
-		plt.tight_layout()
-		plt.show();          
\ No newline at end of file
+        n_samples: positive integer
+            Number of samples to be used for the period estimation
+
+        multiband: boolean
+            Condition to choose if the period estimation will consider
+            the bands seperatly (single band) or all together (multi band)
+
+        n_jobs: positive integer
+            Number of worker processes used to shard the objects,
+            see 'multi_object_estimation'
+
+        chunksize: positive integer
+            Number of objects sent to a worker on each dispatch
+
+        executor: concurrent.futures.Executor
+            Already running executor to be reused between methods
+
+        cache: period_cache object
+            Cache of the already computed estimations. Re-running a
+            sweep with a new method only computes that method
+
+        grid: frequency_grid object or 'class'
+            Trial frequencies of the periodograms. With 'class' the grid
+            adapted to 'obj_class' is used, see 'class_grid'. By default
+            'DEFAULT_GRID' is used
+
+        backend: {'P4J', 'numpy'}
+            Engine used to compute the periodograms. 'numpy' evaluates
+            whole chunks of objects at once, see 'multi_object_estimation'
+
+        sink: function
+            Receives the timing record of every estimation, e.g. a
+            'profiling.timing_collector'. The per method breakdown of
+            the stages is left in the 'stages' entry of the 'attrs'
+            of the result
+
+        profile: {None, 'cprofile', 'tracemalloc'} or python list
+            Profilers run over each estimation, see 'get_period'
+
+        n_candidates: positive integer
+            Number of candidate periods kept from each periodogram,
+            see 'rank_candidates'
+        """         
+        if isinstance(grid, str) and grid == 'class':
+            grid = class_grid(self.obj_class)
+        print("-"*10 + " " + ", ".join(methods) + " " + "-"*10)
+        estimated_periods = multi_method_estimation(
+            self.objs_df, methods, n_samples, multiband,
+            n_jobs=n_jobs, chunksize=chunksize, executor=executor, cache=cache, grid=grid,
+            backend=backend, sink=sink, profile=profile, n_candidates=n_candidates)
+        periods = pd.concat([self.tags, estimated_periods],axis=1)
+        periods.attrs = estimated_periods.attrs
+        return periods
+
+
+    def stream_periods(self, tags, methods, n_samples=None, multiband=False, n_jobs=1,
+                       max_queue=64, noisy=False, max_sigma=1.0, grid=None, sink=None,
+                       keep_objects=False):
+        """
+        Method for computing the periods of the objects within the input
+        tags fetching their detections straight from the database, without
+        calling 'get_objects' first. The detections are prefetched while
+        the previous objects are estimated, keeping a bounded number of
+        objects in memory, see 'pipeline.prefetch_estimation'. The first
+        n_objs objects with at least n_min detections on each band are
+        estimated and their tags are saved in 'tags'
+        
+        Parameters
+        ---------
+
+        tags: pandas DataFrame
+            DataFrame containing the tags of all the objects;
+            oid, catalog period, and source
+
+        methods: python list
+            Methods used to perform the fit, see 'compute_periods'
+
+        n_samples, multiband, grid, sink:
+            See 'compute_periods'
+
+        n_jobs: positive integer
+            Number of objects estimated at the same time
+
+        max_queue: positive integer
+            Maximum number of fetched objects waiting to be estimated
+
+        noisy, max_sigma:
+            Noise filter of the detections, see 'get_objects'
+
+        keep_objects: boolean
+            Condition to also save the detections of the estimated
+            objects in 'objs_df', e.g. to fold their curves afterwards
+        """
+        if isinstance(grid, str) and grid == 'class':
+            grid = class_grid(self.obj_class)
+        print("-"*10 + " " + ", ".join(methods) + " " + "-"*10)
+        estimated_periods = prefetch_estimation(
+            self.database, tags.index, methods, n_samples, multiband, n_jobs=n_jobs,
+            max_queue=max_queue, n_min=self.n_min, max_sigma=None if noisy else max_sigma,
+            max_objects=self.n_objs, grid=grid, sink=sink, keep_objects=keep_objects)
+        if keep_objects:
+            estimated_periods, self.objs_df = estimated_periods
+        self.tags = tags.loc[estimated_periods.index]
+        periods = pd.concat([self.tags, estimated_periods], axis=1)
+        periods.attrs = estimated_periods.attrs
+        return periods
+
+
+    def cascade_periods(self, methods, screen_method='MHAOV', n_samples=None, multiband=False,
+                        n_jobs=1, grid=None, backend='P4J', max_chi2=5.0, cache=None):
+        """
+        Method for computing the periods of the objects insided the
+        'objs_df' DataFrame with a cheap screen first, running the
+        methods only on the variable objects whose screen period doesn't
+        agree with the catalog. The saved compute is left in the
+        'screening' entry of the 'attrs' of the result, see
+        'screening.cascade_estimation'
+        
+        Parameters
+        ---------
+
+        methods: python list
+            Expensive methods used to perform the fit
+
+        screen_method: {'MHAOV', 'PDM1', 'LKSL'}
+            Fast periodogram of the screen, computed with the numpy
+            backend
+
+        n_samples, multiband, n_jobs, grid, backend, cache:
+            See 'compute_periods'
+
+        max_chi2: float
+            Reduced chi square below which a band is considered constant
+        """
+        if isinstance(grid, str) and grid == 'class':
+            grid = class_grid(self.obj_class)
+        print("-"*10 + " " + ", ".join(methods) + " " + "-"*10)
+        estimated_periods = cascade_estimation(
+            self.objs_df, self.tags, methods, screen_method, n_samples, multiband,
+            max_chi2=max_chi2, n_jobs=n_jobs, cache=cache, grid=grid, backend=backend,
+            obj_class=self.obj_class)
+        periods = pd.concat([self.tags, estimated_periods], axis=1)
+        periods.attrs = estimated_periods.attrs
+        return periods
+
+
+    def folded_curve(self, obj_oid, band_periods):
+        """
+        Method for plotting the folded curve of an object according
+        to it's 'oid', using the input periods
+        
+        Parameters
+        ---------
+
+        obj_oid: string 
+            oid of an object inside 'objs_df'
+
+        band_periods: tuple
+            Tuple of periods to select the g-band and r-band periods
+            to be used for folding the curve
+
+        """             
+        print(obj_oid)
+        obj_bands = prepare_bands(select_objects(self.objs_df, obj_oid))
+        catalog_period = self.tags.loc[obj_oid].period
+        print(f'Catalog period = {catalog_period}')
+        bands = ["green","red"]
+        fig, ax = plt.subplots(1, 2, figsize=(20,5))
+        for idx, band in enumerate(bands):
+            period = band_periods[idx]
+            print(f'{band[0]}-band period = {band_periods[idx]}')
+
+            mjd, mag, err = obj_bands[idx]
+
+            phase = fold_phases(mjd, [period])[0]
+            
+            ax[idx].errorbar(
+                phase, 
+                mag, 
+                err, 
+                fmt='.', color=band)
+            ax[idx].set_title(f'{obj_oid} {band[0]}-band folded curve')
+            ax[idx].set_xlabel('Phase @ %0.5f [1/d], %0.5f [d]' %(1/period, period))
+            ax[idx].set_ylabel('Magnitude')
+            ax[idx].invert_yaxis()
+            ax[idx].grid()
+
+        plt.tight_layout()
+        plt.show();
+
+
+    def render_folded_curves(self, periods_df, methods, path, objs_per_page=6, n_jobs=1,
+                             fmt='pdf'):
+        """
+        Method for rendering the folded curves of all the objects with
+        the catalog period and the period of each method to files, as
+        the sheets used for the folded curve inspection. See
+        'folding.render_folded_curves'
+        
+        Parameters
+        ---------
+
+        periods_df: pandas DataFrame
+            Tags and estimations returned by 'compute_periods'
+
+        methods: python list
+            Methods whose periods are rendered
+
+        path: string
+            Directory where the files are written
+
+        objs_per_page: positive integer
+            Number of objects of each page
+
+        n_jobs: positive integer
+            Number of worker processes rendering the pages
+
+        fmt: string
+            'pdf' for multi-page files or an image format like 'png'
+            for one file per page
+        """
+        return render_folded_curves(self.objs_df, periods_df, methods, path,
+                                    objs_per_page=objs_per_page, n_jobs=n_jobs, fmt=fmt)
+
+
+    def fold_scores(self, periods_df, methods, half=False, return_statistics=False):
+        """
+        Method for scoring the folded curves of all the objects with the
+        catalog period and the period of each method automatically,
+        instead of inspecting the rendered sheets. See
+        'fold_quality.auto_fold_scores'
+        
+        Parameters
+        ---------
+
+        periods_df: pandas DataFrame
+            Tags and estimations returned by 'compute_periods'
+
+        methods: python list
+            Methods whose periods are scored
+
+        half: boolean
+            Condition to score half of the catalog period apart, as
+            done for eclipsing binaries
+
+        return_statistics: boolean
+            Condition to also return the fold statistics of each object,
+            band and candidate
+        """
+        return auto_fold_scores(self.objs_df, periods_df, methods, half=half,
+                                return_statistics=return_statistics)
+
+
+    def rank_candidates(self, periods_df, methods, half=False, min_cycles=2.0, margin=0.9,
+                        n_samples=None):
+        """
+        Method for ranking again the candidate periods of the estimations
+        by the dispersion of their folds, taking into account their
+        harmonic and sidereal day aliases. See 'aliases.rank_candidates'
+        
+        Parameters
+        ---------
+
+        periods_df: pandas DataFrame
+            Tags and estimations returned by 'compute_periods' with
+            n_candidates
+
+        methods: python list
+            Methods whose candidates are ranked
+
+        half: boolean
+            Condition to score half of the catalog period apart, as
+            done for eclipsing binaries
+
+        min_cycles: float
+            Minimum number of cycles of a valid candidate along the
+            time span of the detections
+
+        margin: float
+            Factor of the dispersion of the best peak of each
+            periodogram, see 'aliases.rank_candidates'
+
+        n_samples: positive integer
+            Number of samples per band given to 'compute_periods'. The
+            candidates are folded with the same sampled detections
+        """
+        return rank_candidates(self.objs_df, periods_df, methods, min_cycles=min_cycles,
+                               margin=margin, half=half, n_samples=n_samples)
+
+
+    def subsample_periods(self, methods, n_samples_list, n_draws=20, multiband=False,
+                          backend='numpy', n_jobs=1, grid=None, half=False):
+        """
+        Method for estimating and scoring the periods of many random
+        subsamples of every object for several number of samples, to get
+        the hit rate against the number of samples with a confidence
+        interval instead of a single draw. See 'bootstrap.subsample_sweep'
+        and 'bootstrap.hitrate_intervals'
+        
+        Parameters
+        ---------
+
+        methods: python list
+            Methods used to perform the fit
+
+        n_samples_list: positive integer python list
+            Number of samples of each band to be drawn
+
+        n_draws: positive integer
+            Number of subsamples of each object and size
+
+        multiband: boolean
+            Condition to choose if the period estimation will consider
+            the bands seperatly (single band) or all together (multi band)
+
+        backend: {'numpy', 'P4J'}
+            Engine used to compute the periodograms
+
+        n_jobs: positive integer
+            Number of worker processes
+
+        grid: frequency_grid object or 'class'
+            Trial frequencies of the periodograms, see 'compute_periods'
+
+        half: boolean
+            Condition to score half of the catalog period apart, as
+            done for eclipsing binaries
+        """
+        if isinstance(grid, str) and grid == 'class':
+            grid = class_grid(self.obj_class)
+        return subsample_sweep(self.objs_df, self.tags, methods, n_samples_list, n_draws,
+                               multiband=multiband, backend=backend, grid=grid, n_jobs=n_jobs,
+                               obj_class=self.obj_class, half=half)
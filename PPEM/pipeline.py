@@ -0,0 +1,259 @@
+import os
+import time
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pandas as pd
+from PPEM.database import filter_detections
+from PPEM.period_estimation import object_multi_estimation, method_columns
+from PPEM.profiling import stage_summary, tagged_sink
+
+
+def _fetch(database, batch, n_min=None, max_sigma=None, fids=(1, 2)):
+    """
+    Fetches the detections of a batch of oids and applies the selection
+    filters. It runs in a thread of the fetch executor. Returns the kept
+    (oid, DataFrame) pairs in the order of the batch
+    """
+    if hasattr(database, 'query_many'):
+        objects = database.query_many(batch, batch_size=len(batch), max_sigma=max_sigma,
+                                      n_min=n_min)
+    else:
+        objects = ((oid, database.query(oid)) for oid in batch)
+    kept = []
+    for oid, obj in objects:
+        obj = filter_detections(obj, n_min, max_sigma, fids)
+        if obj is not None and len(obj):
+            kept.append((oid, obj))
+    return kept
+
+
+def _estimate(obj, methods, n_samples, multiband, cache, grid, fids, oid, collect=False):
+    """
+    Estimates the periods of a prefetched object. It's the unit of work
+    sent to the compute executor. Returns the row of the object and its
+    timing records
+    """
+    records = []
+    sink = tagged_sink(records.append, oid=str(oid)) if collect else None
+    return object_multi_estimation(obj, methods, n_samples, multiband, cache, grid,
+                                   fids=fids, sink=sink), records
+
+
+async def _pipeline(database, oids, estimate_args, n_jobs, executor, max_queue, n_fetchers,
+                    batch_size, n_min, max_sigma, fids, max_objects, collect, keep_objects):
+    """
+    Coroutine of 'prefetch_estimation'. Fetchers take the next batch of
+    oids, fetch it in a thread and put its objects in a bounded queue,
+    waiting while the queue is full. The batches are queued in the order
+    of the oids and no object is queued past max_objects. Workers take
+    the objects from the queue and estimate them in the compute executor
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max_queue)
+    batches = enumerate(iter(lambda oids=iter(oids): list(itertools.islice(oids, batch_size)),
+                             []))
+    fetch_pool = ThreadPoolExecutor(max_workers=n_fetchers)
+    compute_pool = executor
+    if compute_pool is None:
+        compute_pool = (ThreadPoolExecutor(max_workers=1) if n_jobs == 1
+                        else ProcessPoolExecutor(max_workers=n_jobs))
+    rows = {}
+    objects = {}
+    records = []
+    stats = {'fetch_time': 0.0, 'compute_time': 0.0, 'n_fetched': 0, 'n_kept': 0,
+             'max_queue': 0}
+
+    turn = asyncio.Condition()
+    queued = {'batch': 0, 'n_objects': 0}
+
+    def capped():
+        return max_objects is not None and queued['n_objects'] >= max_objects
+
+    async def fetcher():
+        for idx, batch in batches:
+            if capped():
+                return
+            start = time.perf_counter()
+            kept = await loop.run_in_executor(fetch_pool, _fetch, database, batch, n_min,
+                                              max_sigma, fids)
+            stats['fetch_time'] += time.perf_counter() - start
+            stats['n_fetched'] += len(batch)
+            stats['n_kept'] += len(kept)
+            # batches are queued in order, so the cap keeps the first objects
+            async with turn:
+                await turn.wait_for(lambda: queued['batch'] == idx)
+                for oid, obj in kept:
+                    if capped():
+                        break
+                    await queue.put((oid, obj))
+                    queued['n_objects'] += 1
+                    stats['max_queue'] = max(stats['max_queue'], queue.qsize())
+                queued['batch'] += 1
+                turn.notify_all()
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            oid, obj = item
+            start = time.perf_counter()
+            rows[oid], obj_records = await loop.run_in_executor(
+                compute_pool, _estimate, obj, *estimate_args, oid, collect)
+            stats['compute_time'] += time.perf_counter() - start
+            records.extend(obj_records)
+            if keep_objects:
+                objects[oid] = obj
+
+    start = time.perf_counter()
+    workers = [asyncio.ensure_future(worker()) for _ in range(n_jobs)]
+    fetchers = [asyncio.ensure_future(fetcher()) for _ in range(n_fetchers)]
+
+    async def feed():
+        await asyncio.gather(*fetchers)
+        for _ in workers:
+            await queue.put(None)
+
+    try:
+        await asyncio.gather(feed(), *workers)
+    finally:
+        for task in fetchers + workers:
+            task.cancel()
+        fetch_pool.shutdown(wait=False)
+        if executor is None:
+            compute_pool.shutdown()
+    stats['wall_time'] = time.perf_counter() - start
+    return rows, objects, records, stats
+
+
+def prefetch_estimation(database, oids, methods, n_samples=None, multiband=False, n_jobs=1,
+                        executor=None, max_queue=64, n_fetchers=2, batch_size=None, n_min=None,
+                        max_sigma=1.0, max_objects=None, cache=None, grid=None, fids=(1, 2),
+                        sink=None, keep_objects=False):
+    """
+    Computes the periods of multiple objects fetching their detections
+    straight from a database, without staging them first. The detections
+    of the next objects are fetched while the previous ones are being
+    estimated: fetchers put the objects in a queue of max_queue objects
+    and workers take them from it to run 'object_multi_estimation'. When
+    the queue is full the fetchers wait, so at most about max_queue +
+    n_fetchers * batch_size objects are kept in memory whatever the
+    number of oids. The result has the same columns as
+    'multi_method_estimation' and the objects rejected by the filters
+    are left out. The fetch and compute times, the number of fetched and
+    kept objects and the largest queue length are stored in the
+    'pipeline' entry of the 'attrs' of the result
+
+    Parameters
+    ---------
+    database: postgreSQL_database object
+        Database with the detections, see 'database'. Objects with a
+        'query_many' method are fetched in batches, others one oid at a
+        time with 'query'. A 'dataframe_database' with some latency can
+        be used to run the pipeline offline
+
+    oids: string iterable
+        oids of the objects to be estimated, in order
+
+    methods: string python list
+        Methods used to perform the fit, see 'get_period'
+
+    n_samples: positive integer
+        Number of samples to be used for the period estimation
+
+    multiband: boolean
+        Condition to choose if the period estimation will consider
+        the bands seperatly (single band) or all together (multi band)
+
+    n_jobs: positive integer
+        Number of objects estimated at the same time. With n_jobs=1 they
+        are estimated in a thread of this process, otherwise in a pool
+        of n_jobs processes. -1 uses all the available cores
+
+    executor: concurrent.futures.Executor
+        Already running executor used to estimate the objects instead of
+        creating a new one. It's not shut down after the estimation
+
+    max_queue: positive integer
+        Maximum number of fetched objects waiting to be estimated
+
+    n_fetchers: positive integer
+        Number of batches fetched at the same time. A pooled database
+        needs at least as many connections
+
+    batch_size: positive integer
+        Number of oids fetched on each round trip, by default the
+        'batch_size' of the database or 1 if it has none
+
+    n_min: positive integer
+        If given, minimum number of detections on each band of fids
+
+    max_sigma: float
+        Limit of the noise of the detections, see 'filter_detections'.
+        With None the noisy detections are included
+
+    max_objects: positive integer
+        If given, only the first max_objects kept objects are estimated
+        and no more batches are fetched once they have been found, like
+        'periodic_stars.get_objects'
+
+    cache: period_cache object
+        Cache of the already computed estimations, see 'get_period'
+
+    grid: frequency_grid object
+        Trial frequencies of the periodograms, see 'get_period'
+
+    fids: int python tuple
+        Band identifiers to be used, in order
+
+    sink: function
+        If given, it receives the timing records of the estimations
+        tagged with their 'oid', see 'multi_method_estimation'
+
+    keep_objects: boolean
+        Condition to also return the detections of the estimated
+        objects, e.g. to fold their curves afterwards
+    """
+    if max_queue < 1 or n_fetchers < 1:
+        raise ValueError("max_queue and n_fetchers must be positive")
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    oids = list(oids)
+    batch_size = batch_size or getattr(database, 'batch_size', 1)
+    estimate_args = (list(methods), n_samples, multiband, cache, grid, tuple(fids))
+    coroutine = _pipeline(database, oids, estimate_args, n_jobs, executor, max_queue,
+                          n_fetchers, batch_size, n_min, max_sigma, tuple(fids), max_objects,
+                          sink is not None, keep_objects)
+    rows, objects, records, stats = run_coroutine(coroutine)
+
+    order = [oid for oid in dict.fromkeys(oids) if oid in rows][:max_objects]
+    columns = [column for method in methods
+               for column in method_columns(method, multiband, fids)]
+    estimated_periods = pd.DataFrame([rows[oid] for oid in order], columns=columns,
+                                     index=pd.Index(order, name='oid'))
+    estimated_periods.attrs['pipeline'] = stats
+    if sink is not None:
+        kept = set(map(str, order))
+        records = [record for record in records if record['oid'] in kept]
+        for record in records:
+            sink(record)
+        estimated_periods.attrs['stages'] = stage_summary(records)
+    if keep_objects:
+        objs = [objects[oid] for oid in order]
+        return estimated_periods, (pd.concat(objs) if objs else None)
+    return estimated_periods
+
+
+def run_coroutine(coroutine):
+    """
+    Runs a coroutine to completion and returns its result. Inside an
+    already running event loop, as in a Jupyter notebook, it's run in
+    its own loop on another thread
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as thread:
+        return thread.submit(asyncio.run, coroutine).result()
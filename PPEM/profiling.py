@@ -0,0 +1,196 @@
+import io
+import json
+import time
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+
+PROFILERS = ['cprofile', 'tracemalloc']
+
+
+class stage_timer:
+
+    def __init__(self):
+        """
+        Accumulates the elapsed time of named stages with the monotonic
+        'time.perf_counter_ns' clock
+
+        Parameters
+        ---------
+        stages: dictionary
+            {stage name: elapsed nanoseconds}, in the order the stages
+            were first run
+        """
+        self.stages = {}
+
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager timing the code inside it as the stage 'name'.
+        Repeated stages are accumulated
+        """
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + time.perf_counter_ns() - start
+
+
+    def total(self, *names):
+        """
+        Returns the elapsed nanoseconds of the given stages, or of all
+        of them if none is given
+        """
+        if not names:
+            names = self.stages.keys()
+        return sum(self.stages.get(name, 0) for name in names)
+
+
+@contextmanager
+def capture(profile=None, top=20):
+    """
+    Context manager profiling the code inside it. It yields a
+    dictionary that is filled when the context exits with 'profile',
+    the top functions by own time as [function, calls, own time [s],
+    cumulative time [s]], and/or 'peak_memory', the peak of the memory
+    allocated by Python [bytes]
+
+    Parameters
+    ---------
+    profile: string or string python list
+        Profilers to be used, see 'PROFILERS'. With None nothing
+        is captured
+
+    top: positive integer
+        Number of functions kept from the cProfile statistics
+    """
+    if profile is None:
+        profile = []
+    elif isinstance(profile, str):
+        profile = [profile]
+    unknown = [name for name in profile if name not in PROFILERS]
+    if unknown:
+        raise ValueError(f"Unknown profilers {unknown}, use some of {PROFILERS}")
+    result = {}
+    profiler = cProfile.Profile() if 'cprofile' in profile else None
+    started_tracemalloc = False
+    if 'tracemalloc' in profile:
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+            started_tracemalloc = True
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield result
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            result['profile'] = _profile_table(profiler, top)
+        if 'tracemalloc' in profile:
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+
+def _profile_table(profiler, top):
+    """
+    Top functions by own time of a cProfile run as plain lists, so
+    they can be sent between processes and stored as JSON
+    """
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    table = []
+    for (file, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        table.append([f"{function} ({file}:{line})", ncalls, tottime, cumtime])
+    table.sort(key=lambda row: row[2], reverse=True)
+    return table[:top]
+
+
+class timing_collector:
+
+    def __init__(self):
+        """
+        Sink keeping the timing records of the estimations in memory.
+        It's called with each record, see 'get_period'
+
+        Parameters
+        ---------
+        records: dictionary python list
+            Records received so far
+        """
+        self.records = []
+
+
+    def __call__(self, record):
+        self.records.append(record)
+
+
+    def summary(self):
+        """
+        Returns the stage breakdown of the received records, see
+        'stage_summary'
+        """
+        return stage_summary(self.records)
+
+
+class jsonl_sink:
+
+    def __init__(self, path):
+        """
+        Sink appending each timing record as a line of JSON to a file,
+        as a structured log to be analysed afterwards
+
+        Parameters
+        ---------
+        path: string
+            File where the records are appended
+        """
+        self.path = path
+
+
+    def __call__(self, record):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+
+
+def tagged_sink(sink, **tags):
+    """
+    Returns a sink adding the given tags to every record before
+    passing it to 'sink', e.g. the oid or band of the estimation
+    """
+    return lambda record: sink(dict(record, **tags))
+
+
+def read_records(path):
+    """
+    Reads the records written by a 'jsonl_sink'
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def stage_summary(records):
+    """
+    Aggregates timing records into a per method breakdown of the stages.
+    Returns a DataFrame indexed by method and stage with the number of
+    runs, the total and mean time [ms] and the share of the method time
+    spent in each stage. Cached estimations are left out
+
+    Parameters
+    ---------
+    records: dictionary python list
+        Records of 'get_period' or 'batch_get_period', as received by
+        a sink
+    """
+    rows = [[record['method'], stage, elapsed / 1e6]
+            for record in records if not record.get('cached', False)
+            for stage, elapsed in record['stages'].items()]
+    stages = pd.DataFrame(rows, columns=['method', 'stage', 'time'])
+    summary = stages.groupby(['method', 'stage'], sort=False).time.agg(
+        runs='count', total_ms='sum', mean_ms='mean')
+    summary['share'] = summary.total_ms / summary.total_ms.groupby(level='method').transform('sum')
+    return summary
@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+from PPEM.light_curves import band_name
+
+
+def method_columns(method, multiband=False, fids=(1, 2), n_candidates=None):
+    """
+    Returns the names of the columns with the results of a method, in
+    the same order they are computed by
+    'period_estimation.object_estimation'. With
+    n_candidates, the periods of the next local optima follow as
+    '<method>_T<rank>_<band>', or '<method>_T<rank>' on multi band,
+    with ranks from 2 to n_candidates
+
+    Parameters
+    ---------
+    method: string
+        Method used to perform the fit
+
+    multiband: boolean
+        Condition to choose if the period estimation will consider
+        the bands seperatly (single band) or all together (multi band)
+
+    fids: int python tuple
+        Band identifiers used, in order
+
+    n_candidates: positive integer
+        Number of candidate periods of each periodogram
+    """
+    names = [band_name(band_fid) for band_fid in fids]
+    ranks = range(2, (n_candidates or 1) + 1)
+    if multiband:
+        band_columns = [f"{method}_time", f"{method}_T"] + [f"{method}_T{rank}" for rank in ranks]
+    else:
+        band_columns = ([f"{method}_time_{name}" for name in names]
+                        + [f"{method}_T_{name}" for name in names]
+                        + [f"{method}_T{rank}_{name}" for rank in ranks for name in names])
+    return [f"{method}_samples_{name}" for name in names] + band_columns
+
+
+class result_table:
+
+    def __init__(self, oids, methods, multiband=False, fids=(1, 2), n_candidates=None):
+        """
+        Compact container of the estimations of multiple objects, filled
+        as the rows of the estimation arrive. The results are kept in
+        typed arrays with shape (n_objects, n_methods, n_bands),
+        preallocated for all the objects: int16 number of samples,
+        float32 computing times and float64 periods, which need the
+        precision to fold long time spans. See 'to_frame' for the long
+        format table and 'to_wide' for the columns of 'method_columns'
+
+        Parameters
+        ---------
+        oids: string python list
+            oid of each object, in the order of the rows
+
+        methods: string python list
+            Methods of the estimation, in order
+
+        multiband: boolean
+            Condition to choose if the rows come from multi band
+            estimations, with one time and period shared by the bands
+
+        fids: int python tuple
+            Band identifiers of the estimation, in order
+
+        n_candidates: positive integer
+            Number of candidate periods of each periodogram, see
+            'multi_method_estimation'
+        """
+        self.oids = pd.Index(oids, name='oid')
+        self.methods = list(methods)
+        self.multiband = multiband
+        self.fids = tuple(fids)
+        self.n_candidates = n_candidates or 1
+        shape = (len(self.oids), len(self.methods), len(self.fids))
+        self.n_samples = np.zeros(shape, dtype=np.int16)
+        self.time = np.full(shape, np.nan, dtype=np.float32)
+        self.period = np.full(shape + (self.n_candidates,), np.nan, dtype=np.float64)
+        self.filled = np.zeros(len(self.oids), dtype=bool)
+
+
+    @property
+    def nbytes(self):
+        """
+        Size in bytes of the arrays of the table
+        """
+        return sum(getattr(self, name).nbytes for name in ['n_samples', 'time', 'period', 'filled'])
+
+
+    def fill(self, start, rows):
+        """
+        Writes the rows of consecutive objects starting at a position,
+        with the values of 'object_multi_estimation' without the oid
+
+        Parameters
+        ---------
+        start: non negative integer
+            Position of the object of the first row
+
+        rows: float python list or numpy array
+            Rows with the layout of 'method_columns' for every method
+        """
+        if len(rows) == 0:
+            return
+        n_bands = len(self.fids)
+        n_periods = 1 if self.multiband else n_bands
+        values = np.asarray(rows, dtype=np.float64).reshape(len(rows), len(self.methods), -1)
+        samples = values[:, :, :n_bands]
+        if np.any(samples > np.iinfo(np.int16).max):
+            raise ValueError(f"Numbers of samples above {np.iinfo(np.int16).max} don't fit the table")
+        stop = start + len(rows)
+        self.n_samples[start:stop] = np.nan_to_num(samples)
+        self.time[start:stop] = values[:, :, n_bands:n_bands + n_periods]
+        periods = values[:, :, n_bands + n_periods:]
+        periods = periods.reshape(len(rows), len(self.methods), self.n_candidates, n_periods)
+        self.period[start:stop] = np.moveaxis(periods, 2, -1)
+        self.filled[start:stop] = True
+
+
+    def to_frame(self):
+        """
+        Returns the long format table with one row per object, method
+        and band and the columns oid, method and band as categoricals,
+        n_samples, time and period, followed by 'period_<rank>' for the
+        candidates. Multi band rows repeat the time and period of the
+        object in every band. The settings of the table are stored in
+        the 'attrs' of the result, see 'to_wide'
+        """
+        n_objs, n_methods, n_bands = self.n_samples.shape
+        names = [band_name(band_fid) for band_fid in self.fids]
+        columns = {
+            'oid': pd.Categorical.from_codes(np.repeat(np.arange(n_objs), n_methods * n_bands),
+                                             self.oids.astype(str)),
+            'method': pd.Categorical.from_codes(
+                np.tile(np.repeat(np.arange(n_methods), n_bands), n_objs), self.methods),
+            'band': pd.Categorical.from_codes(np.tile(np.arange(n_bands), n_objs * n_methods),
+                                              names),
+            'n_samples': self.n_samples.ravel(),
+            'time': self.time.ravel(),
+            'period': self.period[..., 0].ravel()}
+        for rank in range(2, self.n_candidates + 1):
+            columns[f'period_{rank}'] = self.period[..., rank - 1].ravel()
+        table = pd.DataFrame(columns)
+        table.attrs.update({'multiband': self.multiband, 'fids': list(self.fids),
+                            'n_candidates': self.n_candidates})
+        return table
+
+
+def to_long(periods_df, methods, multiband=False, fids=(1, 2), n_candidates=None):
+    """
+    Converts estimations with the columns of 'method_columns', like the
+    files of 'csv_data/period_estimations', to the long format table of
+    'result_table.to_frame'. Other columns, like the tags, are left out
+
+    Parameters
+    ---------
+    periods_df: pandas DataFrame
+        Estimations indexed by oid
+
+    methods: string python list
+        Methods to be converted
+
+    multiband: boolean
+        Condition to choose if the estimations are multi band
+
+    fids: int python tuple
+        Band identifiers of the estimations, in order
+
+    n_candidates: positive integer
+        Number of candidate periods of the estimations
+    """
+    table = result_table(periods_df.index, methods, multiband, fids, n_candidates)
+    columns = [column for method in methods
+               for column in method_columns(method, multiband, fids, n_candidates)]
+    table.fill(0, periods_df[columns].to_numpy(dtype=np.float64))
+    return table.to_frame()
+
+
+def to_wide(table):
+    """
+    Pivots a long format table of estimations to the columns of
+    'method_columns' for every method, indexed by oid, as returned by
+    'multi_method_estimation' with the default layout. Times are
+    float32 and the missing rows are NaN
+
+    Parameters
+    ---------
+    table: pandas DataFrame
+        Long format estimations with the 'attrs' set by
+        'result_table.to_frame'
+    """
+    multiband = table.attrs.get('multiband', False)
+    n_candidates = table.attrs.get('n_candidates', 1)
+    fids = tuple(table.attrs.get('fids', (1, 2)))
+    names = [band_name(band_fid) for band_fid in fids]
+    methods = list(dict.fromkeys(table.method.astype(str)))
+    periods = ['period'] + [f'period_{rank}' for rank in range(2, n_candidates + 1)]
+    keys = [table[column].astype(str) for column in ['oid', 'method', 'band']]
+    wide = table.set_index(keys)[['n_samples', 'time'] + periods].unstack(['method', 'band'])
+    wide = wide.reindex(pd.Index(keys[0].unique(), name='oid'))
+
+    sources = {}
+    period_bands = [(names[0], '')] if multiband else [(name, f'_{name}') for name in names]
+    for method in methods:
+        for name in names:
+            sources[f'{method}_samples_{name}'] = ('n_samples', method, name)
+        for name, suffix in period_bands:
+            sources[f'{method}_time{suffix}'] = ('time', method, name)
+        for rank, column in enumerate(periods, 1):
+            label = '' if rank == 1 else str(rank)
+            for name, suffix in period_bands:
+                sources[f'{method}_T{label}{suffix}'] = (column, method, name)
+    columns = [column for method in methods
+               for column in method_columns(method, multiband, fids, n_candidates)]
+    result = pd.DataFrame({column: wide[sources[column]] if sources[column] in wide else np.nan
+                           for column in columns}, index=wide.index)
+    samples = [column for column in columns if '_samples_' in column]
+    return result.astype({column: 'Int64' for column in samples})
@@ -1,10 +1,249 @@
+import os
 import matplotlib.pylab as plt
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PPEM.scoring import summarize_scores
+
+CUBE_INDEX = ['class', 'method', 'band', 'n_samples']
+
+BANDS = {'g': "G - band", 'r': "R - band", 'all': "All - band"}
+
+STYLES = ["-o", "-^", "-x", "-8", "-*", "-+", "-p"]
+
+TIME_COLUMNS = r'^(?P<method>.+)_time(?:_(?P<band>[^_]+))?$'
+
+
+def score_cube(scores, multiband_scores=None):
+    """
+    Aggregates long format score tables into a cube indexed by class,
+    method, band and number of samples with one column per metric: the
+    hit rate of each score and the null rate. All the tables are reduced
+    in a single groupby. Multi band scores are stored in the band 'all'
+
+    Parameters
+    ---------
+    scores: pandas DataFrame
+        Single band scores of any number of classes and samples, as
+        returned by 'scoring.scores_table'
+
+    multiband_scores: pandas DataFrame
+        Multi band scores in the same format. Since every band of a multi
+        band estimation has the same period, only the g band is used
+    """
+    tables = [scores]
+    if multiband_scores is not None:
+        tables.append(multiband_scores[multiband_scores.band == 'g'].assign(band='all'))
+    return summarize_scores(pd.concat(tables, ignore_index=True), CUBE_INDEX).drop(columns='n')
+
+
+def time_cube(periods, multiband_periods=None):
+    """
+    Aggregates the computing times of the period estimations into a
+    cube indexed by class, method, band and number of samples with the
+    mean 'time' [s]. All the estimations are reduced in a single groupby
+
+    Parameters
+    ---------
+    periods: dictionary
+        {(class, n_samples): DataFrame} with the single band estimations,
+        as returned by 'periodic_stars.compute_periods'
+
+    multiband_periods: dictionary
+        {(class, n_samples): DataFrame} with the multi band estimations,
+        stored in the band 'all'
+    """
+    frames = []
+    for estimations in [periods, multiband_periods or {}]:
+        for (obj_class, n_samples), periods_df in estimations.items():
+            times = periods_df.filter(regex=TIME_COLUMNS).melt(var_name='column', value_name='time')
+            frames.append(times.assign(**{'class': obj_class, 'n_samples': n_samples}))
+    times = pd.concat(frames, ignore_index=True)
+    columns = times.column.str.extract(TIME_COLUMNS)
+    times['method'] = columns.method
+    times['band'] = columns.band.fillna('all')
+    return times.groupby(CUBE_INDEX, sort=False, dropna=False).time.mean().to_frame()
+
+
+def aggregate_cube(scores=None, multiband_scores=None, periods=None, multiband_periods=None,
+                   cache=None):
+    """
+    Builds the cube of metrics used by the plots, indexed by class,
+    method, band and number of samples, with the hit rates from the
+    scores and the mean computing time from the estimations. With a
+    cache file, the cube is read from it if it exists and written to it
+    otherwise, so the plots of a sweep can be regenerated without
+    aggregating it again
+
+    Parameters
+    ---------
+    scores, multiband_scores: pandas DataFrame
+        Long format scores, see 'score_cube'
+
+    periods, multiband_periods: dictionary
+        Estimations of each class and number of samples, see 'time_cube'
+
+    cache: string
+        csv file where the cube is cached
+    """
+    if cache is not None and os.path.exists(cache):
+        return load_cube(cache)
+    cubes = []
+    if scores is not None or multiband_scores is not None:
+        cubes.append(score_cube(scores if scores is not None else multiband_scores.iloc[:0],
+                                multiband_scores))
+    if periods is not None or multiband_periods is not None:
+        cubes.append(time_cube(periods or {}, multiband_periods))
+    if not cubes:
+        raise ValueError("Scores or estimations are needed to build the cube")
+    cube = pd.concat(cubes, axis=1).sort_index()
+    if cache is not None:
+        save_cube(cube, cache)
+    return cube
+
+
+def save_cube(cube, path):
+    """
+    Writes a cube of metrics to a csv file
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    cube.to_csv(path)
+
+
+def load_cube(path):
+    """
+    Reads a cube of metrics written by 'save_cube'
+    """
+    cube = pd.read_csv(path, index_col=list(range(len(CUBE_INDEX))))
+    return cube.rename_axis(CUBE_INDEX)
+
+
+def _select(cube, obj_class):
+    """
+    Returns the cube of a class indexed by method, band and number of
+    samples. Without a class, the cube must have a single one
+    """
+    classes = cube.index.unique('class')
+    if obj_class is None:
+        if len(classes) > 1:
+            raise ValueError(f"The cube has the classes {list(classes)}, select one of them")
+        obj_class = classes[0]
+    return cube.xs(obj_class, level='class').sort_index()
+
+
+def _band_panels(cube, metric, methods, multiband_methods, ylabel, figsize, file, log=False,
+                 ylim=None):
+    """
+    Draws a metric of the methods against the number of samples with one
+    panel per band, the multi band methods in the last one. The figure
+    is written to file with the Agg canvas, or shown if no file is given
+    """
+    plt.rcParams['axes.grid'] = True
+    font = {'size': 15, 'weight': 'bold'}
+    plt.rc('font', **font)
+    if file is None:
+        fig, ax = plt.subplots(nrows=1, ncols=3, figsize=figsize, sharex=True, sharey=True)
+    else:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        ax = fig.subplots(nrows=1, ncols=3, sharex=True, sharey=True)
+
+    lines = dict(list(cube[metric].groupby(level=['method', 'band'], sort=False)))
+    for idx, band in enumerate(BANDS):
+        band_methods = methods if band != 'all' else multiband_methods
+        for style, method in zip(STYLES, band_methods):
+            if (method, band) in lines:
+                values = lines[method, band]
+                ax[idx].plot(values.index.get_level_values('n_samples'), values.values, style,
+                             label=method)
+        ax[idx].legend()
+        ax[idx].set_xlabel("N° samples", **font)
+        ax[idx].set_title(BANDS[band], **font)
+        if log:
+            ax[idx].set_yscale("log")
+        if ylim is not None:
+            ax[idx].set_ylim(ylim)
+    ax[0].set_ylabel(ylabel, **font)
+    if file is None:
+        plt.show()
+    else:
+        fig.savefig(file)
+    return fig
+
+
+def plot_hitrate(cube, methods, score="Ok", multiband_methods=("MHAOV",), obj_class=None,
+                 figsize=(20, 10), file=None):
+    """
+    Plots the hit-rate on single band and multi band of a cube of
+    metrics considering one of the scores as the hit-rate
+
+    Parameters
+    ---------
+    cube: pandas DataFrame
+        Cube of metrics, see 'aggregate_cube'
+
+    methods: string python list
+        Methods to be plotted on single band
+
+    score: string
+        Name of the score to be considered as the hit-rate
+
+    multiband_methods: string python list
+        Methods to be plotted on multi band
+
+    obj_class: string
+        Class to be plotted, needed if the cube has many classes
+
+    figsize: float tuple
+        Size of the plot -> Width x height in inches
+
+    file: string
+        File where the figure is written without showing it, in any
+        format supported by matplotlib
+    """
+    return _band_panels(_select(cube, obj_class), score, methods, list(multiband_methods),
+                        "Hit rate", figsize, file, ylim=[0, 1])
+
+
+def plot_time(cube, methods, multiband_methods=("MHAOV",), obj_class=None, figsize=(20, 10),
+              file=None):
+    """
+    Plots the mean computing time on single band and multi band of a
+    cube of metrics
+
+    Parameters
+    ---------
+    cube: pandas DataFrame
+        Cube of metrics, see 'aggregate_cube'
+
+    methods: string python list
+        Methods to be plotted on single band
+
+    multiband_methods: string python list
+        Methods to be plotted on multi band
+
+    obj_class: string
+        Class to be plotted, needed if the cube has many classes
+
+    figsize: float tuple
+        Size of the plot -> Width x height in inches
+
+    file: string
+        File where the figure is written without showing it, in any
+        format supported by matplotlib
+    """
+    return _band_panels(_select(cube, obj_class), 'time', methods, list(multiband_methods),
+                        "Time [s]", figsize, file, log=True)
+
+
+def hitrate_plot(sample_list, fold_score_sb, fold_score_mb, score, method_list, MHAOV=False,
+                 figsize=(20,10), file=None):
+    """
+    Plots the hit-rate on single band and multi band obtained from
+    the folded scores considering one of the multiple criterias used
 
-def hitrate_plot(sample_list, fold_score_sb, fold_score_mb, score, method_list, MHAOV=False, figsize=(20,10)):
-    """ 
-    Plots the hit-rate on single band and multi band obtained from 
-    the folded scores considering one of the multiple criterias used 
-    
     Parameters
     ---------
     sample_list: positive integer python list
@@ -29,56 +268,34 @@ def hitrate_plot(sample_list, fold_score_sb, fold_score_mb, score, method_list,
 
     figsize: float tuple
         Tuple to indicate the size of the plot -> Width x height in inches
-    """    
 
-    plt.rcParams['axes.grid'] = True
-    font = {'size'   : 15,
-           'weight':'bold'}
-    plt.rc('font', **font)    
-    
-    fig, ax = plt.subplots(nrows=1,
-                           ncols=3,
-                           figsize=figsize,
-                          sharex=True,
-                          sharey=True)
-    style = ["-o","-^","-x","-8","-*","-+","-p"]
-    for idxx, method in enumerate(method_list):
-        for idx, band in enumerate(["g","r"]):
-            ax[idx].plot(sample_list,
-                       [fold_score.iloc[score][f"{method}_{band}"] for fold_score in fold_score_sb],
-                       style[idxx])
-            ax[idx].legend(method_list)
-            ax[idx].set_xlabel("N° samples", **font)
-            ax[idx].set_ylabel("Hit rate", **font)
-            ax[idx].set_title(f"{band.upper()} - band", **font)
-            ax[idx].set_ylim([0,1])
-        
-        if MHAOV:
-            ax[2].plot(sample_list,
-                       [fold_score.iloc[score][f"MHAOV_g"] for fold_score in fold_score_mb],
-                       "-o")
-            ax[2].legend(["MHAOV"])
-            ax[2].set_xlabel("N° samples", **font)
-            ax[2].set_title(f"All - band", **font)
-            ax[2].set_ylim([0,1])
-        else:
-            ax[2].plot(sample_list,
-                       [fold_score.iloc[score][f"{method}_g"] for fold_score in fold_score_mb],
-                       "-o")
-            ax[2].legend(method_list)
-            ax[2].set_xlabel("N° samples", **font)
-            ax[2].set_title(f"All - band", **font)
-            ax[2].set_ylim([0,1])
-    ax[1].set_ylabel("")
-    plt.show()    
-
-
-
-def time_plot(sample_list, periods_sb, periods_mb, method_list, MHAOV=False, figsize=(20,10)):
-    """ 
-    Plots the computing time on single band and multi band obtained from 
-    the period estimation process 
-    
+    file: string
+        File where the figure is written without showing it
+    """
+    name = fold_score_sb[0].index[score]
+
+    def rates(summaries, multiband=False):
+        rates = pd.concat([summary.loc[name] for summary in summaries], axis=1, keys=sample_list)
+        columns = rates.index.str.rsplit('_', n=1)
+        rates.index = pd.MultiIndex.from_arrays([columns.str[0], columns.str[1]],
+                                                names=['method', 'band'])
+        if multiband:
+            rates = rates.xs('g', level='band', drop_level=False).rename(index={'g': 'all'})
+        return rates.stack().rename_axis(['method', 'band', 'n_samples'])
+
+    cube = pd.concat([rates(fold_score_sb), rates(fold_score_mb, True)]).to_frame(name)
+    cube = pd.concat({'': cube}, names=['class'])
+    multiband_methods = ["MHAOV"] if MHAOV else method_list
+    return plot_hitrate(cube, method_list, name, multiband_methods, figsize=figsize, file=file)
+
+
+
+def time_plot(sample_list, periods_sb, periods_mb, method_list, MHAOV=False, figsize=(20,10),
+              file=None):
+    """
+    Plots the computing time on single band and multi band obtained from
+    the period estimation process
+
     Parameters
     ---------
     sample_list: positive integer python list
@@ -102,45 +319,11 @@ def time_plot(sample_list, periods_sb, periods_mb, method_list, MHAOV=False, fig
 
     figsize: float tuple
         Tuple to indicate the size of the plot -> Width x height in inches
-    """         
-    plt.rcParams['axes.grid'] = True
-    font = {'size'   : 15,
-           'weight':'bold'}
-    plt.rc('font', **font)    
-    
-    fig, ax = plt.subplots(nrows=1,
-                           ncols=3,
-                           figsize=figsize,
-                          sharex=True,
-                          sharey=True)
-    style = ["-o","-^","-x","-8","-*","-+","-p"]
-    
-    for idxx, method in enumerate(method_list):
-        for idx, band in enumerate(["g","r"]):
-            ax[idx].plot(sample_list,
-                       [periods[f"{method}_time_{band}"].mean() for periods in periods_sb],
-                       style[idxx])
-            ax[idx].legend(method_list)
-            ax[idx].set_xlabel("N° samples", **font)
-            ax[idx].set_ylabel("Time [s]", **font)
-            ax[idx].set_title(f"{band.upper()} - band", **font)
-            ax[idx].set_yscale("log")
-                
-        if MHAOV:
-            ax[2].plot(sample_list,
-                       [periods[f"MHAOV_time"].mean() for periods in periods_mb],
-                       "-o")
-            ax[2].legend(["MHAOV"])
-            ax[2].set_xlabel("N° Samples", **font)
-            ax[2].set_title(f"All - band", **font)
-            ax[2].set_yscale("log")
-        else:
-            ax[2].plot(sample_list,
-                       [periods[f"{method}_time"].mean() for periods in periods_mb],
-                       "-o")
-            ax[2].legend(method_list)
-            ax[2].set_xlabel("N° Samples", **font)
-            ax[2].set_title(f"All - band", **font)
-            ax[2].set_yscale("log")
-    ax[1].set_ylabel("")
-    plt.show()           
\ No newline at end of file
+
+    file: string
+        File where the figure is written without showing it
+    """
+    cube = time_cube({('', n_samples): periods for n_samples, periods in zip(sample_list, periods_sb)},
+                     {('', n_samples): periods for n_samples, periods in zip(sample_list, periods_mb)})
+    multiband_methods = ["MHAOV"] if MHAOV else method_list
+    return plot_time(cube, method_list, multiband_methods, figsize=figsize, file=file)
@@ -1,89 +1,221 @@
 import pandas as pd
 import numpy as np
 
+SCORES = ["Differs", "Ok", "Half", "Multiply", "Null"]
+
+CATALOG_SCORES = ["Wrong", "Right", "Multiply"]
+
+KEYS = ['class', 'n_samples', 'method', 'band']
+
+
+def _score_dtype(score_names):
+    """
+    Categorical type of the scores, with the known scores first so
+    tables of different classes can be concatenated
+    """
+    return pd.CategoricalDtype(SCORES + [name for name in score_names if name not in SCORES])
+
+
+def scores_table(fold_scores, score_names, obj_class=None, n_samples=None, sources=None,
+                 catalog=True):
+    """
+    Converts the scores of a folded curve inspection to a long format
+    table with one row per object, method and band and the columns
+    class, n_samples, oid, method, band and score. The score is a
+    categorical with the names of the scores, so tables of different
+    classes and number of samples can be concatenated and summarized
+    together, see 'summarize_scores'. With catalog, the 'catalog' column
+    is kept as the catalog score of each row instead of a method
+
+    Parameters
+    ---------
+    fold_scores: pandas DataFrame
+        DataFrame containing the scores of the period estimation
+        of a class using multiple methods, indexed by oid with one
+        '<method>_<band>' column per method and band
+
+    score_names: string python list
+        List of the criteria names used for scoring, in the order of
+        their codes. The next code is the null score
+
+    obj_class: string
+        Class of the objects
+
+    n_samples: positive integer
+        Number of samples used in the estimations
+
+    sources: pandas Series
+        Catalog source of each oid, as the 'source' column of the tags
+
+    catalog: boolean
+        Condition to keep the 'catalog' column as the catalog score,
+        with the codes 0 wrong, 1 right and 2 multiply
+    """
+    names = list(score_names) + ["Null"]
+    codes = fold_scores.drop(columns='catalog') if catalog and 'catalog' in fold_scores else fold_scores
+    values = codes.to_numpy(dtype=float)
+    if np.any((values < 0) | (values >= len(names))):
+        raise ValueError(f"Scores must be codes between 0 and {len(names) - 1} for {names}")
+    values = np.where(np.isnan(values), len(names) - 1, values).astype(int)
+
+    oids = np.asarray(fold_scores.index)
+    columns = pd.Index(codes.columns).str.rsplit('_', n=1)
+    table = pd.DataFrame({
+        'class': obj_class,
+        'n_samples': n_samples,
+        'oid': np.repeat(oids, len(columns)),
+        'method': np.tile(columns.str[0], len(oids)),
+        'band': np.tile(columns.str[1], len(oids)),
+        'score': pd.Categorical(np.array(names)[values.ravel()], dtype=_score_dtype(names))})
+    if catalog and 'catalog' in fold_scores:
+        table['catalog'] = np.repeat(catalog_table(fold_scores).catalog.values, len(columns))
+    if sources is not None:
+        table['source'] = sources.reindex(table.oid).to_numpy()
+    return table
+
+
+def catalog_table(fold_scores, obj_class=None, n_samples=None, sources=None):
+    """
+    Converts the catalog scores of a folded curve inspection to a long
+    format table with one row per object and the columns class,
+    n_samples, oid, catalog and source, see 'source_summary'
+
+    Parameters
+    ---------
+    fold_scores: pandas DataFrame
+        DataFrame indexed by oid with the 'catalog' column, with the
+        codes 0 wrong, 1 right and 2 multiply
+
+    obj_class: string
+        Class of the objects
+
+    n_samples: positive integer
+        Number of samples used in the estimations
+
+    sources: pandas Series
+        Catalog source of each oid, as the 'source' column of the tags
+    """
+    table = pd.DataFrame({
+        'class': obj_class,
+        'n_samples': n_samples,
+        'oid': np.asarray(fold_scores.index),
+        'catalog': pd.Categorical.from_codes(fold_scores.catalog.fillna(-1).to_numpy(dtype=int),
+                                             CATALOG_SCORES)})
+    if sources is not None:
+        table['source'] = sources.reindex(table.oid).to_numpy()
+    return table
+
+
+def summarize_scores(table, by=KEYS):
+    """
+    Summarizes a long format table of scores in one pass. Returns a
+    DataFrame indexed by the 'by' columns with the hit rate of each
+    score over the non null scores, the 'Null' rate over all the scores
+    and the number 'n' of scores of each group
+
+    Parameters
+    ---------
+    table: pandas DataFrame
+        Scores of any number of classes, samples, methods and bands,
+        as returned by 'scores_table'
+
+    by: string python list
+        Columns of the table defining the groups
+    """
+    by = [column for column in by if column in table]
+    counts = table.groupby(by + ['score'], sort=False, observed=True, dropna=False).size()
+    counts = counts.unstack('score', fill_value=0)
+    names = list(table.score.cat.categories)
+    counts = counts.reindex(columns=list(dict.fromkeys(names + ["Null"])), fill_value=0)
+    total = counts.sum(axis=1)
+    summary = counts.drop(columns="Null").div(total - counts["Null"], axis=0)
+    summary["Null"] = counts["Null"] / total
+    summary["n"] = total
+    summary.columns.name = None
+    return summary
+
+
+def source_summary(table):
+    """
+    Fraction of catalog periods scored as right for each catalog source,
+    computed per class and averaged over the classes
+
+    Parameters
+    ---------
+    table: pandas DataFrame
+        Catalog scores and sources of any number of classes, as
+        returned by 'catalog_table' or 'scores_table'
+    """
+    objects = table.drop_duplicates(['class', 'n_samples', 'oid'])
+    right = (objects.catalog == "Right").groupby(
+        [objects.source, objects['class']], sort=False, dropna=False).mean()
+    return right.unstack('class').round(2).mean(axis=1)
+
+
 def fold_scores_summary(fold_scores, score_names):
-    """ 
-    Summarizes the scores from a folded curve inspection in 
+    """
+    Summarizes the scores from a folded curve inspection in
     a DataFrame format
-    
+
     Parameters
     ---------
     fold_scores: pandas DataFrame
         DataFrame containing the scores of the period estimation
-        of a class using multiple methods 
+        of a class using multiple methods
 
-    score_names: string python list 
+    score_names: string python list
         List of the criteria names used for scoring
-    """    
-    score_df = pd.DataFrame(index=range(len(score_names)+2),
-                            columns=fold_scores.columns)
-    scores = []
-    for i in fold_scores.columns:
-        scores.append(fold_scores[i].value_counts())
-    scores = pd.concat(scores, axis=1).sort_index()
-    score_df.fillna(scores,inplace=True)
-    score_names += ["Null", "Non-Nulls"]
-    score_df.rename(lambda i: score_names[int(i)],inplace=True)
-    score_df.fillna(0,inplace=True)
-    score_df.loc["Non-Nulls"] = 100 - score_df.loc["Null"]
-    
-    score_df, nulls_df = score_df.iloc[:-2], score_df.iloc[-2:]
-    
-    score_df /= nulls_df.loc["Non-Nulls"]
-    return score_df, nulls_df/100
+    """
+    table = scores_table(fold_scores, score_names, catalog=False)
+    summary = summarize_scores(table, ['method', 'band'])
+    summary.index = [method if pd.isna(band) else f"{method}_{band}" for method, band in summary.index]
+    score_df = summary[list(score_names)].T
+    nulls_df = pd.DataFrame([summary["Null"], 1 - summary["Null"]], index=["Null", "Non-Nulls"])
+    return score_df, nulls_df
 
 
 def summary_source(classes_fold_score_list, classes_periods, classes):
-    """ 
-    Summarizes the scores of multiple classes from the folded curves 
-    inspection in a DataFrame format considering only the data from the 
+    """
+    Summarizes the scores of multiple classes from the folded curves
+    inspection in a DataFrame format considering only the data from the
     catalogs
-    
+
     Parameters
     ---------
     classes_fold_score_list: pandas DataFrame python list
         List of DataFrames containing the scores of the period estimation
         of multiple classes
 
-    classes_periods: pandas DataFrame python list 
+    classes_periods: pandas DataFrame python list
         List of DataFrames containing the catalog's periods
 
     classes: string python list
         List of the names of the classes to be considered
-    """        
-    scores = []
-    for idx in range(len(classes_periods)):
-        temp = pd.concat([classes_fold_score_list[idx], classes_periods[idx].source], axis=1)
-        temp = temp.groupby(['source', 'catalog']).size().unstack(fill_value=0).T
-        scores.append(temp)
-    score_df = pd.concat(scores, keys=classes)
-    score_df.index.set_levels(["Wrong", "Right", "Multiply"], 
-                              level=1,
-                              inplace=True)
-    score_df = (score_df.T.fillna(0))
-    dividend = score_df.iloc[:, score_df.columns.get_level_values(1)=="Right"].T.droplevel(-1).T
-    divisor = score_df.T.groupby(level=0).sum().T.loc[:,["RRL","Ceph","LPV","DSCT","EB"]]
-    return dividend.divide(divisor).round(2).mean(axis=1)    
-
-
-
-def summary_scores(fold_scores_list):
-    """ 
-    Summarizes the scores from multiple folded curves inspection in 
+    """
+    table = pd.concat([catalog_table(fold_scores, obj_class, sources=periods.source)
+                       for fold_scores, periods, obj_class
+                       in zip(classes_fold_score_list, classes_periods, classes)])
+    return source_summary(table)
+
+
+
+def summary_scores(fold_scores_list, n_samples_list=None):
+    """
+    Summarizes the scores from multiple folded curves inspection in
     a DataFrame format for a single class.
-    
+
     Parameters
     ---------
     fold_scores_list: pandas DataFrame python list
-        List of DataFrames containing the scores of the period estimation
-        of a single class with different number of samples being used
-    """        
-    d = {}
-    nulls = {}
-    for idx, score in enumerate(fold_scores_list):
-        d.update({f"{idx+1}0 samples:": score[0].T})
-        nulls.update({f"{idx+1}0 samples:": score[1].T})
-        
-    summary_scores = pd.concat(d.values(), axis=1, keys=d.keys()).T
-    summary_nulls = pd.concat(nulls.values(), axis=1, keys=nulls.keys()).T
-    return summary_scores, summary_nulls
\ No newline at end of file
+        List of the summaries returned by 'fold_scores_summary' of a
+        single class with different number of samples being used
+
+    n_samples_list: positive integer python list
+        Number of samples of each summary. By default 10, 20, 30...
+    """
+    if n_samples_list is None:
+        n_samples_list = [10 * (idx + 1) for idx in range(len(fold_scores_list))]
+    keys = [f"{n_samples} samples:" for n_samples in n_samples_list]
+    summary_scores = pd.concat([score[0].T for score in fold_scores_list], axis=1, keys=keys).T
+    summary_nulls = pd.concat([score[1].T for score in fold_scores_list], axis=1, keys=keys).T
+    return summary_scores, summary_nulls
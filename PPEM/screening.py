@@ -0,0 +1,187 @@
+import time
+import numpy as np
+import pandas as pd
+from PPEM.batch_periodogram import BATCH_METHODS
+from PPEM.period_estimation import multi_method_estimation, method_columns
+from PPEM.light_curves import light_curve_collection, band_name
+from PPEM.folding import detection_segments
+from PPEM.fold_quality import classify_periods, score_names, time_spans
+
+SCREEN_STATUS = ['constant', 'confirmed', 'escalated']
+
+
+def variability(collection):
+    """
+    Reduced chi square of the magnitudes of every object and band
+    against their weighted mean, with shape (n_objects, n_bands). Values
+    close to 1 are consistent with a constant source within the errors,
+    bands with less than two detections are 0
+
+    Parameters
+    ---------
+    collection: light_curve_collection
+        Detections of the objects
+    """
+    segments = detection_segments(collection)
+    n_segments = collection.offsets.shape[0] * len(collection.fids)
+    counts = np.bincount(segments, minlength=n_segments)
+    w = 1 / np.asarray(collection.err, dtype=np.float64)**2
+    mag = np.asarray(collection.mag, dtype=np.float64)
+    weights = np.bincount(segments, w, n_segments)
+    mean = np.bincount(segments, w * mag, n_segments) / np.where(weights > 0, weights, 1.0)
+    chi2 = np.bincount(segments, w * (mag - mean[segments])**2, n_segments)
+    return (chi2 / np.maximum(counts - 1, 1)).reshape(-1, len(collection.fids))
+
+
+def cascade_estimation(objs, tags, methods, screen_method='MHAOV', n_samples=None,
+                       multiband=False, max_chi2=5.0, max_drift=1.0, min_points=5, n_jobs=1,
+                       chunksize=None, executor=None, cache=None, grid=None, backend='P4J',
+                       fids=(1, 2), obj_class=None):
+    """
+    Computes the period of multiple objects in a cascade, running the
+    expensive methods only on the objects that a cheap screen can't
+    settle. The screen has two stages:
+
+        constant: every band has a reduced chi square below max_chi2,
+            see 'variability', so the light curve shows no variability
+            and no period is estimated
+        confirmed: the period of screen_method with the numpy backend
+            agrees with the catalog 'period' on every band with at least
+            min_points detections, see 'fold_quality.classify_periods'
+
+    The rest of the objects are escalated to the methods. The result has
+    the reduced chi square of each band ('screen_chi2_<band>'), the
+    columns of the screen method prefixed with 'screen_', the 'screen'
+    status and the columns of 'multi_method_estimation' for the methods,
+    which are empty for the settled objects. The time of the cascade and
+    an estimate of the time of running the methods on every object, from
+    the mean time of the escalated ones, are stored with the fraction of
+    compute saved in the 'screening' entry of the 'attrs' of the result,
+    see 'screening_summary'
+
+    Parameters
+    ---------
+    objs: pandas DataFrame or light_curve_collection
+        Detections of the objects
+
+    tags: pandas DataFrame
+        Tags of the objects indexed by oid with the catalog 'period'.
+        Objects without catalog period can't be confirmed. Only its
+        objects are estimated
+
+    methods: string python list
+        Expensive methods used to perform the fit, see 'get_period'
+
+    screen_method: {'MHAOV', 'PDM1', 'LKSL'}
+        Fast periodogram of the screen, see 'BATCH_METHODS'
+
+    n_samples: positive integer
+        Number of samples to be used for the period estimation
+
+    multiband: boolean
+        Condition to choose if the period estimation will consider
+        the bands seperatly (single band) or all together (multi band)
+
+    max_chi2: float
+        Reduced chi square below which a band is considered constant
+
+    max_drift: float
+        Maximum drift in cycles of a period agreeing with the catalog,
+        see 'fold_quality.phase_drift'
+
+    min_points: positive integer
+        Minimum number of detections of a band to be considered by
+        the confirmation
+
+    n_jobs, chunksize, executor, cache, grid, backend, fids:
+        Estimation of the screen and the methods, see
+        'multi_object_estimation'. The screen always uses the numpy
+        backend, sweeping an adaptive grid exhaustively
+
+    obj_class: string
+        Class of the objects, stored with the summary
+    """
+    if screen_method not in BATCH_METHODS:
+        raise ValueError(f"The screen method must be one of {BATCH_METHODS}")
+    if not isinstance(objs, light_curve_collection):
+        objs = light_curve_collection.from_dataframe(objs, fids)
+    collection = objs[[oid for oid in tags.index if oid in objs]]
+    oids = pd.Index(collection.oids, name='oid')
+    band_names = [band_name(band_fid) for band_fid in collection.fids]
+    estimation = dict(n_jobs=n_jobs, chunksize=chunksize, executor=executor, grid=grid,
+                      fids=collection.fids)
+
+    start = time.perf_counter()
+    chi2 = variability(collection)
+    constant = (chi2 < max_chi2).all(axis=1)
+    variable = list(oids[~constant])
+    if variable:
+        screen_estimation = dict(estimation, grid=None if grid is None else grid.exhaustive())
+        screen = multi_method_estimation(collection[variable], [screen_method], n_samples,
+                                         multiband, backend='numpy', **screen_estimation)
+    else:
+        screen = pd.DataFrame(columns=method_columns(screen_method, multiband, collection.fids),
+                              index=pd.Index([], name='oid'))
+    screen = screen.reindex(oids)
+    n_points = np.diff(collection.offsets, axis=1)
+    if n_samples is not None:
+        n_points = np.minimum(n_points, n_samples)
+    if multiband:
+        periods = screen[[f'{screen_method}_T']].to_numpy(dtype=float)
+        n_points = n_points.sum(axis=1, keepdims=True)
+    else:
+        periods = screen[[f'{screen_method}_T_{name}' for name in band_names]].to_numpy(dtype=float)
+    names = score_names()
+    codes = classify_periods(periods, tags.period.loc[oids].to_numpy(dtype=float)[:, None],
+                             time_spans(collection)[:, None], n_points, max_drift,
+                             min_points=min_points)
+    confirmed = (~constant & ((codes == names.index("Ok")) | (codes == len(names))).all(axis=1)
+                 & (codes == names.index("Ok")).any(axis=1))
+    screen_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    escalated = list(oids[~constant & ~confirmed])
+    columns = [column for method in methods
+               for column in method_columns(method, multiband, collection.fids)]
+    if escalated:
+        estimated_periods = multi_method_estimation(collection[escalated], methods, n_samples,
+                                                    multiband, cache=cache, backend=backend,
+                                                    **estimation)
+    else:
+        estimated_periods = pd.DataFrame(columns=columns, index=pd.Index([], name='oid'))
+    expensive_time = time.perf_counter() - start
+
+    status = np.where(constant, 'constant', np.where(confirmed, 'confirmed', 'escalated'))
+    result = pd.concat([
+        pd.DataFrame(chi2, columns=[f'screen_chi2_{name}' for name in band_names], index=oids),
+        screen.add_prefix('screen_'),
+        pd.DataFrame({'screen': pd.Categorical(status, categories=SCREEN_STATUS)}, index=oids),
+        estimated_periods.reindex(oids)], axis=1)
+    samples = [column for column in result.columns if '_samples_' in column]
+    result = result.astype({column: 'Int64' for column in samples})
+
+    full_time = expensive_time / len(escalated) * len(oids) if escalated else np.nan
+    result.attrs['screening'] = {
+        'class': obj_class, 'n_objects': len(oids),
+        'constant': int(constant.sum()), 'confirmed': int(confirmed.sum()),
+        'escalated': len(escalated),
+        'screen_time': screen_time, 'expensive_time': expensive_time,
+        'full_time': full_time,
+        'saved_fraction': 1 - (screen_time + expensive_time) / full_time if escalated else np.nan}
+    return result
+
+
+def screening_summary(results):
+    """
+    Summarizes the cascades of several classes in a DataFrame indexed
+    by class with the number of constant, confirmed and escalated
+    objects, the times of the screen and the methods [s], the estimated
+    time of running the methods on every object and the fraction of
+    compute saved
+
+    Parameters
+    ---------
+    results: pandas DataFrame python list
+        Results of 'cascade_estimation'
+    """
+    return pd.DataFrame([result.attrs['screening'] for result in results]).set_index('class')
@@ -0,0 +1,284 @@
+import os
+import glob
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+FORMATS = {'.parquet': 'parquet', '.feather': 'feather'}
+
+OBJECT_DTYPES = {'candoid': 'int64',
+                 'mjd': 'float64',
+                 'fid': 'int8',
+                 'magpsf': 'float64',
+                 'sigmapsf': 'float64',
+                 'magpsf_corr': 'float64',
+                 'sigmapsf_corr_ext': 'float64'}
+
+TAG_CATEGORIES = ['classALeRCE', 'source']
+
+
+def _format(path, format=None):
+    """
+    Returns the columnar format of a file, given explicitly or
+    inferred from its extension
+    """
+    if pyarrow is None:
+        raise ImportError("The columnar storage needs pyarrow, install it with 'pip install pyarrow'")
+    if format is None:
+        format = FORMATS.get(os.path.splitext(path)[1])
+    if format not in FORMATS.values():
+        raise ValueError(f"Unknown format of {path}, use one of {list(FORMATS.values())}")
+    return format
+
+
+def _write(df, path, format=None):
+    """
+    Writes a DataFrame indexed by oid in a columnar file. The index is
+    stored as a regular column since Feather doesn't keep it
+    """
+    format = _format(path, format)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    df = df.reset_index()
+    if format == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_feather(path)
+
+
+def _read(path, columns=None, oids=None, format=None):
+    """
+    Reads a DataFrame indexed by oid from a columnar file. Only the
+    requested columns and the rows of the requested oids are loaded
+    """
+    format = _format(path, format)
+    if columns is not None:
+        columns = ['oid'] + [column for column in columns if column != 'oid']
+    if format == 'parquet':
+        filters = None if oids is None else [('oid', 'in', list(oids))]
+        df = pd.read_parquet(path, columns=columns, filters=filters)
+    else:
+        df = pd.read_feather(path, columns=columns)
+        if oids is not None:
+            df = df[df.oid.isin(oids)]
+    return df.set_index('oid')
+
+
+def save_objects(objs_df, path, format=None):
+    """
+    Saves the detections of multiple objects in a columnar file with
+    typed columns, see 'load_objects'
+
+    Parameters
+    ---------
+    objs_df: pandas DataFrame
+        DataFrame containing the detection data of multiple
+        objects, indexed by oid
+
+    path: string
+        File to be written, with extension '.parquet' or '.feather'
+
+    format: {'parquet', 'feather'}
+        Format of the file. By default it's inferred from the extension
+    """
+    dtypes = {column: dtype for column, dtype in OBJECT_DTYPES.items() if column in objs_df}
+    _write(objs_df.astype(dtypes), path, format)
+
+
+def load_objects(path, oids=None, columns=None, format=None):
+    """
+    Loads the detections saved with 'save_objects' in the format used
+    by 'periodic_stars.set_objects'
+
+    Parameters
+    ---------
+    path: string
+        File to be read
+
+    oids: string python list
+        If given, only the detections of these objects are loaded
+
+    columns: string python list
+        If given, only these columns are loaded
+
+    format: {'parquet', 'feather'}
+        Format of the file. By default it's inferred from the extension
+    """
+    return _read(path, columns, oids, format)
+
+
+def save_periods(periods_df, path, format=None):
+    """
+    Saves the tags and estimated periods returned by
+    'periodic_stars.compute_periods' in a columnar file. The class
+    and source of the tags are stored as categories
+
+    Parameters
+    ---------
+    periods_df: pandas DataFrame
+        DataFrame with the tags and the estimations, indexed by oid
+
+    path: string
+        File to be written, with extension '.parquet' or '.feather'
+
+    format: {'parquet', 'feather'}
+        Format of the file. By default it's inferred from the extension
+    """
+    categories = {column: 'category' for column in TAG_CATEGORIES if column in periods_df}
+    _write(periods_df.astype(categories), path, format)
+
+
+def load_periods(path, columns=None, oids=None, format=None):
+    """
+    Loads the tags and estimated periods saved with 'save_periods'.
+    Loading only the columns of one method avoids reading the
+    whole sweep
+
+    Parameters
+    ---------
+    path: string
+        File to be read
+
+    columns: string python list
+        If given, only these columns are loaded
+
+    oids: string python list
+        If given, only the rows of these objects are loaded
+
+    format: {'parquet', 'feather'}
+        Format of the file. By default it's inferred from the extension
+    """
+    return _read(path, columns, oids, format)
+
+
+def read_fold_scores_xlsx(file):
+    """
+    Reads the scores of a folded curves inspection from the original
+    spreadsheets, keeping the oid as index and only the columns of the
+    scores (the catalog and the methods by band)
+
+    Parameters
+    ---------
+    file: string
+        Spreadsheet to be read
+    """
+    fold_scores = pd.read_excel(file, index_col=0)
+    return fold_scores.loc[:, ~fold_scores.columns.str.startswith('Unnamed')]
+
+
+def save_fold_scores(fold_scores, path, format=None):
+    """
+    Saves the scores of a folded curves inspection in a columnar
+    file. The scores are stored as small integers
+
+    Parameters
+    ---------
+    fold_scores: pandas DataFrame
+        DataFrame containing the scores of the period estimation
+        of a class, indexed by oid, as used by 'fold_scores_summary'
+
+    path: string
+        File to be written, with extension '.parquet' or '.feather'
+
+    format: {'parquet', 'feather'}
+        Format of the file. By default it's inferred from the extension
+    """
+    fold_scores = fold_scores.copy()
+    fold_scores.index.name = 'oid'
+    _write(fold_scores.astype('int8'), path, format)
+
+
+def load_fold_scores(path, columns=None, format=None):
+    """
+    Loads the scores saved with 'save_fold_scores', ready to be used
+    by 'fold_scores_summary'
+
+    Parameters
+    ---------
+    path: string
+        File to be read
+
+    columns: string python list
+        If given, only these columns are loaded
+
+    format: {'parquet', 'feather'}
+        Format of the file. By default it's inferred from the extension
+    """
+    return _read(path, columns, None, format)
+
+
+def save_scores(table, path, format=None):
+    """
+    Saves a long format table of scores, as returned by
+    'scoring.scores_table', in a columnar file. The scores are kept
+    as categories
+
+    Parameters
+    ---------
+    table: pandas DataFrame
+        Scores with one row per object, method and band and an 'oid'
+        column
+
+    path: string
+        File to be written, with extension '.parquet' or '.feather'
+
+    format: {'parquet', 'feather'}
+        Format of the file. By default it's inferred from the extension
+    """
+    _write(table.set_index('oid'), path, format)
+
+
+def load_scores(path, columns=None, format=None):
+    """
+    Loads a long format table of scores saved with 'save_scores', ready
+    to be used by 'scoring.summarize_scores' and 'score_plot.score_cube'
+
+    Parameters
+    ---------
+    path: string
+        File to be read
+
+    columns: string python list
+        If given, only these columns are loaded
+
+    format: {'parquet', 'feather'}
+        Format of the file. By default it's inferred from the extension
+    """
+    return _read(path, columns, None, format).reset_index()
+
+
+def convert_csv_data(data_path='csv_data', out_path='columnar_data', format='parquet'):
+    """
+    Converts the bundled detections, period estimations and fold
+    scores from CSV and xlsx to columnar files, keeping the directory
+    structure of 'data_path'. Returns the list of written files
+
+    Parameters
+    ---------
+    data_path: string
+        Path of the 'csv_data' directory
+
+    out_path: string
+        Directory where the columnar files are written
+
+    format: {'parquet', 'feather'}
+        Format of the written files
+    """
+    extension = {value: key for key, value in FORMATS.items()}[_format('', format)]
+    converters = [('objs_samples/*.csv',
+                   lambda file: pd.read_csv(file, index_col='oid'), save_objects),
+                  ('period_estimations/**/*.csv',
+                   lambda file: pd.read_csv(file, index_col='oid'), save_periods),
+                  ('folded_scores/**/*.xlsx', read_fold_scores_xlsx, save_fold_scores)]
+    written = []
+    for pattern, reader, writer in converters:
+        for file in sorted(glob.glob(os.path.join(data_path, pattern), recursive=True)):
+            out_file = os.path.splitext(os.path.relpath(file, data_path))[0] + extension
+            out_file = os.path.join(out_path, out_file)
+            writer(reader(file), out_file, format)
+            written.append(out_file)
+    return written
@@ -0,0 +1,347 @@
+import os
+import json
+import time
+import socket
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from PPEM.frequency_grid import frequency_grid, DEFAULT_GRID
+from PPEM.light_curves import light_curve_collection, object_ids, select_objects
+from PPEM.period_estimation import object_multi_estimation, method_columns
+from PPEM.storage import FORMATS, load_objects
+
+CLASSES = ['RRL', 'Ceph', 'LPV', 'DSCT', 'EB']
+
+
+def _load_objects(path):
+    """
+    Loads the detections of a class from a csv file, a columnar file
+    or a light_curve_collection directory
+    """
+    if os.path.isdir(path):
+        return light_curve_collection.load(path)
+    if os.path.splitext(path)[1] in FORMATS:
+        return load_objects(path)
+    return pd.read_csv(path, index_col='oid')
+
+
+def _read_lines(file):
+    """
+    Reads the records of a results file. A line cut by a crash while
+    it was being written is ignored
+    """
+    records = []
+    if not os.path.exists(file):
+        return records
+    with open(file) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def _truncate_partial(file):
+    """
+    Removes a line cut by a crash while it was being written from the
+    end of a results file, so the next record starts on its own line
+    """
+    if not os.path.exists(file):
+        return
+    with open(file, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+class sweep:
+
+    def __init__(self, path, objects=None, methods=None, n_samples_list=(None,),
+                 multiband_modes=(False,), grid=None, chunk_size=50):
+        """
+        Resumable period estimation sweep over classes, methods, number
+        of samples and band modes. The sweep is split in tasks of
+        chunk_size objects of a class with a number of samples and a
+        band mode. Every estimated object is appended to the results of
+        its task as soon as it's computed, so an interrupted sweep
+        continues where it stopped and only the missing (oid, method)
+        pairs are computed again. Tasks are claimed with lock files, so
+        several processes or machines sharing the directory can run the
+        same sweep at the same time, see 'run'
+
+        The definition of the sweep is stored in 'path'. Opening an
+        existing sweep only needs the path
+
+        Parameters
+        ---------
+        path: string
+            Directory of the sweep
+
+        objects: dictionary
+            {class: detections file}, with csv, Parquet or Feather files
+            or light_curve_collection directories. By default the
+            bundled 'csv_data/objs_samples' of every class
+
+        methods: string python list
+            Methods used to perform the fit, see 'get_period'
+
+        n_samples_list: positive integer python list
+            Number of samples to be used, None uses all the detections
+
+        multiband_modes: boolean python list
+            Band modes to be run, single band (False) and multi band (True)
+
+        grid: frequency_grid object
+            Trial frequencies of the periodograms. By default
+            'DEFAULT_GRID' is used
+
+        chunk_size: positive integer
+            Number of objects of each task
+        """
+        self.path = path
+        config_file = os.path.join(path, 'sweep.json')
+        if os.path.exists(config_file):
+            with open(config_file) as f:
+                self.config = json.load(f)
+            if methods is not None and list(methods) != self.config['methods']:
+                raise ValueError(f"The sweep at {path} was created with the methods "
+                                 f"{self.config['methods']}")
+        else:
+            if methods is None:
+                raise ValueError("The methods are needed to create a new sweep")
+            if objects is None:
+                objects = {obj_class: os.path.join('csv_data', 'objs_samples', f'{obj_class}_objs.csv')
+                           for obj_class in CLASSES}
+            self.config = {'objects': {obj_class: os.path.abspath(file)
+                                       for obj_class, file in objects.items()},
+                           'methods': list(methods),
+                           'grid': (grid if grid is not None else DEFAULT_GRID).settings(),
+                           'tasks': self._make_tasks(objects, n_samples_list, multiband_modes,
+                                                     chunk_size)}
+            for directory in ['results', 'locks', 'done']:
+                os.makedirs(os.path.join(path, directory), exist_ok=True)
+            tmp_file = config_file + f'.{os.getpid()}.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump(self.config, f)
+            os.replace(tmp_file, config_file)
+        self.methods = self.config['methods']
+        self.grid = frequency_grid(**self.config['grid'])
+        self._objects = {}
+
+
+    @staticmethod
+    def _make_tasks(objects, n_samples_list, multiband_modes, chunk_size):
+        """
+        Splits the sweep in tasks, {task id: {class, n_samples,
+        multiband, oids}}
+        """
+        tasks = {}
+        for obj_class, file in objects.items():
+            oids = [str(oid) for oid in object_ids(_load_objects(file))]
+            for n_samples in n_samples_list:
+                for multiband in multiband_modes:
+                    for chunk, start in enumerate(range(0, len(oids), chunk_size)):
+                        task_id = (f"{obj_class}_{n_samples or 'all'}_"
+                                   f"{'mb' if multiband else 'sb'}_{chunk:05d}")
+                        tasks[task_id] = {'class': obj_class,
+                                          'n_samples': n_samples,
+                                          'multiband': multiband,
+                                          'oids': oids[start:start + chunk_size]}
+        return tasks
+
+
+    def _file(self, directory, task_id, extension=''):
+        return os.path.join(self.path, directory, task_id + extension)
+
+
+    def objects(self, obj_class):
+        """
+        Returns the detections of a class, loaded once per process
+        """
+        if obj_class not in self._objects:
+            self._objects[obj_class] = _load_objects(self.config['objects'][obj_class])
+        return self._objects[obj_class]
+
+
+    def is_done(self, task_id):
+        return os.path.exists(self._file('done', task_id))
+
+
+    def claim(self, task_id, stale_after=600):
+        """
+        Tries to claim a task for this process by creating its lock
+        file. Locks that haven't been refreshed in stale_after seconds
+        belong to a dead process and are taken over. Returns True if
+        the task was claimed
+
+        Parameters
+        ---------
+        task_id: string
+            Identifier of the task
+
+        stale_after: positive float
+            Seconds after which a lock is considered stale
+        """
+        lock = self._file('locks', task_id, '.lock')
+        owner = {'host': socket.gethostname(), 'pid': os.getpid(), 'time': time.time()}
+        for _ in range(2):
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock) < stale_after:
+                        return False
+                    stale = f"{lock}.{owner['host']}.{owner['pid']}.stale"
+                    os.replace(lock, stale)
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump(owner, f)
+            return True
+        return False
+
+
+    def release(self, task_id):
+        try:
+            os.remove(self._file('locks', task_id, '.lock'))
+        except FileNotFoundError:
+            pass
+
+
+    def run_task(self, task_id):
+        """
+        Estimates the missing (oid, method) pairs of a task, appending
+        one line per object and method to its results file. A line cut
+        by a previous crash is removed first. The task is marked as done
+        only when the results file has every (oid, method) pair, which
+        is checked reading it again. The lock of the task is refreshed
+        after each object. Returns True if the task was marked as done
+        """
+        task = self.config['tasks'][task_id]
+        results_file = self._file('results', task_id, '.jsonl')
+        lock = self._file('locks', task_id, '.lock')
+        _truncate_partial(results_file)
+        done = {(record['oid'], record['method']) for record in _read_lines(results_file)}
+        objs = self.objects(task['class'])
+        with open(results_file, 'a') as f:
+            for oid in task['oids']:
+                methods = [method for method in self.methods if (oid, method) not in done]
+                if not methods:
+                    continue
+                query = object_multi_estimation(select_objects(objs, oid), methods,
+                                                task['n_samples'], task['multiband'],
+                                                grid=self.grid)
+                n_columns = len(query) // len(methods)
+                for idx, method in enumerate(methods):
+                    values = query[idx * n_columns:(idx + 1) * n_columns]
+                    f.write(json.dumps({'oid': oid, 'method': method,
+                                        'values': [None if pd.isna(value) else float(value)
+                                                   for value in values]}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+                if os.path.exists(lock):
+                    os.utime(lock)
+        done = {(record['oid'], record['method']) for record in _read_lines(results_file)}
+        missing = [(oid, method) for oid in task['oids'] for method in self.methods
+                   if (oid, method) not in done]
+        if missing:
+            print(f"Task {task_id} is missing {len(missing)} results, it's left pending")
+            return False
+        with open(self._file('done', task_id), 'w') as f:
+            f.write(socket.gethostname())
+        return True
+
+
+    def run(self, n_jobs=1, stale_after=600):
+        """
+        Runs the pending tasks of the sweep. Each process claims one
+        task at a time, so the same sweep can be run at the same time
+        from several machines sharing the directory. Returns the number
+        of tasks completed
+
+        Parameters
+        ---------
+        n_jobs: positive integer
+            Number of worker processes of this machine
+
+        stale_after: positive float
+            Seconds after which the lock of a task whose process died
+            is taken over, see 'claim'
+        """
+        if n_jobs == 1:
+            return _work(self.path, stale_after)
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            return sum(pool.map(_work, [self.path] * n_jobs, [stale_after] * n_jobs))
+
+
+    def status(self):
+        """
+        Returns a DataFrame with the number of tasks and of done tasks
+        of each class, number of samples and band mode
+        """
+        rows = [[task['class'], task['n_samples'], task['multiband'], self.is_done(task_id)]
+                for task_id, task in self.config['tasks'].items()]
+        status = pd.DataFrame(rows, columns=['class', 'n_samples', 'multiband', 'done'])
+        status['n_samples'] = status.n_samples.astype(object)
+        return status.groupby(['class', 'n_samples', 'multiband'], dropna=False, sort=False).done.agg(
+            tasks='count', done='sum')
+
+
+    def results(self, obj_class, n_samples=None, multiband=False):
+        """
+        Returns the estimations of a class, number of samples and band
+        mode computed so far, with the same columns as the output of
+        'multi_method_estimation'
+
+        Parameters
+        ---------
+        obj_class: string
+            Class of the sweep
+
+        n_samples: positive integer
+            Number of samples of the sweep
+
+        multiband: boolean
+            Band mode of the sweep
+        """
+        rows = {}
+        oids = []
+        for task_id, task in self.config['tasks'].items():
+            if (task['class'], task['n_samples'], task['multiband']) != (obj_class, n_samples, multiband):
+                continue
+            oids += task['oids']
+            for record in _read_lines(self._file('results', task_id, '.jsonl')):
+                rows[(record['oid'], record['method'])] = record['values']
+        columns = []
+        values = []
+        for method in self.methods:
+            method_values = [rows.get((oid, method)) for oid in oids]
+            n_columns = len(method_columns(method, multiband))
+            values.append(np.array([value if value is not None else [np.nan] * n_columns
+                                    for value in method_values], dtype=float).reshape(len(oids), -1))
+            columns += method_columns(method, multiband)
+        results = pd.DataFrame(np.hstack(values), columns=columns,
+                               index=pd.Index(oids, name='oid'))
+        samples = [column for column in columns if '_samples_' in column]
+        return results.astype({column: 'Int64' for column in samples})
+
+
+def _work(path, stale_after=600):
+    """
+    Claims and runs the pending tasks of a sweep until none is left.
+    Returns the number of tasks completed
+    """
+    current = sweep(path)
+    completed = 0
+    for task_id in current.config['tasks']:
+        if current.is_done(task_id) or not current.claim(task_id, stale_after):
+            continue
+        try:
+            if not current.is_done(task_id) and current.run_task(task_id):
+                completed += 1
+        finally:
+            current.release(task_id)
+    return completed
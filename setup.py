@@ -7,4 +7,7 @@ setup(
     description='An study of the performance of multiple period estimation methods',
     author='Andres Gonzalez',
     license='MIT',
+    entry_points={
+        'console_scripts': ['ppem=PPEM.cli:main'],
+    },
 )
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from PPEM.aliases import (RELATIONS, SIDEREAL_DAY, alias_relations, rank_candidates,
+                          best_candidates, sample_collection)
+from PPEM.light_curves import light_curve_collection
+from PPEM.period_estimation import prepare_bands
+
+PERIOD = 0.61
+
+
+@pytest.fixture(scope='module')
+def objs_df():
+    """
+    Two sinusoids of period PERIOD with 80 noisy detections per band
+    """
+    rng = np.random.RandomState(0)
+    frames = []
+    for oid in ['ZTF_a', 'ZTF_b']:
+        mjd = np.sort(rng.uniform(58000, 58150, 160))
+        mag = 17 + 0.5 * np.sin(2 * np.pi * mjd / PERIOD) + rng.normal(0, 0.05, 160)
+        frames.append(pd.DataFrame({'oid': oid, 'mjd': mjd, 'fid': rng.permutation([1, 2] * 80),
+                                    'magpsf_corr': mag, 'sigmapsf_corr_ext': 0.05}))
+    return pd.concat(frames).set_index('oid')
+
+
+@pytest.fixture
+def periods_df():
+    # the first peak is a spurious period but on the r band of ZTF_a, the last one the window
+    return pd.DataFrame({'oid': ['ZTF_a', 'ZTF_b'], 'period': PERIOD,
+                         'MHAOV_T_g': [0.37, 2.9], 'MHAOV_T2_g': [PERIOD, PERIOD],
+                         'MHAOV_T3_g': SIDEREAL_DAY, 'MHAOV_T_r': [PERIOD, 2.9],
+                         'MHAOV_T2_r': [2 * PERIOD, PERIOD], 'MHAOV_T3_r': SIDEREAL_DAY}
+                        ).set_index('oid')
+
+
+def test_alias_relations():
+    best = 3.0
+    candidates = np.array([best, 2 * best, 1 / (1 / best + 1 / SIDEREAL_DAY), SIDEREAL_DAY, 1.7])
+    codes, factors = alias_relations(candidates, 1000.0)
+    assert [RELATIONS[code] for code in codes] == ['top', 'harmonic', 'sidereal', 'window',
+                                                   'independent']
+    np.testing.assert_allclose(factors[:4], [1, 2, 1, 1])
+    assert np.isnan(factors[4])
+
+
+def test_alias_relations_tolerance_scales_with_time_span():
+    candidates = np.array([3.0, 6.05])
+    assert RELATIONS[alias_relations(candidates, 100.0)[0][1]] == 'harmonic'
+    assert RELATIONS[alias_relations(candidates, 10000.0)[0][1]] == 'independent'
+
+
+def test_rank_candidates(objs_df, periods_df):
+    ranked = rank_candidates(objs_df, periods_df, ['MHAOV'])
+    assert len(ranked) == 12
+    best = ranked[ranked['rank'] == 1].set_index(['oid', 'band'])
+    np.testing.assert_allclose(best.period, PERIOD)
+    assert list(best.score.astype(str)) == ["Ok"] * 4
+    window = ranked[ranked.period == SIDEREAL_DAY]
+    assert (window.relation == 'window').all() and not window.valid.any()
+    assert (window['rank'] == 3).all()
+    double = ranked[ranked.period == 2 * PERIOD].iloc[0]
+    assert double.relation == 'harmonic' and double.factor == 2
+    assert double.score == "Multiply"
+
+
+def test_best_candidates(objs_df, periods_df):
+    ranked = rank_candidates(objs_df, periods_df, ['MHAOV'])
+    best = best_candidates(periods_df, ranked)
+    np.testing.assert_allclose(best[['MHAOV_T_g', 'MHAOV_T_r']], PERIOD)
+    pd.testing.assert_frame_equal(best.drop(columns=['MHAOV_T_g', 'MHAOV_T_r']),
+                                  periods_df.drop(columns=['MHAOV_T_g', 'MHAOV_T_r']))
+    assert periods_df.loc['ZTF_a', 'MHAOV_T_g'] == 0.37
+
+
+def test_sample_collection_matches_prepare_bands(objs_df):
+    collection = light_curve_collection.from_dataframe(objs_df)
+    sampled = sample_collection(collection, 20)
+    assert sample_collection(collection, None) is collection
+    for oid in collection.oids:
+        obj = objs_df.loc[oid]
+        for band_fid, (mjd, mag, err) in zip(collection.fids, prepare_bands(obj, 20)):
+            sampled_mjd, sampled_mag, _ = sampled.band(oid, band_fid)
+            np.testing.assert_array_equal(sampled_mjd, mjd)
+            np.testing.assert_allclose(sampled_mag, mag, rtol=1e-6)
+
+
+def test_rank_candidates_folds_estimated_samples(objs_df, periods_df):
+    ranked = rank_candidates(objs_df, periods_df, ['MHAOV'], n_samples=20)
+    sampled = sample_collection(light_curve_collection.from_dataframe(objs_df), 20)
+    expected = rank_candidates(sampled.to_dataframe(), periods_df, ['MHAOV'])
+    np.testing.assert_allclose(ranked.theta, expected.theta)
+    full = rank_candidates(objs_df, periods_df, ['MHAOV'])
+    assert not np.allclose(ranked.theta, full.theta)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from PPEM.batch_periodogram import batch_periodogram, pad_light_curves
+
+P4J = pytest.importorskip('P4J')
+
+FREQS = np.arange(0.05, 5.0, 1e-3)
+
+# minimum correlation with the P4J periodogram when the phases of P4J are exact
+CORRELATION = {'MHAOV': 0.9999, 'PDM1': 0.999, 'LKSL': 0.99}
+
+
+def light_curve(t0, period=0.7, n=120, seed=1):
+    rng = np.random.RandomState(seed)
+    mjd = t0 + np.sort(rng.uniform(0, 300, n))
+    mag = 17 + 0.3 * np.sin(2 * np.pi * mjd / period) + rng.normal(0, 0.05, n)
+    err = rng.uniform(0.03, 0.08, n)
+    return mjd, mag, err
+
+
+def periodograms(method, mjd, mag, err):
+    my_per = P4J.periodogram(method=method)
+    my_per.set_data(mjd, mag, err)
+    reference = my_per._compute_periodogram(FREQS.astype(np.float32))[0].astype(np.float64)
+    per = batch_periodogram(method, *pad_light_curves([(mjd, mag, err)]), FREQS)[0]
+    return reference, per
+
+
+@pytest.mark.parametrize('method', list(CORRELATION))
+def test_parity_with_exact_phases(method):
+    # times close to 0 are exact enough in float32 for P4J to fold them like numpy
+    reference, per = periodograms(method, *light_curve(t0=0.0))
+    assert np.corrcoef(reference, per)[0, 1] > CORRELATION[method]
+    assert np.argmax(per) == np.argmax(reference)
+
+
+@pytest.mark.parametrize('method', list(CORRELATION))
+def test_parity_at_ztf_times(method):
+    mjd, mag, err = light_curve(t0=58000.0)
+    reference, per = periodograms(method, mjd, mag, err)
+    if method == 'MHAOV':
+        assert np.corrcoef(reference, per)[0, 1] > 0.999
+    assert np.abs(FREQS[np.argmax(per)] - FREQS[np.argmax(reference)]) <= 1 / np.ptp(mjd)
@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import pytest
+from PPEM import benchmark
+from PPEM.benchmark import benchmark_search_modes, load_class_sample
+from PPEM.frequency_grid import ADAPTIVE_GRID, DEFAULT_GRID
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'csv_data')
+
+
+@pytest.fixture
+def estimated(monkeypatch):
+    """
+    Replaces the estimation by the catalog period with the exhaustive
+    search and twice it with the adaptive one. It fails on the band
+    without the first detection of each object
+    """
+    objs_df, tags = load_class_sample('RRL', DATA)
+    catalog = {obj.mjd.min(): tags.period[oid] for oid, obj in objs_df.groupby(level=0)}
+
+    def fake_get_period(method, mjd, mag, err, grid=None, return_trials=False):
+        if mjd.min() not in catalog:
+            raise ValueError("too few local maxima")
+        period = catalog[mjd.min()] * (1 if grid.search == 'exhaustive' else 2)
+        return period, 0.1, grid.n_trials
+    monkeypatch.setattr(benchmark, 'get_period', fake_get_period)
+    return objs_df
+
+
+def test_benchmark_search_modes(estimated):
+    summary = benchmark_search_modes(['MHAOV'], classes=['RRL'], n_objs=3, data_path=DATA)
+    assert list(summary.index) == [('RRL', 'MHAOV', 'adaptive'), ('RRL', 'MHAOV', 'exhaustive')]
+    exhaustive = summary.loc[('RRL', 'MHAOV', 'exhaustive')]
+    adaptive = summary.loc[('RRL', 'MHAOV', 'adaptive')]
+    assert exhaustive.hit_rate == 0.5 and exhaustive.agreement == 0.5
+    assert adaptive.hit_rate == 0 and adaptive.agreement == 0
+    assert exhaustive.trials == DEFAULT_GRID.n_trials
+
+
+def test_adaptive_grid_coarsens_ztf_light_curves():
+    mjd = 58000 + np.linspace(0, 1000, 200)
+    assert ADAPTIVE_GRID.coarse_resolution(mjd) > DEFAULT_GRID.fresolution
+    assert ADAPTIVE_GRID.top_k <= DEFAULT_GRID.n_local_optima
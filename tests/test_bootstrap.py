@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from PPEM.bootstrap import hitrate_intervals
+from PPEM.scoring import _score_dtype
+
+
+def make_draws(scores, n_seeds=4):
+    n_objs = len(scores) // n_seeds
+    return pd.DataFrame({'class': 'RRL', 'n_samples': 20,
+                         'seed': np.repeat(np.arange(n_seeds), n_objs),
+                         'oid': [f'ZTF_{idx}' for idx in range(n_objs)] * n_seeds,
+                         'method': 'MHAOV', 'band': 'g',
+                         'score': pd.Categorical(scores, dtype=_score_dtype([]))})
+
+
+def test_hitrate_intervals():
+    draws = make_draws(["Ok", "Differs"] * 4)
+    intervals = hitrate_intervals(draws)
+    row = intervals.loc[('RRL', 'MHAOV', 'g', 20)]
+    assert row.Ok == 0.5
+    assert row.Ok_std == 0.0
+    assert row.n_draws == 4
+
+
+def test_hitrate_intervals_without_hits():
+    draws = make_draws(["Differs", "Half", "Null", "Differs"] * 2)
+    intervals = hitrate_intervals(draws)
+    assert list(intervals.Ok) == [0.0]
+    assert list(intervals.Ok_low) == [0.0]
+    assert list(intervals.Ok_high) == [0.0]
+
+
+def test_hitrate_intervals_unknown_score():
+    draws = make_draws(["Differs"] * 8)
+    assert list(hitrate_intervals(draws, score="Alias").Alias) == [0.0]
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from PPEM.cache import period_cache
+
+MJD = np.array([58000.123456789, 58001.5, 58003.25])
+MAG = np.array([17.8261, 17.9, 18.05])
+ERR = np.array([0.039679, 0.04, 0.05])
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return period_cache(str(tmp_path / 'cache'))
+
+
+def test_key_depends_on_input_dtype():
+    key = period_cache.key('MHAOV', [MJD, MAG, ERR, None], grid={'fmax': 10})
+    assert key == period_cache.key('MHAOV', [MJD.copy(), list(MAG), ERR, None], grid={'fmax': 10})
+    collection_key = period_cache.key('MHAOV', [MJD, MAG.astype(np.float32),
+                                                ERR.astype(np.float32), None], grid={'fmax': 10})
+    assert key != collection_key
+    # differences below float32 precision still change the key
+    assert key != period_cache.key('MHAOV', [MJD, MAG + 1e-9, ERR, None], grid={'fmax': 10})
+    assert key != period_cache.key('MHAOV', [MJD + 1e-6, MAG, ERR, None], grid={'fmax': 10})
+    assert key != period_cache.key('MHAOV', [MJD, MAG, ERR, None], grid={'fmax': 20})
+
+
+def test_set_overwrite_keeps_size(cache):
+    key = period_cache.key('MHAOV', [MJD, MAG, ERR, None])
+    cache.set(key, {'period': 0.5, 'time': 0.1})
+    cache.set(key, {'period': 0.5, 'time': 0.1, 'candidates': [0.5, 0.25, 1.0]})
+    assert cache._size == cache.stats()['size']
+    assert cache.stats()['entries'] == 1
+
+
+def test_get_missing_fields_is_a_miss(cache):
+    key = period_cache.key('MHAOV', [MJD, MAG, ERR, None])
+    cache.set(key, {'period': 0.5, 'time': 0.1})
+    assert cache.get(key, ['candidates']) is None
+    assert cache.get(key, ['period'])['period'] == 0.5
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.get('0' * 64) is None
+    assert cache.misses == 2
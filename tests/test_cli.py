@@ -0,0 +1,63 @@
+import os
+import json
+import pandas as pd
+import pytest
+from PPEM.cli import load_config, run, merge, shard_oids, main
+from PPEM.storage import load_periods, load_scores
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'csv_data')
+
+OBJS_FILE = os.path.join(DATA, 'objs_samples', 'RRL_objs.csv')
+
+TAGS_FILE = os.path.join(DATA, 'period_estimations', 'single_band', 'RRL', 'RRL_periods_40.csv')
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    config = {'output': str(tmp_path / 'out'),
+              'classes': {'RRL': {'objects': OBJS_FILE, 'tags': TAGS_FILE}},
+              'methods': ['MHAOV'], 'n_objs': 8, 'n_samples': [20], 'backend': 'numpy',
+              'grid': {'fmin': 0.5, 'fmax': 3.0, 'fresolution': 1e-2,
+                       'log_period_spacing': False}}
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_shards_partition_oids():
+    oids = list(pd.read_csv(TAGS_FILE, usecols=['oid']).oid)
+    shards = [shard_oids(oids, shard, 3) for shard in range(3)]
+    assert sorted(oid for shard in shards for oid in shard) == sorted(oids)
+    assert all(shards)
+    # the shard of an oid doesn't depend on the order of the oids
+    assert set(shard_oids(oids[::-1], 1, 3)) == set(shards[1])
+
+
+def test_run_and_merge_two_shards(config_file):
+    config = load_config(config_file)
+    written = run(config, (0, 2)) + run(config, (1, 2))
+    assert len(written) == 4
+    shards = [load_periods(os.path.join(config['output'], f'shard-00{shard}-of-002', 'periods',
+                                        'RRL_20_sb.parquet')) for shard in range(2)]
+    tags = pd.read_csv(TAGS_FILE, usecols=['oid']).oid
+    for shard, periods_df in enumerate(shards):
+        assert len(periods_df) == 4
+        assert set(periods_df.index) <= set(shard_oids(tags, shard, 2))
+    # the results already written are skipped
+    assert run(config, (0, 2)) == []
+
+    merged = merge(config['output'])
+    into = os.path.join(config['output'], 'merged')
+    assert os.path.join(into, 'cube.csv') in merged
+    periods_df = load_periods(os.path.join(into, 'periods', 'RRL_20_sb.parquet'))
+    assert sorted(periods_df.index) == sorted(shards[0].index.append(shards[1].index))
+    scores = load_scores(os.path.join(into, 'scores.parquet'))
+    assert set(scores.oid) == set(periods_df.index)
+    assert set(scores.band) == {'g', 'r'}
+
+
+def test_merge_rejects_missing_shards(config_file, tmp_path):
+    assert main(['run', config_file, '--shard', '1/2']) == 0
+    with pytest.raises(ValueError):
+        merge(str(tmp_path / 'out'))
+    assert merge(str(tmp_path / 'out'), allow_partial=True)
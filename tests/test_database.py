@@ -0,0 +1,143 @@
+import pytest
+from PPEM import database
+from PPEM.database import pooled_postgreSQL_database, DETECTION_COLUMNS
+
+# oid, candid, mjd, fid, magpsf, sigmapsf, magpsf_corr, sigmapsf_corr_ext
+ROWS = [
+    ('ZTF_a', 1, 58000.1, 1, 17.0, 0.05, 17.0, 0.05),
+    ('ZTF_a', 2, 58001.1, 2, 17.1, 0.05, 17.1, 0.05),
+    ('ZTF_a', 3, 58002.1, 1, 17.2, 0.05, 17.2, 2.50),
+    ('ZTF_b', 4, 58000.2, 1, 18.0, 0.05, 18.0, 0.05),
+    ('ZTF_b', 5, 58001.2, 1, 18.1, 0.05, 18.1, 0.05),
+    ('ZTF_c', 6, 58000.3, 2, 16.0, 0.05, 16.0, 0.05),
+    ('ZTF_c', 7, 58001.3, 1, 16.1, 0.05, 16.1, 0.05),
+]
+
+
+class fake_cursor:
+    """
+    Server side cursor evaluating the queries of '_fetch_batch' over ROWS
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.itersize = None
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        self.connection.queries.append((sql, params))
+        if self.connection.fail:
+            raise RuntimeError("connection lost")
+        params = list(params)
+        batch = params.pop(0)
+        max_sigma = params.pop(0) if 'sigmapsf_corr_ext < %s' in sql else None
+        rows = [row for row in ROWS if row[0] in batch
+                and (max_sigma is None or 0 < row[7] < max_sigma)]
+        if 'having' in sql:
+            n_min = params[-1]
+            rows = [row for row in rows
+                    if sum(1 for other in rows if other[0] == row[0] and other[3] == 1) >= n_min
+                    and sum(1 for other in rows if other[0] == row[0] and other[3] == 2) >= n_min]
+        self.rows = sorted(rows, key=lambda row: row[0])
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class fake_connection:
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.queries = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, name=None):
+        return fake_cursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class fake_pool:
+
+    def __init__(self, minconn, maxconn, **credentials):
+        self.connection = fake_connection()
+        self.checked_out = 0
+
+    def getconn(self):
+        self.checked_out += 1
+        return self.connection
+
+    def putconn(self, connection):
+        self.checked_out -= 1
+
+    def closeall(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(database.pool, 'ThreadedConnectionPool', fake_pool)
+    with pooled_postgreSQL_database({}, batch_size=2) as db:
+        yield db
+
+
+def test_query_many_batches_oids(db):
+    oids = ['ZTF_c', 'ZTF_a', 'ZTF_b']
+    list(db.query_many(oids))
+    queries = db.pool.connection.queries
+    assert [params[0] for _, params in queries] == [['ZTF_c', 'ZTF_a'], ['ZTF_b']]
+    assert all('oid = ANY(%s)' in sql for sql, _ in queries)
+
+
+def test_query_many_groups_rows_by_oid(db):
+    objs = dict(db.query_many(['ZTF_c', 'ZTF_a', 'ZTF_missing', 'ZTF_b']))
+    assert list(objs) == ['ZTF_c', 'ZTF_a', 'ZTF_missing', 'ZTF_b']
+    assert list(objs['ZTF_a'].columns) == DETECTION_COLUMNS[1:]
+    assert (objs['ZTF_a'].index == 'ZTF_a').all()
+    assert list(objs['ZTF_a'].candoid) == [1, 2, 3]
+    assert list(objs['ZTF_b'].candoid) == [4, 5]
+    assert objs['ZTF_missing'].empty
+
+
+def test_query_many_pushes_down_max_sigma(db):
+    objs = dict(db.query_many(['ZTF_a'], max_sigma=1.0))
+    sql, params = db.pool.connection.queries[-1]
+    assert 'sigmapsf_corr_ext > 0 and sigmapsf_corr_ext < %s' in sql
+    assert params == (['ZTF_a'], 1.0)
+    assert list(objs['ZTF_a'].candoid) == [1, 2]
+
+
+def test_query_many_pushes_down_n_min(db):
+    objs = dict(db.query_many(['ZTF_a', 'ZTF_b', 'ZTF_c'], batch_size=3, max_sigma=1.0,
+                              n_min=1))
+    sql, params = db.pool.connection.queries[-1]
+    assert 'having count(*) filter (where fid = 1) >= %s' in sql
+    assert params == (['ZTF_a', 'ZTF_b', 'ZTF_c'], 1.0, ['ZTF_a', 'ZTF_b', 'ZTF_c'], 1.0, 1, 1)
+    assert list(objs['ZTF_a'].candoid) == [1, 2]
+    assert objs['ZTF_b'].empty
+    assert list(objs['ZTF_c'].candoid) == [6, 7]
+
+
+def test_query_many_returns_connection_on_error(db):
+    db.pool.connection.fail = True
+    with pytest.raises(RuntimeError):
+        list(db.query_many(['ZTF_a']))
+    assert db.pool.checked_out == 0
+    assert db.pool.connection.rollbacks == 1
+
+
+def test_query_many_returns_connections(db):
+    list(db.query_many(['ZTF_a', 'ZTF_b', 'ZTF_c']))
+    assert db.pool.checked_out == 0
+    assert db.pool.connection.commits == 2
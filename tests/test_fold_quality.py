@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from PPEM.fold_quality import (auto_fold_scores, classify_periods, fold_statistics, score_names,
+                               HALF_SCORE_NAMES)
+from PPEM.light_curves import light_curve_collection
+
+PERIOD = 0.61
+
+NAMES = score_names() + ["Null"]
+
+
+def detections(oid, rng, amplitude=0.5, n=160):
+    mjd = np.sort(rng.uniform(58000, 58150, n))
+    mag = 17 + amplitude * np.sin(2 * np.pi * mjd / PERIOD) + rng.normal(0, 0.05, n)
+    return pd.DataFrame({'oid': oid, 'mjd': mjd, 'fid': rng.permutation([1, 2] * (n // 2)),
+                         'magpsf_corr': mag, 'sigmapsf_corr_ext': 0.05})
+
+
+@pytest.fixture(scope='module')
+def objs_df():
+    """
+    Two sinusoids of period PERIOD and an object without signal
+    """
+    rng = np.random.RandomState(0)
+    return pd.concat([detections('ZTF_a', rng), detections('ZTF_b', rng),
+                      detections('ZTF_c', rng, amplitude=0.0)]).set_index('oid')
+
+
+@pytest.fixture
+def periods_df():
+    # ZTF_b has half the true period in the catalog
+    return pd.DataFrame({'oid': ['ZTF_a', 'ZTF_b', 'ZTF_c'],
+                         'period': [PERIOD, PERIOD / 2, PERIOD],
+                         'MHAOV_T_g': [PERIOD, PERIOD, np.nan],
+                         'MHAOV_T_r': [2 * PERIOD, PERIOD / 4, 0.37]}).set_index('oid')
+
+
+def test_fold_statistics(objs_df):
+    collection = light_curve_collection.from_dataframe(objs_df)
+    candidates = np.tile([PERIOD, 0.37, np.nan], (3, 2, 1))
+    statistics = fold_statistics(collection, candidates)
+    theta, string_length = statistics['theta'], statistics['string_length']
+    assert theta.shape == string_length.shape == (3, 2, 3)
+    assert (theta[:2, :, 0] < 0.1).all() and (string_length[:2, :, 0] < 0.2).all()
+    assert (theta[:2, :, 1] > 0.5).all()
+    assert (theta[2, :, :2] > 0.7).all()
+    assert np.isnan(theta[..., 2]).all() and np.isnan(string_length[..., 2]).all()
+
+
+def test_classify_periods():
+    periods = np.array([1.0, 2.0, 0.5, 1 / 3, 0.37, np.nan])
+    codes = classify_periods(periods, 1.0, 100.0)
+    assert [NAMES[code] for code in codes] == ["Ok", "Multiply", "Multiply", "Multiply",
+                                               "Differs", "Null"]
+    names = score_names(half=True) + ["Null"]
+    codes = classify_periods(periods, 1.0, 100.0, half=True)
+    assert [names[code] for code in codes] == ["Ok", "Multiply", "Half", "Multiply", "Differs",
+                                               "Null"]
+
+
+def test_classify_periods_tolerance_and_min_points():
+    # the drift along the time span sets the tolerance
+    assert classify_periods(1.001, 1.0, 100.0) == score_names().index("Ok")
+    assert classify_periods(1.001, 1.0, 10000.0) == score_names().index("Differs")
+    codes = classify_periods(np.ones(3), 1.0, 100.0, n_points=np.array([4, 5, 50]))
+    assert [NAMES[code] for code in codes] == ["Null", "Ok", "Ok"]
+
+
+def test_auto_fold_scores(objs_df, periods_df):
+    scores = auto_fold_scores(objs_df, periods_df, ['MHAOV'])
+    assert list(scores.columns) == ['catalog', 'MHAOV_g', 'MHAOV_r']
+    assert list(scores.catalog) == [1, 2, 0]
+    assert [NAMES[code] for code in scores.MHAOV_g] == ["Ok", "Multiply", "Null"]
+    assert [NAMES[code] for code in scores.MHAOV_r] == ["Multiply", "Multiply", "Differs"]
+
+
+def test_auto_fold_scores_half(objs_df, periods_df):
+    scores = auto_fold_scores(objs_df, periods_df, ['MHAOV'], half=True)
+    names = HALF_SCORE_NAMES + ["Null"]
+    assert [names[code] for code in scores.MHAOV_g] == ["Ok", "Multiply", "Null"]
+    assert [names[code] for code in scores.MHAOV_r] == ["Multiply", "Half", "Differs"]
+
+
+def test_auto_fold_scores_statistics(objs_df, periods_df):
+    scores, details = auto_fold_scores(objs_df.loc[['ZTF_c', 'ZTF_a']], periods_df, ['MHAOV'],
+                                       return_statistics=True)
+    assert list(scores.index) == ['ZTF_a', 'ZTF_c']
+    assert len(details) == 2 * 2 * 4
+    assert list(details.loc[('ZTF_a', 'g')].index) == ['catalog', 'MHAOV', 'catalog_x2',
+                                                      'catalog_x0.5']
+    assert details.loc[('ZTF_a', 'r', 'MHAOV'), 'ratio'] == 2
+    missing = details.loc[('ZTF_c', 'g', 'MHAOV')]
+    assert np.isnan(missing.period) and np.isnan(missing.theta) and np.isnan(missing.drift)
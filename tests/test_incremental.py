@@ -0,0 +1,51 @@
+import os
+import numpy as np
+import pandas as pd
+from PPEM.frequency_grid import frequency_grid
+from PPEM.incremental import (incremental_store, incremental_periodogram,
+                              incremental_periodogram_values)
+
+GRID = frequency_grid(fmin=0.5, fmax=3.0, fresolution=1e-2, log_period_spacing=False,
+                      finetune_resolution=1e-3, n_local_optima=3)
+
+
+def light_curve(n=60, period=0.6, seed=0):
+    rng = np.random.default_rng(seed)
+    mjd = np.sort(58000 + rng.uniform(0, 60, n))
+    mag = 17 + 0.3 * np.sin(2 * np.pi * mjd / period) + rng.normal(0, 0.02, n)
+    return pd.DataFrame({'oid': 'ZTF_a', 'mjd': mjd, 'fid': np.tile([1, 2], n // 2),
+                         'magpsf_corr': mag, 'sigmapsf_corr_ext': 0.02}).set_index('oid')
+
+
+def test_update_reports_late_detections(tmp_path, capsys):
+    obj = light_curve()
+    store = incremental_store(str(tmp_path), ['MHAOV'], GRID)
+    first = store.update(obj.iloc[np.r_[0:40, 50:60]])
+    assert first.attrs['rejected'] == {}
+    second = store.update(obj)
+    assert second.attrs['rejected'] == {'ZTF_a': 10}
+    assert "10 detections of 1 objects" in capsys.readouterr().out
+    assert list(second.iloc[0, :2]) == [25, 25]
+    # the late detections were never stored, so they are rejected again
+    assert store.update(obj).attrs['rejected'] == {'ZTF_a': 10}
+
+
+def test_saved_states_are_compressed(tmp_path):
+    store = incremental_store(str(tmp_path), ['MHAOV'], GRID)
+    store.update(light_curve())
+    file = os.path.join(str(tmp_path), 'ZTF_a', 'MHAOV_g.npz')
+    with np.load(file) as data:
+        assert all(info.compress_type for info in data.zip.infolist())
+    assert len(store.state('ZTF_a', 'MHAOV', 1)) == 30
+
+
+def test_pdm_sums_match_one_update():
+    obj = light_curve(n=200)
+    mjd, mag, err = obj.mjd.values, obj.magpsf_corr.values, obj.sigmapsf_corr_ext.values
+    whole = incremental_periodogram('PDM1', GRID).update(mjd, mag, err)
+    state = incremental_periodogram('PDM1', GRID)
+    for start in range(0, len(mjd), 10):
+        state.update(mjd[start:start + 10], mag[start:start + 10], err[start:start + 10])
+    assert state.sums.dtype == np.float64
+    np.testing.assert_allclose(incremental_periodogram_values([state]),
+                               incremental_periodogram_values([whole]), rtol=1e-9)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+from PPEM import period_estimation
+from PPEM.period_estimation import get_period, object_multi_estimation
+from PPEM.batch_periodogram import batch_get_period
+from PPEM.frequency_grid import ADAPTIVE_GRID, DEFAULT_GRID
+
+OBJ = pd.DataFrame({'oid': 'ZTF_a', 'mjd': [58000.1, 58001.2, 58002.3, 58000.4],
+                    'fid': [1, 1, 1, 2], 'magpsf_corr': 17.0,
+                    'sigmapsf_corr_ext': 0.05}).set_index('oid')
+
+
+def failing_get_period(error):
+    def get_period(method, mjd, mag, err, **kwargs):
+        if (mjd < 58000.3).any():
+            raise error
+        return 0.5, 0.1
+    return get_period
+
+
+def test_estimation_failure_gives_nan(monkeypatch):
+    monkeypatch.setattr(period_estimation, 'get_period',
+                        failing_get_period(ValueError("too few local maxima")))
+    row = object_multi_estimation(OBJ, ['MHAOV'])
+    # samples, times and periods of the g and r bands
+    assert row[:2] == [3, 1]
+    assert np.isnan(row[2]) and row[3] == 0.1
+    assert np.isnan(row[4]) and row[5] == 0.5
+
+
+def test_unexpected_errors_propagate(monkeypatch):
+    monkeypatch.setattr(period_estimation, 'get_period',
+                        failing_get_period(TypeError("bad argument")))
+    with pytest.raises(TypeError):
+        object_multi_estimation(OBJ, ['MHAOV'])
+
+
+def test_get_period_without_detections():
+    with pytest.raises(ValueError):
+        get_period('MHAOV', np.array([58000.0]), np.array([np.nan]), np.array([0.1]))
+
+
+def test_numpy_backend_rejects_adaptive_search():
+    curves = [(np.arange(20.0) + 58000, np.sin(np.arange(20.0)), np.full(20, 0.1))]
+    with pytest.raises(ValueError):
+        batch_get_period('MHAOV', curves, ADAPTIVE_GRID)
+    exhaustive = ADAPTIVE_GRID.exhaustive()
+    assert exhaustive.search == 'exhaustive'
+    assert exhaustive.settings() == DEFAULT_GRID.settings()
@@ -0,0 +1,26 @@
+import pandas as pd
+from PPEM.database import dataframe_database, DETECTION_COLUMNS
+from PPEM.periodic_stars import periodic_stars
+
+OBJS = pd.DataFrame({'oid': ['ZTF_a', 'ZTF_a', 'ZTF_b'], 'candoid': [1, 2, 3],
+                     'mjd': [58000.1, 58001.1, 58000.2], 'fid': [1, 2, 1],
+                     'magpsf': 17.0, 'sigmapsf': 0.05, 'magpsf_corr': 17.0,
+                     'sigmapsf_corr_ext': 0.05}).set_index('oid')
+TAGS = pd.DataFrame({'oid': ['ZTF_a', 'ZTF_b'], 'period': [0.5, 0.6],
+                     'source': 'test'}).set_index('oid')
+
+
+def test_get_objects():
+    stars = periodic_stars(dataframe_database(OBJS), 'RRL', n_objs=1, n_min=1)
+    stars.get_objects(TAGS)
+    assert list(stars.objs_df.index.unique()) == ['ZTF_a']
+    assert list(stars.tags.index) == ['ZTF_a']
+
+
+def test_get_objects_without_matches():
+    stars = periodic_stars(dataframe_database(OBJS), 'RRL', n_objs=2, n_min=5)
+    stars.get_objects(TAGS)
+    assert stars.objs_df.empty
+    assert list(stars.objs_df.columns) == DETECTION_COLUMNS[1:]
+    assert stars.objs_df.index.name == 'oid'
+    assert stars.tags.empty
@@ -0,0 +1,76 @@
+import os
+import time
+import threading
+from types import SimpleNamespace
+import pandas as pd
+import pytest
+from PPEM import pipeline
+from PPEM.database import dataframe_database
+from PPEM.pipeline import prefetch_estimation
+
+OBJS_FILE = os.path.join(os.path.dirname(__file__), '..', 'csv_data', 'objs_samples',
+                         'RRL_objs.csv')
+
+
+@pytest.fixture(scope='module')
+def objs_df():
+    return pd.read_csv(OBJS_FILE, index_col='oid')
+
+
+@pytest.fixture
+def estimated(monkeypatch):
+    """
+    Replaces the estimation of the compute executor by a fixed delay,
+    recording the estimated oids and the times they started
+    """
+    state = SimpleNamespace(delay=0.0, calls=[])
+    lock = threading.Lock()
+
+    def fake_estimate(obj, methods, n_samples, multiband, cache, grid, fids, oid,
+                      collect=False):
+        with lock:
+            state.calls.append((oid, time.perf_counter()))
+        time.sleep(state.delay)
+        return [len(obj), 0, 0.1, 0.1, 0.5, 0.5] * len(methods), []
+
+    monkeypatch.setattr(pipeline, '_estimate', fake_estimate)
+    return state
+
+
+def test_max_objects_stops_enqueueing(objs_df, estimated):
+    oids = list(dict.fromkeys(objs_df.index))[:30]
+    database = dataframe_database(objs_df)
+    result = prefetch_estimation(database, oids, ['MHAOV'], max_objects=5, batch_size=10)
+    assert list(result.index) == oids[:5]
+    assert len(estimated.calls) == 5
+
+
+def test_max_objects_keeps_first_objects_with_many_fetchers(objs_df, estimated):
+    oids = list(dict.fromkeys(objs_df.index))[:30]
+    database = dataframe_database(objs_df, latency=0.01)
+    result = prefetch_estimation(database, oids, ['MHAOV'], max_objects=7, batch_size=3,
+                                 n_fetchers=3)
+    assert list(result.index) == oids[:7]
+    assert sorted(oid for oid, _ in estimated.calls) == sorted(oids[:7])
+
+
+def test_fetch_overlaps_compute(objs_df, estimated):
+    oids = list(dict.fromkeys(objs_df.index))[:8]
+    database = dataframe_database(objs_df, latency=0.05)
+    estimated.delay = 0.05
+    result = prefetch_estimation(database, oids, ['MHAOV'], batch_size=1, n_fetchers=1)
+    stats = result.attrs['pipeline']
+    assert len(result) == len(oids)
+    assert stats['fetch_time'] >= 0.05 * len(oids)
+    assert stats['compute_time'] >= 0.05 * len(oids)
+    assert stats['wall_time'] < 0.8 * (stats['fetch_time'] + stats['compute_time'])
+
+
+def test_queue_is_bounded(objs_df, estimated):
+    oids = list(dict.fromkeys(objs_df.index))[:20]
+    database = dataframe_database(objs_df)
+    estimated.delay = 0.01
+    result = prefetch_estimation(database, oids, ['MHAOV'], max_queue=3, batch_size=10)
+    stats = result.attrs['pipeline']
+    assert len(result) == len(oids)
+    assert 0 < stats['max_queue'] <= 3
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+from PPEM.scoring import scores_table, catalog_table, summarize_scores, source_summary
+from PPEM.scoring import fold_scores_summary
+
+SCORE_NAMES = ["Differs", "Ok", "Half", "Multiply"]
+
+# codes of SCORE_NAMES, NaN is a null score. No object got a Half or Multiply
+FOLD_SCORES = pd.DataFrame({'oid': ['ZTF_a', 'ZTF_b', 'ZTF_c', 'ZTF_d'],
+                            'MHAOV_g': [1, 1, 0, np.nan],
+                            'MHAOV_r': [1, 0, 0, 0],
+                            'catalog': [1, 0, 1, 2]}).set_index('oid')
+SOURCES = pd.Series(['ASAS', 'ASAS', 'GAIA', 'GAIA'], index=FOLD_SCORES.index)
+
+
+def test_scores_table():
+    table = scores_table(FOLD_SCORES, SCORE_NAMES, 'RRL', 20, SOURCES)
+    assert len(table) == 8
+    assert list(table.columns) == ['class', 'n_samples', 'oid', 'method', 'band', 'score',
+                                   'catalog', 'source']
+    assert list(table.score[:4].astype(str)) == ["Ok", "Ok", "Ok", "Differs"]
+    assert table.score.iloc[6] == "Null"
+    assert list(table.catalog[::2].astype(str)) == ["Right", "Wrong", "Right", "Multiply"]
+
+
+def test_scores_table_rejects_unknown_codes():
+    with pytest.raises(ValueError):
+        scores_table(FOLD_SCORES.assign(MHAOV_g=[0, 1, 2, 7]), SCORE_NAMES)
+
+
+def test_summarize_scores():
+    summary = summarize_scores(scores_table(FOLD_SCORES, SCORE_NAMES, 'RRL', 20))
+    g, r = summary.loc[('RRL', 20, 'MHAOV', 'g')], summary.loc[('RRL', 20, 'MHAOV', 'r')]
+    assert g.Ok == pytest.approx(2 / 3)
+    assert g.Null == 0.25
+    assert g.n == 4
+    assert r.Ok == 0.25
+    assert r.Differs == 0.75
+
+
+def test_summarize_scores_keeps_missing_categories():
+    summary = summarize_scores(scores_table(FOLD_SCORES, SCORE_NAMES), ['method', 'band'])
+    assert list(summary.columns) == SCORE_NAMES + ["Null", "n"]
+    assert (summary[["Half", "Multiply"]] == 0).all().all()
+    score_df, nulls_df = fold_scores_summary(FOLD_SCORES.drop(columns='catalog'), SCORE_NAMES)
+    assert list(score_df.index) == SCORE_NAMES
+    assert list(score_df.columns) == ['MHAOV_g', 'MHAOV_r']
+    assert list(nulls_df.loc["Non-Nulls"]) == [0.75, 1.0]
+
+
+def test_source_summary():
+    table = pd.concat([catalog_table(FOLD_SCORES, 'RRL', sources=SOURCES),
+                       catalog_table(FOLD_SCORES.assign(catalog=[1, 1, 0, 0]), 'DSCT',
+                                     sources=SOURCES)])
+    summary = source_summary(table)
+    assert summary['ASAS'] == 0.75
+    assert summary['GAIA'] == 0.25
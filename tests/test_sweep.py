@@ -0,0 +1,69 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from PPEM import sweep as sweep_module
+from PPEM.sweep import sweep, _read_lines
+
+OIDS = ['ZTF_a', 'ZTF_b', 'ZTF_c']
+
+
+def fake_estimation(obj, methods, n_samples=None, multiband=False, grid=None):
+    """
+    Deterministic stand-in of 'object_multi_estimation'
+    """
+    period = float(obj.mjd.min() - 58000)
+    return [row for _ in methods for row in [len(obj), 0, 0.1, 0.1, period, period]]
+
+
+@pytest.fixture
+def task_sweep(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep_module, 'object_multi_estimation', fake_estimation)
+    objs = pd.DataFrame({'oid': OIDS * 2, 'mjd': [58001.0, 58002.0, 58003.0, 58010.0, 58010.0,
+                                                  58010.0],
+                         'fid': [1, 1, 1, 2, 2, 2], 'magpsf_corr': 17.0,
+                         'sigmapsf_corr_ext': 0.1}).set_index('oid')
+    objs_file = tmp_path / 'objs.csv'
+    objs.to_csv(objs_file)
+    current = sweep(str(tmp_path / 'sweep'), {'RRL': str(objs_file)}, ['MHAOV', 'PDM1'],
+                    chunk_size=len(OIDS))
+    return current, next(iter(current.config['tasks']))
+
+
+def test_run_task_marks_done(task_sweep):
+    current, task_id = task_sweep
+    assert current.run_task(task_id)
+    assert current.is_done(task_id)
+    results = current.results('RRL')
+    assert list(results.index) == OIDS
+    assert list(results.MHAOV_T_g) == [1.0, 2.0, 3.0]
+
+
+def test_run_task_recovers_partial_line(task_sweep):
+    current, task_id = task_sweep
+    current.run_task(task_id)
+    results_file = current._file('results', task_id, '.jsonl')
+    with open(results_file) as f:
+        lines = f.readlines()
+    # crash while writing the last record: its line is cut without newline
+    with open(results_file, 'w') as f:
+        f.writelines(lines[:-1])
+        f.write(lines[-1][:len(lines[-1]) // 2])
+    os.remove(current._file('done', task_id))
+
+    assert current.run_task(task_id)
+    records = _read_lines(results_file)
+    assert len(records) == len(OIDS) * 2
+    assert {(record['oid'], record['method']) for record in records} == {
+        (oid, method) for oid in OIDS for method in ['MHAOV', 'PDM1']}
+    with open(results_file) as f:
+        assert all(json.loads(line) for line in f)
+    assert not np.isnan(current.results('RRL').to_numpy(dtype=float)).any()
+
+
+def test_run_task_leaves_incomplete_task_pending(task_sweep, monkeypatch):
+    current, task_id = task_sweep
+    monkeypatch.setattr(sweep_module, '_read_lines', lambda file: [])
+    assert not current.run_task(task_id)
+    assert not current.is_done(task_id)